@@ -2,6 +2,8 @@
 ASGI config for graphql_crm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served this way, /graphql/async executes GraphQL requests on the event loop
+(see crm.views.AsyncCRMGraphQLView).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
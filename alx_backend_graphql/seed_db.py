@@ -273,7 +273,10 @@ def seed_orders(customers, products):
     return orders
 
 def seed_database():
-    """Main seeding function"""
+    """
+    Main seeding function. For production-sized data sets use
+    `python manage.py seed_synthetic` instead.
+    """
     print("Starting database seeding...")
     
     try:
@@ -52,6 +52,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Times GraphQL operations and counts their SQL queries (crm/metrics.py)
+    'crm.metrics.GraphQLMetricsMiddleware',
+    # Sends GraphQL queries to read replicas (crm/db_router.py)
+    'crm.db_router.DatabaseRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,9 +91,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections (and the pragmas set on them, see
+        # SQLITE_TUNING) across requests, checking them before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Transactions take the write lock when they begin, so a
+            # writer waits its turn (busy_timeout) instead of failing to
+            # upgrade a read lock halfway through
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# GraphQL queries read from the aliases in CRM_DATABASE_ROUTING['REPLICAS'];
+# mutations, later reads of the same request and, for STICKY_SECONDS
+# after a write, the same client's reads use 'default'. A local replica
+# is another SQLite file, refreshed with `manage.py sync_replicas`:
+#   DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3',
+#                           'NAME': BASE_DIR / 'db.replica.sqlite3',
+#                           'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['crm.db_router.ReadWriteRouter']
+CRM_DATABASE_ROUTING = {
+    'REPLICAS': [],
+    'STRATEGY': 'round_robin',
+    'STICKY_SECONDS': 5,
+}
+
+# Pragmas run on every new SQLite connection (see crm/sqlite_tuning.py):
+# WAL lets reads proceed during writes; `manage.py
+# benchmark_sqlite_concurrency` compares them with the SQLite defaults.
+SQLITE_TUNING = {
+    'ENABLED': True,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,7 +169,79 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Graphene settings
 GRAPHENE = {
-    "SCHEMA": "alx_backend_graphql.schema.schema"
+    "SCHEMA": "alx_backend_graphql.schema.schema",
+    "MIDDLEWARE": ["crm.metrics.ResolverTimingMiddleware"],
+}
+
+# Per-operation parse/validate/execute, resolver and SQL timings, served
+# in Prometheus format on /metrics to staff and to scrapers sending
+# "Authorization: Bearer <SCRAPE_TOKEN>". Only resolvers slower than
+# RESOLVER_THRESHOLD_MS are recorded; EXTENSIONS also returns each
+# operation's timings in the response.
+GRAPHQL_METRICS = {
+    'ENABLED': True,
+    'RESOLVER_THRESHOLD_MS': 1.0,
+    'EXTENSIONS': False,
+    'SCRAPE_TOKEN': None,
+}
+
+# Requests to /graphql slower than THRESHOLD_MS are written, with their
+# SQL, resolver timing tree and the query plans of the slowest statements,
+# to a rotating JSON lines file; `manage.py slowlog_report` summarizes it.
+GRAPHQL_SLOW_LOG = {
+    'THRESHOLD_MS': 500,
+    'SAMPLE_RATE': 1.0,
+    # None writes BASE_DIR/graphql_slow.jsonl
+    'PATH': None,
+    'REDACT_VARIABLES': ('password', 'token', 'secret', 'email', 'phone'),
+}
+
+# Automatic persisted queries (see crm/persisted_queries.py). Registered
+# queries live in the 'default' cache, a per-process LocMemCache unless
+# CACHES says otherwise, so each worker learns them separately
+GRAPHQL_PERSISTED_QUERIES = {
+    # JSON file of pre-approved operations, parsed and validated at startup
+    'REGISTRY': None,
+    # Let clients register new query hashes at runtime
+    'ALLOW_REGISTRATION': True,
+}
+
+# Parsed and validated documents kept by the /graphql view (0 disables)
+GRAPHQL_DOCUMENT_CACHE_SIZE = 1000
+
+# Static query cost analysis (see crm/query_cost.py)
+GRAPHQL_QUERY_COST = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 50000,
+    # Cost units a single client IP may spend per minute (None = unlimited)
+    'CLIENT_BUDGET_PER_MINUTE': None,
+}
+
+# Response cache for query operations (see crm/result_cache.py). Entries
+# expire after TIMEOUT seconds or as soon as a model they read is written.
+# The 'locmem' backend is per process; use 'django' to share the cache
+# (and its invalidations) between workers.
+GRAPHQL_RESULT_CACHE = {
+    'BACKEND': 'locmem',
+    'TIMEOUT': 60,
+    'MAX_ENTRIES': 1000,
+}
+
+# Threads that blocking resolvers run on when /graphql/async is served over
+# ASGI; this also caps the database connections async requests hold
+GRAPHQL_RESOLVER_THREADS = 8
+
+# Backend for the search query and the name/email "contains" filters.
+# SQLiteFTS5Backend uses the trigram indexes from migration 0005 and falls
+# back to LIKE elsewhere; crm.search.SearchBackend always uses LIKE.
+CRM_SEARCH_BACKEND = 'crm.search.SQLiteFTS5Backend'
+
+# How cron jobs and Celery tasks run their GraphQL documents: 'local'
+# executes them in-process, 'http' posts them to URL over a pooled session
+CRM_GRAPHQL_CLIENT = {
+    'TRANSPORT': 'local',
+    'URL': 'http://localhost:8000/graphql',
+    'TIMEOUT': 30,
 }
 
 
@@ -146,6 +253,24 @@ CRONJOBS = [
     ('0 */12 * * *', 'crm.cron.update_low_stock'),
 ]
 
+# Products crm.cron.update_low_stock restocks per transaction; smaller
+# chunks hold the SQLite write lock for less time
+CRM_LOW_STOCK_CHUNK_SIZE = 1000
+
+# Largest file the /import endpoint accepts (crm/views.py); larger ones
+# go through `manage.py import_data`
+CRM_IMPORT_MAX_BYTES = 50 * 1024 * 1024
+
+# crm/cron_jobs/send_order_reminders.py (see crm/reminders.py): orders
+# from the last SINCE_DAYS days get one reminder each, PAGE_SIZE at a time
+# sent on WORKERS threads
+CRM_ORDER_REMINDERS = {
+    'SINCE_DAYS': 7,
+    'PAGE_SIZE': 100,
+    'WORKERS': 4,
+    'LOG_PATH': '/tmp/order_reminders_log.txt',
+}
+
 # CELERY SETTINGS
 # These settings configure Celery for your project.
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
@@ -156,6 +281,24 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC' # It's a good practice to use UTC for Celery
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
+# Catalog-wide maintenance jobs fanned out over Celery (see
+# crm/maintenance.py): ids per chunk and chunks of one job running at
+# once. SQLite takes one writer at a time, so more lanes only queue on
+# its lock; raise CONCURRENCY on a server database.
+CRM_MAINTENANCE = {
+    'CHUNK_SIZE': 1000,
+    'CONCURRENCY': 1,
+}
+
+# Daily sales rollups behind the salesByDay and topProducts queries (see
+# crm/sales_rollups.py): orders per transaction, how old an order must be
+# before it is rolled up, and the widest date range a query accepts
+CRM_SALES_ROLLUPS = {
+    'BATCH_SIZE': 5000,
+    'SETTLE_SECONDS': 60,
+    'MAX_DAYS': 366,
+}
+
 # CELERY BEAT SCHEDULE
 # This is where you define your periodic tasks.
 CELERY_BEAT_SCHEDULE = {
@@ -164,5 +307,10 @@ CELERY_BEAT_SCHEDULE = {
         # Runs every Monday at 6:00 AM
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'roll-up-sales': {
+        'task': 'crm.tasks.roll_up_sales',
+        # Analytics trail new orders by at most this plus SETTLE_SECONDS
+        'schedule': crontab(minute='*/5'),
+    },
 }
 
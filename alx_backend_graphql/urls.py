@@ -16,11 +16,21 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, export_view, import_view, metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    # Async execution, for when the project is served over ASGI
+    path("graphql/async", csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True))),
+    # Streaming CSV/NDJSON exports of whole, filtered tables, for staff
+    path("export/<str:name>", export_view),
+    # Batched, validated CSV/NDJSON imports, for staff; CSRF protected
+    # because they authenticate with the session cookie
+    path("import/<str:name>", import_view),
+    # Per-operation timing and SQL histograms for Prometheus, for staff
+    # and scrapers holding GRAPHQL_METRICS['SCRAPE_TOKEN']
+    path("metrics", metrics_view),
 ]
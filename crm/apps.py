@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete
+        from graphene_django.settings import graphene_settings
+        from .models import (
+            Customer, CRMReport, DailyProductSales, DailySales, Order, OrderReminder, Product, connect_report_signals,
+        )
+        from .customer_stats import order_deleted as customer_order_deleted
+        from .metrics import install_sql_wrapper
+        from .persisted_queries import get_config, store
+        from .result_cache import connect_signals
+        from .sales_rollups import order_deleted
+        from .sqlite_tuning import apply_pragmas
+
+        registry = get_config()['REGISTRY']
+        if registry:
+            store.load_registry(registry, graphene_settings.SCHEMA.graphql_schema)
+
+        connect_signals([Customer, Product, Order, OrderReminder, CRMReport, DailySales, DailyProductSales])
+        connect_report_signals()
+        post_delete.connect(order_deleted, sender=Order, dispatch_uid='sales_rollups_order_deleted')
+        post_delete.connect(customer_order_deleted, sender=Order, dispatch_uid='customer_stats_order_deleted')
+        connection_created.connect(install_sql_wrapper, dispatch_uid='graphql_metrics_sql_wrapper')
+        connection_created.connect(apply_pragmas, dispatch_uid='sqlite_tuning_pragmas')
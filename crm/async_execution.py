@@ -0,0 +1,135 @@
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import QuerySet
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
+from graphql import get_named_type, is_leaf_type
+
+# Resolvers graphene installs for fields without a resolve_<field> method
+DEFAULT_RESOLVERS = (attr_resolver, dict_resolver, dict_or_attr_resolver)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The thread pool blocking resolvers run on under ASGI. Its size,
+    settings.GRAPHQL_RESOLVER_THREADS, bounds how many database
+    connections async requests can hold at once.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'GRAPHQL_RESOLVER_THREADS', 8),
+                thread_name_prefix='graphql-resolver',
+            )
+    return _executor
+
+
+def _call_in_thread(func, args, kwargs):
+    # Worker threads outlive requests, so apply CONN_MAX_AGE here the way
+    # Django does at the start of a request
+    close_old_connections()
+    return func(*args, **kwargs)
+
+
+def run_sync(func, *args, **kwargs):
+    """Runs a blocking callable on the resolver thread pool; returns a coroutine."""
+    return sync_to_async(_call_in_thread, thread_sensitive=False, executor=get_executor())(func, args, kwargs)
+
+
+def blocking(resolver):
+    """Marks a resolver that queries the database, whatever it returns."""
+    resolver.blocking = True
+    return resolver
+
+
+def nonblocking(resolver):
+    """
+    Marks a resolver that never queries the database itself, e.g. one
+    that answers from a DataLoader, so it can run on the event loop.
+    """
+    resolver.blocking = False
+    return resolver
+
+
+def is_blocking(resolver, info):
+    func = resolver
+    while isinstance(func, partial):
+        func = func.func
+    marked = getattr(func, 'blocking', None)
+    if marked is not None:
+        return marked
+    if func in DEFAULT_RESOLVERS or inspect.iscoroutinefunction(func):
+        return False
+    # Scalars come from rows that are already loaded; anything returning
+    # objects may run (or return) a query
+    return not is_leaf_type(get_named_type(info.return_type))
+
+
+def _resolve_in_thread(resolver, root, info, args):
+    result = resolver(root, info, **args)
+    if isinstance(result, QuerySet):
+        # Evaluate here rather than when the executor iterates the list
+        result = list(result)
+    return result
+
+
+class ThreadPoolResolverMiddleware:
+    """
+    Lets the synchronous resolvers in crm/schema.py run under async
+    execution: blocking resolvers are moved onto the resolver thread pool,
+    while attribute lookups and DataLoader resolvers stay on the event loop.
+    """
+
+    def resolve(self, next, root, info, **args):
+        if is_blocking(next, info):
+            return run_sync(_resolve_in_thread, next, root, info, args)
+        return next(root, info, **args)
+
+
+class AsyncDataLoader:
+    """
+    An asyncio DataLoader. Every load() made while the event loop works
+    through the current level of the query is answered by one call to
+    `batch_load_fn`, which runs on the resolver thread pool.
+    """
+
+    def __init__(self, batch_load_fn):
+        self.batch_load_fn = batch_load_fn
+        self.cache = {}
+        self.queue = []
+
+    def load(self, key):
+        future = self.cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.cache[key] = loop.create_future()
+            self.queue.append((key, future))
+            if len(self.queue) == 1:
+                loop.call_soon(self.dispatch)
+        return future
+
+    def dispatch(self):
+        queue, self.queue = self.queue, []
+        asyncio.ensure_future(self.load_batch(queue))
+
+    async def load_batch(self, queue):
+        keys = [key for key, _ in queue]
+        try:
+            values = await run_sync(self.batch_load_fn, keys)
+        except Exception as e:
+            for key, future in queue:
+                self.cache.pop(key, None)
+                future.set_exception(e)
+            return
+        for (_, future), value in zip(queue, values):
+            future.set_result(value)
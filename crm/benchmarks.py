@@ -0,0 +1,168 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .models import Customer, Product
+from .seeding import SeedOptions, seed
+
+# Committed budgets and timings; `manage.py benchmark_operations
+# --update-baseline` rewrites the timings
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+
+SIZES = {
+    'small': dict(customers=100, products=50, orders=500),
+    'medium': dict(customers=1_000, products=200, orders=5_000),
+    'large': dict(customers=10_000, products=1_000, orders=50_000),
+}
+
+
+class Operation:
+    """
+    A canonical request to /graphql. `variables(context)` builds its
+    variables from ids of the seeded database; mutations are rolled
+    back after each run so that every run sees the same data.
+    """
+
+    def __init__(self, name, query, variables=None, mutation=False):
+        self.name = name
+        self.query = query
+        self.variables = variables or (lambda context: None)
+        self.mutation = mutation
+
+
+OPERATIONS = [
+    Operation('allCustomers_filtered', """
+        query ($name: String) {
+          allCustomers(first: 20, filter: { nameIcontains: $name, createdAtGte: "2000-01-01T00:00:00Z" }) {
+            edges { node { id name email phone createdAt } }
+          }
+        }
+    """, lambda context: {'name': 'son'}),
+    Operation('allProducts_orderBy', """
+        {
+          allProducts(first: 20, orderBy: "-price", filter: { stockGte: 1 }) {
+            edges { node { id name price stock } }
+          }
+        }
+    """),
+    Operation('allOrders_nested', """
+        {
+          allOrders(first: 20) {
+            edges { node {
+              id totalAmount orderDate
+              customer { name email }
+              products { edges { node { name price } } }
+            } }
+          }
+        }
+    """),
+    Operation('createOrder', """
+        mutation ($input: OrderInput!) {
+          createOrder(input: $input) { order { id totalAmount customer { name } products { edges { node { name } } } } }
+        }
+    """, lambda context: {'input': {'customerId': context['customer_id'], 'productIds': context['product_ids'][:3]}},
+        mutation=True),
+    Operation('bulkCreateCustomers_1k', """
+        mutation ($input: [CustomerInput!]!) { bulkCreateCustomers(input: $input) { customers { id } errors } }
+    """, lambda context: {'input': [
+        {'name': f'Benchmark {i}', 'email': f'benchmark{i}@bench.example', 'phone': '+1-555-000-0000'}
+        for i in range(1000)
+    ]}, mutation=True),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+def run_operation(client, operation, context, repeat):
+    """Returns the median milliseconds and the SQL queries of the last run."""
+    body = json.dumps({'query': operation.query, 'variables': operation.variables(context)})
+    timings = []
+    for _ in range(repeat):
+        try:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.post('/graphql', body, content_type='application/json')
+                    timings.append((time.perf_counter() - started) * 1000)
+                content = response.json()
+                if content.get('errors'):
+                    raise AssertionError(f"{operation.name} failed: {content['errors']}")
+                if operation.mutation:
+                    raise Rollback
+        except Rollback:
+            pass
+    # Transaction control statements are not part of the operation
+    count = sum(1 for query in queries.captured_queries if not is_transaction_control(query['sql']))
+    return statistics.median(timings), count
+
+
+def is_transaction_control(sql):
+    return sql.split(None, 1)[0].upper() in ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+
+def run_suite(sizes, repeat=5, progress=None):
+    """
+    Seeds a database of each size in turn and runs OPERATIONS against it.
+    Returns {size: {operation: {'ms': ..., 'queries': ...}}}. Expects an
+    empty, disposable database.
+    """
+    results = {}
+    # Measure the resolvers, not the result cache
+    with override_settings(GRAPHQL_RESULT_CACHE={'ENABLED': False}, ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        for size in sizes:
+            seed(SeedOptions(**SIZES[size], clear=True))
+            context = {
+                'customer_id': Customer.objects.values_list('pk', flat=True).first(),
+                'product_ids': list(Product.objects.filter(stock__gte=3).values_list('pk', flat=True)[:3]),
+            }
+            results[size] = {}
+            for operation in OPERATIONS:
+                ms, queries = run_operation(client, operation, context, repeat)
+                results[size][operation.name] = {'ms': round(ms, 2), 'queries': queries}
+                if progress:
+                    progress(size, operation.name, ms, queries)
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=0.5, slack_ms=5.0, check_time=True):
+    """
+    Returns a list of failures: operations running more SQL queries than
+    their budget, or (with check_time) slower than the baseline by more
+    than `tolerance` plus `slack_ms`, which absorbs timer noise on the
+    fastest operations.
+    """
+    failures = []
+    for size, operations in results.items():
+        for name, measured in operations.items():
+            budget = baseline['budgets'].get(name)
+            if budget is not None and measured['queries'] > budget:
+                failures.append(f"{size} {name}: {measured['queries']} queries, budget {budget}")
+            expected = baseline['timings'].get(size, {}).get(name)
+            if check_time and expected is not None:
+                limit = expected * (1 + tolerance) + slack_ms
+                if measured['ms'] > limit:
+                    failures.append(f"{size} {name}: {measured['ms']:.1f} ms, baseline {expected:.1f} ms")
+    return failures
+
+
+def update_baseline(results, path=BASELINE_PATH):
+    """Records the timings of `results`, keeping the committed budgets."""
+    baseline = load_baseline(path)
+    for size, operations in results.items():
+        baseline['timings'][size] = {name: measured['ms'] for name, measured in operations.items()}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
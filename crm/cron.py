@@ -1,31 +1,26 @@
 import datetime
 import logging
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport, log as gql_log
+
+from django.conf import settings
+
+from .graphql_client import execute_graphql
 
 # It's good practice to use a logger instead of print in cron jobs
 logger = logging.getLogger(__name__)
 
-# Suppress noisy gql transport logs for simple heartbeat
-gql_log.setLevel(logging.WARNING)
-
 def log_crm_heartbeat():
     """
     A cron job function that logs a heartbeat message to a file
     to confirm the CRM application is alive and running.
-    It also pings the GraphQL endpoint's 'hello' field.
+    It also queries the GraphQL schema's 'hello' field.
     """
     log_file_path = "/tmp/crm_heartbeat_log.txt"
-    graphql_url = "http://localhost:8000/graphql"
-    
+
     timestamp = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
     log_message = f"{timestamp} CRM is alive"
 
     try:
-        transport = RequestsHTTPTransport(url=graphql_url, timeout=10)
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        hello_query = gql("query { hello }")
-        result = client.execute(hello_query)
+        result = execute_graphql("query { hello }")
         
         if result and 'hello' in result:
             log_message += " (GraphQL endpoint is responsive)."
@@ -50,13 +45,12 @@ def update_low_stock():
     then logs the results to a file.
     """
     log_file_path = "/tmp/low_stock_updates_log.txt"
-    graphql_url = "http://localhost:8000/graphql"
     logger.info("Starting low stock update job...")
 
     # CORRECTED: The mutation name is 'updateLowStock', matching the schema.
-    mutation_query = gql("""
-        mutation UpdateLowStock {
-            updateLowStock {
+    mutation_query = """
+        mutation UpdateLowStock($chunkSize: Int) {
+            updateLowStock(chunkSize: $chunkSize) {
                 success
                 message
                 updatedProducts {
@@ -65,12 +59,12 @@ def update_low_stock():
                 }
             }
         }
-    """)
+    """
 
     try:
-        transport = RequestsHTTPTransport(url=graphql_url, timeout=20)
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        result = client.execute(mutation_query)
+        result = execute_graphql(
+            mutation_query, {'chunkSize': getattr(settings, 'CRM_LOW_STOCK_CHUNK_SIZE', 1000)}
+        )
 
         update_data = result.get('updateLowStock', {})
         if update_data.get('success'):
@@ -27,17 +27,14 @@ from crm.models import Customer
 # Calculate date one year ago
 one_year_ago = timezone.now() - timedelta(days=365)
 
-# Find customers with no orders in the last year
-# Assuming Customer model has a related 'orders' field
-inactive_customers = Customer.objects.filter(
-    orders__isnull=True
-).union(
-    Customer.objects.exclude(
-        orders__created_at__gte=one_year_ago
-    )
-).distinct()
-
-# Count and delete
+# Find customers with no orders in the last year, which includes those
+# with no orders at all (delete() is not allowed after union())
+inactive_customers = Customer.objects.exclude(
+    orders__created_at__gte=one_year_ago
+)
+
+# Count and delete; CRMReport takes the deleted customers and their
+# orders off through its post_delete handlers
 count = inactive_customers.count()
 if count > 0:
     inactive_customers.delete()
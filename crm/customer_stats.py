@@ -0,0 +1,90 @@
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Max, Min, Sum
+
+from .models import Customer, Order, deleted_with_customer
+from .result_cache import invalidate_models
+
+STATS_FIELDS = ['order_count', 'lifetime_value', 'last_order_at']
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def order_stats(orders):
+    """{customer_id: (order_count, lifetime_value, last_order_at)} over `orders`, in one query."""
+    rows = (
+        orders.order_by()
+        .values('customer_id')
+        .annotate(count=Count('id'), total=Sum('total_amount'), last=Max('order_date'))
+        .values_list('customer_id', 'count', 'total', 'last')
+    )
+    return {customer_id: (count, total, last) for customer_id, count, total, last in rows}
+
+
+def repair(customers, stats, using):
+    """Writes `stats` over the customers whose stored totals drifted; returns how many did."""
+    drifted = []
+    for customer in customers:
+        expected = stats.get(customer.pk, (0, Decimal('0.00'), None))
+        if (customer.order_count, customer.lifetime_value, customer.last_order_at) != expected:
+            customer.order_count, customer.lifetime_value, customer.last_order_at = expected
+            drifted.append(customer)
+    if drifted:
+        Customer.objects.using(using).bulk_update(drifted, STATS_FIELDS, batch_size=500)
+        # bulk_update() sends no post_save signals
+        invalidate_models(Customer)
+    return len(drifted)
+
+
+def refresh(customer_ids, using=DEFAULT_DB_ALIAS):
+    """Recomputes the totals of a few customers, e.g. after their orders were rewritten in bulk."""
+    customer_ids = set(customer_ids)
+    if not customer_ids:
+        return 0
+    customers = Customer.objects.using(using).filter(pk__in=customer_ids).only('id', *STATS_FIELDS)
+    return repair(customers, order_stats(Order.objects.using(using).filter(customer_id__in=customer_ids)), using)
+
+
+def order_deleted(sender, instance, using, origin=None, **kwargs):
+    """
+    post_delete receiver for Order, connected in CrmConfig.ready(), that
+    takes the order off its customer's totals. Skipped when the delete
+    started from customers, whose own rows go in the same delete.
+    """
+    if deleted_with_customer(origin):
+        return
+    refresh({instance.customer_id}, using)
+
+
+def reconcile_range(low, high, using=DEFAULT_DB_ALIAS):
+    """Checks the customers with ids in [low, high); returns (checked, repaired)."""
+    with transaction.atomic(using=using):
+        # Locked, so no order can be recorded between the count and the write
+        customers = list(
+            Customer.objects.using(using)
+            .filter(pk__gte=low, pk__lt=high)
+            .only('id', *STATS_FIELDS)
+            .select_for_update()
+        )
+        stats = order_stats(Order.objects.using(using).filter(customer_id__gte=low, customer_id__lt=high))
+        return len(customers), repair(customers, stats, using)
+
+
+def reconcile(chunk_size=DEFAULT_CHUNK_SIZE, using=DEFAULT_DB_ALIAS, progress=None):
+    """
+    Compares every customer's stored totals with its orders, a chunk of
+    `chunk_size` ids per transaction, and repairs the ones that drifted.
+    Returns (checked, repaired).
+    """
+    bounds = Customer.objects.using(using).aggregate(low=Min('pk'), high=Max('pk'))
+    checked = repaired = 0
+    if bounds['low'] is None:
+        return checked, repaired
+    for low in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        chunk_checked, chunk_repaired = reconcile_range(low, low + chunk_size, using)
+        checked += chunk_checked
+        repaired += chunk_repaired
+        if progress:
+            progress(chunk_checked, chunk_repaired)
+    return checked, repaired
@@ -0,0 +1,208 @@
+import itertools
+import sqlite3
+import threading
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from graphql import OperationType
+
+DEFAULTS = {
+    # Database aliases serving GraphQL queries; none sends everything to
+    # the primary ('default')
+    'REPLICAS': [],
+    # 'round_robin', or 'least_loaded': the replica serving the fewest
+    # requests in this process
+    'STRATEGY': 'round_robin',
+    # After a write, the client's reads go to the primary for this long
+    # (read-your-writes across requests, through a cookie)
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'crm_read_primary',
+}
+
+# The routing state of the request being handled, set by
+# DatabaseRoutingMiddleware
+_current = ContextVar('database_routing', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CRM_DATABASE_ROUTING', {})}
+
+
+class RoutingState:
+    """
+    Where one request reads from. Reads only go to a replica once the
+    view has started a query operation, and only until something sends the
+    request to the primary: a mutation, a write or the sticky cookie.
+    """
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.replica_reads = False
+        self.replica = None
+        self.wrote = False
+        # Resolvers may run on several threads under ASGI
+        self.lock = threading.Lock()
+
+
+class ReplicaBalancer:
+    """Picks a replica per request and tracks how many requests each serves."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.cycle = None
+        self.replicas = ()
+
+    def acquire(self, replicas, strategy):
+        with self.lock:
+            if tuple(replicas) != self.replicas:
+                self.replicas = tuple(replicas)
+                self.cycle = itertools.cycle(self.replicas)
+            if strategy == 'least_loaded':
+                alias = min(self.replicas, key=lambda alias: self.active.get(alias, 0))
+            elif strategy == 'round_robin':
+                alias = next(self.cycle)
+            else:
+                raise ImproperlyConfigured(f"Unknown replica strategy '{strategy}'.")
+            self.active[alias] = self.active.get(alias, 0) + 1
+            return alias
+
+    def release(self, alias):
+        with self.lock:
+            self.active[alias] -= 1
+
+
+balancer = ReplicaBalancer()
+
+
+def begin_operation(operation):
+    """Called by the GraphQL view with the type of each operation it runs."""
+    state = _current.get()
+    if state is None:
+        return
+    with state.lock:
+        if operation == OperationType.QUERY:
+            state.replica_reads = True
+        else:
+            # Mutations and whatever follows them in the request
+            state.primary = True
+
+
+class ReadWriteRouter:
+    """
+    Sends the reads of GraphQL query operations to a replica (the same
+    one for the whole request) and everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or state.primary or not state.replica_reads:
+            return DEFAULT_DB_ALIAS
+        config = get_config()
+        if not config['REPLICAS']:
+            return DEFAULT_DB_ALIAS
+        with state.lock:
+            if state.replica is None:
+                state.replica = balancer.acquire(config['REPLICAS'], config['STRATEGY'])
+            return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            with state.lock:
+                state.primary = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the same tables
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema along with their data
+        return db not in get_config()['REPLICAS']
+
+
+def read_alias():
+    """
+    The database the current request reads from. Cached results are keyed
+    by it, so that a replica's older answer is never served to a client
+    reading the primary.
+    """
+    return ReadWriteRouter().db_for_read(None)
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Django middleware that gives each request its RoutingState and, after
+    a request that wrote, sets the cookie that keeps the client's reads on
+    the primary for STICKY_SECONDS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.end(state, token)
+        return self.stick(state, response)
+
+    async def __acall__(self, request):
+        state, token = self.begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.end(state, token)
+        return self.stick(state, response)
+
+    @staticmethod
+    def begin(request):
+        state = RoutingState(primary=get_config()['COOKIE_NAME'] in request.COOKIES)
+        return state, _current.set(state)
+
+    @staticmethod
+    def end(state, token):
+        _current.reset(token)
+        if state.replica is not None:
+            balancer.release(state.replica)
+
+    @staticmethod
+    def stick(state, response):
+        config = get_config()
+        if state.wrote and config['REPLICAS'] and config['STICKY_SECONDS']:
+            response.set_cookie(config['COOKIE_NAME'], '1', max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax')
+        return response
+
+
+def copy_to_replicas(replicas=None):
+    """
+    Copies the primary SQLite database into each replica with SQLite's
+    online backup, which readers of the primary do not block. For local
+    testing; server databases replicate on their own.
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    if primary.vendor != 'sqlite':
+        raise ImproperlyConfigured("copy_to_replicas() only copies SQLite databases.")
+    primary.ensure_connection()
+    copied = []
+    for alias in replicas if replicas is not None else get_config()['REPLICAS']:
+        # Close the replica's connection so it reopens on the new copy
+        connections[alias].close()
+        target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        copied.append(alias)
+    return copied
@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql import GraphQLError, parse, validate
+
+from .metrics import phase
+
+
+class DocumentCache:
+    """
+    A bounded LRU cache of parsed and validated GraphQL documents, keyed
+    by query text. Repeated operations skip lexing, parsing and
+    validation; their validation errors are cached along with them.
+    """
+
+    def __init__(self, maxsize=None):
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        if self._maxsize is None:
+            return getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', 1000)
+        return self._maxsize
+
+    def get(self, schema, query, validation_rules=None, max_errors=None):
+        """Returns (document, errors) for `query`, parsing it on a miss."""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is not None:
+                self._entries.move_to_end(query)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            with phase('parse'):
+                document = parse(query)
+        except GraphQLError as e:
+            entry = (None, [e])
+        else:
+            with phase('validate'):
+                entry = (document, validate(schema, document, validation_rules, max_errors))
+
+        maxsize = self.maxsize
+        if maxsize:
+            with self._lock:
+                self._entries[query] = entry
+                self._entries.move_to_end(query)
+                while len(self._entries) > maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import zlib
+
+from django.db.models import Prefetch
+
+from .filters import CustomerFilter, OrderFilter, ProductFilter
+from .models import Customer, Order, Product
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched per query; each chunk of orders also costs one query for
+# its products
+DEFAULT_CHUNK_SIZE = 2000
+
+# Bytes collected before a piece of the export is handed to the response
+FLUSH_SIZE = 64 * 1024
+
+
+class ExportError(Exception):
+    pass
+
+
+class Export:
+    """
+    A table export: the filter set that narrows it and the columns of
+    each row. Columns are (name, function of the instance) pairs.
+    """
+
+    def __init__(self, model, filterset_class, columns, select_related=(), prefetch=()):
+        self.model = model
+        self.filterset_class = filterset_class
+        self.columns = columns
+        self.select_related = select_related
+        self.prefetch = prefetch
+
+    def queryset(self, params):
+        filterset = self.filterset_class(params, queryset=self.model.objects.all())
+        if not filterset.is_valid():
+            raise ExportError('; '.join(
+                f'{field}: {" ".join(errors)}' for field, errors in filterset.errors.items()
+            ))
+        # Related rows are joined in SQL or fetched once per chunk, never per row
+        return filterset.qs.select_related(*self.select_related).prefetch_related(*self.prefetch).order_by('pk')
+
+    def rows(self, params, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yields one dict per row without holding more than a chunk in memory."""
+        for instance in self.queryset(params).iterator(chunk_size=chunk_size):
+            yield {name: value(instance) for name, value in self.columns}
+
+
+def product_list(order):
+    # Served from the chunk's prefetch
+    return sorted(order.products.all(), key=lambda product: product.pk)
+
+
+EXPORTS = {
+    'customers': Export(Customer, CustomerFilter, [
+        ('id', lambda customer: customer.pk),
+        ('name', lambda customer: customer.name),
+        ('email', lambda customer: customer.email),
+        ('phone', lambda customer: customer.phone),
+        ('created_at', lambda customer: customer.created_at),
+    ]),
+    'products': Export(Product, ProductFilter, [
+        ('id', lambda product: product.pk),
+        ('name', lambda product: product.name),
+        ('price', lambda product: product.price),
+        ('stock', lambda product: product.stock),
+        ('created_at', lambda product: product.created_at),
+    ]),
+    'orders': Export(
+        Order,
+        OrderFilter,
+        [
+            ('id', lambda order: order.pk),
+            ('order_date', lambda order: order.order_date),
+            ('total_amount', lambda order: order.total_amount),
+            ('customer_id', lambda order: order.customer_id),
+            ('customer_name', lambda order: order.customer.name),
+            ('customer_email', lambda order: order.customer.email),
+            ('product_ids', lambda order: [product.pk for product in product_list(order)]),
+            ('product_names', lambda order: [product.name for product in product_list(order)]),
+        ],
+        select_related=['customer'],
+        prefetch=[Prefetch('products', queryset=Product.objects.only('id', 'name'))],
+    ),
+}
+
+
+def get_export(name):
+    try:
+        return EXPORTS[name]
+    except KeyError:
+        raise ExportError(f"Unknown export '{name}', expected one of: {', '.join(EXPORTS)}.")
+
+
+def to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '|'.join(to_text(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def to_json(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    # Decimals keep their exact digits
+    return str(value)
+
+
+def encode_csv(export, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in export.columns])
+    for row in rows:
+        writer.writerow([to_text(value) for value in row.values()])
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def encode_ndjson(export, rows):
+    pieces, size = [], 0
+    for row in rows:
+        line = json.dumps(row, default=to_json, ensure_ascii=False) + '\n'
+        pieces.append(line)
+        size += len(line)
+        if size >= FLUSH_SIZE:
+            yield ''.join(pieces).encode()
+            pieces, size = [], 0
+    yield ''.join(pieces).encode()
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+}
+
+
+def gzip_stream(pieces):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(name, params=None, format='csv', compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Returns an iterator of bytes exporting the `name` table filtered by
+    `params`, the arguments of its FilterSet. Nothing is queried until
+    the iterator is consumed.
+    """
+    export = get_export(name)
+    if format not in ENCODERS:
+        raise ExportError(f"Unknown format '{format}', expected one of: {', '.join(ENCODERS)}.")
+    # Validate the filters now rather than halfway through a response
+    export.queryset(params or {})
+    pieces = ENCODERS[format](export, export.rows(params or {}, chunk_size))
+    return gzip_stream(pieces) if compress else pieces
@@ -1,14 +1,36 @@
 import django_filters
 from django_filters import FilterSet, CharFilter, DateTimeFilter, NumberFilter
+from django_filters.constants import EMPTY_VALUES
 from .models import Customer, Product, Order
+from .search import get_search_backend
+
+
+class ContainsFilter(CharFilter):
+    """
+    A case-insensitive substring filter answered by the search backend
+    (the FTS5 index on SQLite) instead of a LIKE '%value%' scan.
+    """
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        qs = get_search_backend().filter_contains(qs, self.field_name, value)
+        return qs.distinct() if self.distinct else qs
 
 
 class CustomerFilter(FilterSet):
-    name_icontains = CharFilter(field_name='name', lookup_expr='icontains')
-    email_icontains = CharFilter(field_name='email', lookup_expr='icontains')
+    name_icontains = ContainsFilter(field_name='name')
+    email_icontains = ContainsFilter(field_name='email')
     created_at_gte = DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at_lte = DateTimeFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = CharFilter(field_name='phone', lookup_expr='startswith')
+    # Stored lifetime totals, see Customer.record_order()
+    order_count_gte = NumberFilter(field_name='order_count', lookup_expr='gte')
+    order_count_lte = NumberFilter(field_name='order_count', lookup_expr='lte')
+    lifetime_value_gte = NumberFilter(field_name='lifetime_value', lookup_expr='gte')
+    lifetime_value_lte = NumberFilter(field_name='lifetime_value', lookup_expr='lte')
+    last_order_at_gte = DateTimeFilter(field_name='last_order_at', lookup_expr='gte')
+    last_order_at_lte = DateTimeFilter(field_name='last_order_at', lookup_expr='lte')
 
     class Meta:
         model = Customer
@@ -16,12 +38,15 @@ class CustomerFilter(FilterSet):
             'name': ['icontains'],
             'email': ['icontains'], 
             'created_at': ['gte', 'lte'],
-            'phone': ['startswith']
+            'phone': ['startswith'],
+            'order_count': ['gte', 'lte'],
+            'lifetime_value': ['gte', 'lte'],
+            'last_order_at': ['gte', 'lte'],
         }
 
 
 class ProductFilter(FilterSet):
-    name_icontains = CharFilter(field_name='name', lookup_expr='icontains')
+    name_icontains = ContainsFilter(field_name='name')
     price_gte = NumberFilter(field_name='price', lookup_expr='gte')
     price_lte = NumberFilter(field_name='price', lookup_expr='lte')
     stock_gte = NumberFilter(field_name='stock', lookup_expr='gte')
@@ -43,8 +68,8 @@ class OrderFilter(FilterSet):
     total_amount_lte = NumberFilter(field_name='total_amount', lookup_expr='lte')
     order_date_gte = DateTimeFilter(field_name='order_date', lookup_expr='gte')
     order_date_lte = DateTimeFilter(field_name='order_date', lookup_expr='lte')
-    customer_name = CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = CharFilter(field_name='products__name', lookup_expr='icontains')
+    customer_name = ContainsFilter(field_name='customer__name')
+    product_name = ContainsFilter(field_name='products__name')
     product_id = NumberFilter(field_name='products__id', lookup_expr='exact')
 
     class Meta:
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import requests
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import execute
+from graphql_sync_dataloaders import DeferredExecutionContext
+
+from .document_cache import DocumentCache
+
+DEFAULTS = {
+    # 'local' runs documents in this process against the project schema;
+    # 'http' posts them to URL, e.g. when jobs run on another host
+    'TRANSPORT': 'local',
+    'URL': 'http://localhost:8000/graphql',
+    'TIMEOUT': 30,
+}
+
+# Cron jobs and Celery tasks send the same few documents on every run
+documents = DocumentCache(maxsize=128)
+
+_session = None
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CRM_GRAPHQL_CLIENT', {})}
+
+
+class GraphQLClientError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def execute_graphql(query, variables=None, operation_name=None):
+    """
+    Runs a GraphQL document for background jobs and returns its `data`.
+    Raises GraphQLClientError when the operation reports errors.
+    """
+    if get_config()['TRANSPORT'] == 'http':
+        return _execute_http(query, variables, operation_name)
+    return _execute_local(query, variables, operation_name)
+
+
+def _execute_local(query, variables, operation_name):
+    schema = graphene_settings.SCHEMA.graphql_schema
+    document, errors = documents.get(schema, query)
+    if errors:
+        raise GraphQLClientError([error.message for error in errors])
+
+    result = execute(
+        schema,
+        document,
+        variable_values=variables,
+        operation_name=operation_name,
+        # Stands in for the request so the DataLoaders have a place to live
+        context_value=SimpleNamespace(),
+        execution_context_class=DeferredExecutionContext,
+    )
+    if result.errors:
+        raise GraphQLClientError([error.message for error in result.errors])
+    return result.data
+
+
+def get_session():
+    """A module-wide session, so HTTP calls reuse pooled keep-alive connections."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def _execute_http(query, variables, operation_name):
+    config = get_config()
+    response = get_session().post(
+        config['URL'],
+        json={'query': query, 'variables': variables, 'operationName': operation_name},
+        timeout=config['TIMEOUT'],
+    )
+    try:
+        payload = response.json()
+    except ValueError:
+        response.raise_for_status()
+        raise
+    if payload.get('errors'):
+        raise GraphQLClientError([error.get('message', str(error)) for error in payload['errors']])
+    return payload.get('data')
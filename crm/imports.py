@@ -0,0 +1,376 @@
+import csv
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import customer_stats, sales_rollups
+from .models import CRMReport, Customer, Order, Product
+from .result_cache import invalidate_models
+from .schema import PHONE_PATTERN
+
+FORMATS = ('csv', 'ndjson')
+
+# Rows validated and written per transaction
+DEFAULT_BATCH_SIZE = 1000
+
+# Separates the items of a list column in CSV, as in crm.export
+LIST_SEPARATOR = '|'
+
+
+class ImportDataError(Exception):
+    pass
+
+
+class RowError(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    written: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    # Rows before this one were committed (or rejected) by an earlier run
+    start: int = 0
+
+    @property
+    def rate(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_records(lines, format):
+    """Parses an iterable of text lines into one dict per record."""
+    if format == 'csv':
+        for record in csv.DictReader(lines):
+            yield {key: value if value != '' else None for key, value in record.items()}
+    elif format == 'ndjson':
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ImportDataError(f"Unknown format '{format}', expected one of: {', '.join(FORMATS)}.")
+
+
+def required(record, key):
+    value = record.get(key)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise RowError(f"'{key}' is required.")
+    return value.strip() if isinstance(value, str) else value
+
+
+def to_int(value, key):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"'{key}' must be an integer, got '{value}'.")
+
+
+def to_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+    return list(value)
+
+
+class Importer:
+    """
+    Validates and upserts one batch of records of a model. Subclasses
+    implement clean() for a single record and write() for a batch of
+    cleaned ones; write() runs inside the batch's transaction.
+    """
+    model = None
+
+    def clean(self, record):
+        raise NotImplementedError
+
+    def prepare(self, cleaned):
+        """Batched lookups shared by the batch's rows; may reject some of them."""
+        return cleaned, []
+
+    def write(self, cleaned):
+        raise NotImplementedError
+
+    def load(self, batch):
+        """Returns the number of rows written and [(row, message)] for the rest."""
+        errors, cleaned = [], []
+        for row, record in batch:
+            try:
+                cleaned.append((row, self.clean(record)))
+            except RowError as e:
+                errors.append((row, str(e)))
+        cleaned, rejected = self.prepare(cleaned)
+        errors.extend(rejected)
+        if not cleaned:
+            return 0, errors
+
+        try:
+            with transaction.atomic():
+                self.write(cleaned)
+            written = len(cleaned)
+        except Exception:
+            # Retry row by row so the failing records can be reported
+            written = 0
+            for row, values in cleaned:
+                try:
+                    with transaction.atomic():
+                        self.write([(row, values)])
+                    written += 1
+                except Exception as e:
+                    errors.append((row, f"Could not write the record. Error: {e}"))
+        if written:
+            # bulk_create() sends no post_save signals
+            invalidate_models(self.model)
+        return written, sorted(errors)
+
+
+class CustomerImporter(Importer):
+    """Upserts on email: existing customers get the imported name and phone."""
+    model = Customer
+
+    def clean(self, record):
+        name, email = required(record, 'name'), required(record, 'email')
+        phone = record.get('phone') or None
+        # The rules CreateCustomer enforces
+        if phone and not PHONE_PATTERN.match(phone):
+            raise RowError(f"Invalid phone number format for '{phone}'.")
+        return {'name': name, 'email': email, 'phone': phone}
+
+    def prepare(self, cleaned):
+        seen, unique, errors = set(), [], []
+        for row, values in cleaned:
+            if values['email'] in seen:
+                errors.append((row, f"Email '{values['email']}' appears more than once in the batch."))
+                continue
+            seen.add(values['email'])
+            unique.append((row, values))
+        return unique, errors
+
+    def write(self, cleaned):
+        emails = [values['email'] for _, values in cleaned]
+        existing = set(Customer.objects.filter(email__in=emails).values_list('email', flat=True))
+        Customer.objects.bulk_create(
+            [Customer(**values) for _, values in cleaned],
+            update_conflicts=True,
+            unique_fields=['email'],
+            update_fields=['name', 'phone', 'updated_at'],
+        )
+        inserted = len(cleaned) - len(existing)
+        if inserted:
+            CRMReport.increment(customers=inserted)
+
+
+class ProductImporter(Importer):
+    """Records with an `id` update that product; the others are inserted."""
+    model = Product
+
+    def clean(self, record):
+        name = required(record, 'name')
+        try:
+            price = Decimal(str(required(record, 'price')))
+        except InvalidOperation:
+            price = None
+        if price is None or not price.is_finite():
+            raise RowError(f"'price' must be a number, got '{record['price']}'.")
+        stock = to_int(record.get('stock') if record.get('stock') is not None else 0, 'stock')
+        # The rules CreateProduct enforces
+        if price <= 0:
+            raise RowError("Price must be a positive value.")
+        if stock < 0:
+            raise RowError("Stock cannot be negative.")
+        pk = to_int(record['id'], 'id') if record.get('id') is not None else None
+        return {'id': pk, 'name': name, 'price': price, 'stock': stock}
+
+    def write(self, cleaned):
+        updates = [Product(**values) for _, values in cleaned if values['id'] is not None]
+        inserts = [Product(**values) for _, values in cleaned if values['id'] is None]
+        if updates:
+            Product.objects.bulk_create(
+                updates,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=['name', 'price', 'stock', 'updated_at'],
+            )
+        if inserts:
+            Product.objects.bulk_create(inserts)
+
+
+class OrderImporter(Importer):
+    """
+    Records name their customer by customer_id or customer_email and their
+    products by product_ids or product_names. The total is computed from
+    the products' prices, as in CreateOrder. Records with an `id` replace
+    that order.
+    """
+    model = Order
+
+    def clean(self, record):
+        customer_id = record.get('customer_id')
+        customer_email = record.get('customer_email')
+        if customer_id is None and not customer_email:
+            raise RowError("'customer_id' or 'customer_email' is required.")
+        product_ids = [to_int(pk, 'product_ids') for pk in to_list(record.get('product_ids'))]
+        product_names = to_list(record.get('product_names')) if not product_ids else []
+        if not product_ids and not product_names:
+            raise RowError("At least one product must be selected for an order.")
+
+        order_date = record.get('order_date')
+        if order_date is not None and not isinstance(order_date, datetime):
+            parsed = parse_datetime(str(order_date))
+            if parsed is None:
+                raise RowError(f"'order_date' must be an ISO 8601 datetime, got '{order_date}'.")
+            order_date = parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+        return {
+            'id': to_int(record['id'], 'id') if record.get('id') is not None else None,
+            'customer_id': to_int(customer_id, 'customer_id') if customer_id is not None else None,
+            'customer_email': customer_email,
+            'product_ids': product_ids,
+            'product_names': product_names,
+            'order_date': order_date or timezone.now(),
+        }
+
+    def prepare(self, cleaned):
+        # One query for every customer and one for every product of the batch
+        emails = {values['customer_email'] for _, values in cleaned if values['customer_id'] is None}
+        customer_ids = {values['customer_id'] for _, values in cleaned if values['customer_id'] is not None}
+        customers = {}
+        for pk, email in Customer.objects.filter(Q(pk__in=customer_ids) | Q(email__in=emails)).values_list('pk', 'email'):
+            customers[pk] = pk
+            customers[email] = pk
+
+        ids = {pk for _, values in cleaned for pk in values['product_ids']}
+        names = {name for _, values in cleaned for name in values['product_names']}
+        products, by_name = {}, {}
+        for pk, name, price in Product.objects.filter(Q(pk__in=ids) | Q(name__in=names)).values_list('pk', 'name', 'price'):
+            products[pk] = price
+            by_name.setdefault(name, []).append(pk)
+
+        ready, errors = [], []
+        for row, values in cleaned:
+            customer = customers.get(values['customer_id'] if values['customer_id'] is not None else values['customer_email'])
+            if customer is None:
+                errors.append((row, f"Customer '{values['customer_id'] or values['customer_email']}' does not exist."))
+                continue
+            product_ids = list(values['product_ids'])
+            missing = [str(pk) for pk in product_ids if pk not in products]
+            for name in values['product_names']:
+                matches = [pk for pk in by_name.get(name, ()) if pk in products]
+                if len(matches) != 1:
+                    missing.append(f"'{name}'" + (' (ambiguous)' if matches else ''))
+                else:
+                    product_ids.append(matches[0])
+            if missing:
+                errors.append((row, f"Invalid products: {', '.join(missing)}"))
+                continue
+            product_ids = list(dict.fromkeys(product_ids))
+            ready.append((row, {
+                'id': values['id'],
+                'customer_id': customer,
+                'product_ids': product_ids,
+                'order_date': values['order_date'],
+                'total_amount': sum((products[pk] for pk in product_ids), Decimal('0.00')),
+            }))
+        return ready, errors
+
+    def write(self, cleaned):
+        Through = Order.products.through
+        replaced_ids = [values['id'] for _, values in cleaned if values['id'] is not None]
+        replaced, previous_customers, previous_dates = {}, set(), []
+        for pk, total_amount, customer_id, order_date in Order.objects.filter(pk__in=replaced_ids).values_list(
+            'pk', 'total_amount', 'customer_id', 'order_date'
+        ):
+            replaced[pk] = total_amount
+            previous_customers.add(customer_id)
+            previous_dates.append(order_date)
+
+        orders = [
+            Order(id=values['id'], customer_id=values['customer_id'], total_amount=values['total_amount'],
+                  order_date=values['order_date'])
+            for _, values in cleaned
+        ]
+        updates = [order for order in orders if order.pk is not None]
+        inserts = [order for order in orders if order.pk is None]
+        if updates:
+            Order.objects.bulk_create(
+                updates,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=['customer', 'total_amount', 'order_date'],
+            )
+            Through.objects.filter(order_id__in=replaced).delete()
+        if inserts:
+            # Sets the new primary keys (on PostgreSQL and SQLite 3.35+),
+            # which the order lines below need
+            Order.objects.bulk_create(inserts)
+
+        Through.objects.bulk_create([
+            Through(order_id=order.pk, product_id=product_id)
+            for order, (_, values) in zip(orders, cleaned)
+            for product_id in values['product_ids']
+        ])
+        revenue = sum(order.total_amount for order in orders) - sum(replaced.values())
+        CRMReport.increment(orders=len(orders) - len(replaced), revenue=revenue)
+        # A replaced order may have moved between customers
+        customer_stats.refresh({order.customer_id for order in orders} | previous_customers)
+        # Orders written with an id may be below the rollup watermark, on
+        # their new day and, when replaced, their old one
+        sales_rollups.mark_stale([*previous_dates, *(order.order_date for order in updates)])
+
+
+IMPORTERS = {
+    'customers': CustomerImporter,
+    'products': ProductImporter,
+    'orders': OrderImporter,
+}
+
+
+def import_records(name, records, batch_size=DEFAULT_BATCH_SIZE, start=0, on_batch=None, on_error=None):
+    """
+    Imports the `name` table from an iterable of record dicts, a batch at
+    a time, and returns an ImportResult. Rows are numbered from 1; the
+    first `start` are skipped, so a run can resume from the row an
+    earlier one reported through `on_batch(last_row)`, which is called
+    after each batch commits. `on_error(row, record, message)` is called
+    for each rejected row.
+    """
+    try:
+        importer = IMPORTERS[name]()
+    except KeyError:
+        raise ImportDataError(f"Unknown import '{name}', expected one of: {', '.join(IMPORTERS)}.")
+
+    result = ImportResult(start=start)
+    started = time.perf_counter()
+    batch = []
+    row = 0
+
+    def flush():
+        records_by_row = dict(batch)
+        written, errors = importer.load(batch)
+        result.rows += len(batch)
+        result.written += written
+        result.errors += len(errors)
+        for error_row, message in errors:
+            if on_error:
+                on_error(error_row, records_by_row[error_row], message)
+        if on_batch:
+            on_batch(batch[-1][0])
+        batch.clear()
+
+    for row, record in enumerate(records, start=1):
+        if row <= start:
+            continue
+        batch.append((row, record))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,148 @@
+import asyncio
+from collections import defaultdict
+from functools import partial
+
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql_sync_dataloaders import SyncDataLoader, SyncFuture
+
+from .async_execution import AsyncDataLoader, nonblocking, run_sync
+from .models import Customer, Order
+
+
+# -- Batch load functions --
+# Each one receives every key requested on the current page and answers
+# them with a single `IN (...)` query, in the same order as the keys.
+def load_customers(customer_ids):
+    customers = Customer.objects.in_bulk(customer_ids)
+    return [customers.get(customer_id) for customer_id in customer_ids]
+
+
+def load_orders_by_customer(customer_ids):
+    orders = defaultdict(list)
+    for order in Order.objects.filter(customer_id__in=customer_ids).order_by('pk'):
+        orders[order.customer_id].append(order)
+    return [orders[customer_id] for customer_id in customer_ids]
+
+
+def load_products_by_order(order_ids):
+    products = defaultdict(list)
+    links = (
+        Order.products.through.objects
+        .filter(order_id__in=order_ids)
+        .select_related('product')
+        .order_by('product_id')
+    )
+    for link in links:
+        products[link.order_id].append(link.product)
+    return [products[order_id] for order_id in order_ids]
+
+
+def load_orders_by_product(product_ids):
+    orders = defaultdict(list)
+    links = (
+        Order.products.through.objects
+        .filter(product_id__in=product_ids)
+        .select_related('order')
+        .order_by('order_id')
+    )
+    for link in links:
+        orders[link.product_id].append(link.order)
+    return [orders[product_id] for product_id in product_ids]
+
+
+class CRMLoaders:
+    """
+    The DataLoaders used while resolving a single GraphQL request.
+    A fresh instance is attached to each request, so cached rows never
+    outlive the request that loaded them. Asynchronous loaders are used
+    when the request executes on the event loop (see AsyncCRMGraphQLView).
+    """
+
+    def __init__(self, asynchronous=False):
+        self.asynchronous = asynchronous
+        loader_class = AsyncDataLoader if asynchronous else SyncDataLoader
+        self.customer = loader_class(load_customers)
+        self.customer_orders = loader_class(load_orders_by_customer)
+        self.order_products = loader_class(load_products_by_order)
+        self.product_orders = loader_class(load_orders_by_product)
+
+
+def get_loaders(info):
+    """
+    Returns the loaders hung off the GraphQL context, creating them on
+    first use within the request.
+    """
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = CRMLoaders()
+        context.loaders = loaders
+    return loaders
+
+
+def then(future, callback):
+    """
+    Chains `callback` onto a SyncFuture, keeping the loader's dispatch
+    hook so the execution context still batches the underlying load.
+    Futures from asynchronous loaders are chained with a coroutine.
+    """
+    if isinstance(future, asyncio.Future):
+        async def chained_coroutine():
+            return callback(await future)
+        return chained_coroutine()
+
+    chained = SyncFuture()
+    chained.deferred_callback = future.deferred_callback
+
+    def on_done():
+        try:
+            chained.set_result(callback(future.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    if future.done():
+        on_done()
+    else:
+        future.add_done_callback(on_done)
+    return chained
+
+
+class BatchedConnectionField(DjangoFilterConnectionField):
+    """
+    A DjangoFilterConnectionField for relationships that resolves
+    unfiltered pages through one of the request's DataLoaders, or from the
+    prefetch cache when the query optimizer already fetched the relation.
+    Filtered pages fall back to the regular per-parent queryset.
+    """
+
+    def __init__(self, type_, loader, *args, **kwargs):
+        self.loader = loader
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    @nonblocking
+    def batched_resolver(cls, loader, filtering_args, connection, max_limit,
+                         queryset_resolver, root, info, **args):
+        loaders = get_loaders(info)
+        if any(args.get(name) is not None for name in filtering_args):
+            if loaders.asynchronous:
+                return run_sync(queryset_resolver, root, info, **args)
+            return queryset_resolver(root, info, **args)
+
+        name = to_snake_case(info.field_name)
+        if name in getattr(root, '_prefetched_objects_cache', {}):
+            return cls.resolve_connection(connection, args, getattr(root, name).all(), max_limit=max_limit)
+
+        future = getattr(loaders, loader).load(root.pk)
+        return then(future, partial(cls.resolve_connection, connection, args, max_limit=max_limit))
+
+    def wrap_resolve(self, parent_resolver):
+        return partial(
+            self.batched_resolver,
+            self.loader,
+            self.filtering_args,
+            self.connection_type,
+            self.max_limit,
+            super().wrap_resolve(parent_resolver),
+        )
@@ -0,0 +1,150 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+
+from . import customer_stats, sales_rollups
+from .models import CRMReport, Customer, Order, Product
+from .restock import restock_low_stock
+from .result_cache import invalidate_models
+
+DEFAULTS = {
+    # Rows of the id range each chunk covers
+    'CHUNK_SIZE': 1000,
+    # Chunk tasks of one job running at the same time
+    'CONCURRENCY': 4,
+}
+
+
+class MaintenanceError(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CRM_MAINTENANCE', {})}
+
+
+class MaintenanceJob:
+    """
+    A catalog-wide job run over primary key ranges of `model`. Each chunk
+    is independent and commits on its own, so chunks can run on several
+    workers; run_chunk() returns counts that are summed across chunks.
+    """
+    model = None
+
+    def queryset(self, options):
+        return self.model.objects.all()
+
+    def run_chunk(self, low, high, options):
+        raise NotImplementedError
+
+
+class RestockJob(MaintenanceJob):
+    """Adds `increment` to the stock of products below `threshold`."""
+    model = Product
+
+    def queryset(self, options):
+        return Product.objects.filter(stock__lt=options.get('threshold', 10))
+
+    def run_chunk(self, low, high, options):
+        updated = restock_low_stock(
+            threshold=options.get('threshold', 10),
+            increment=options.get('increment', 10),
+            queryset=Product.objects.filter(pk__gte=low, pk__lt=high),
+        )
+        return {'updated': len(updated)}
+
+
+class RecomputeOrderTotalsJob(MaintenanceJob):
+    """Resets each order's total_amount to the sum of its products' prices, as CreateOrder computes it."""
+    model = Order
+
+    def run_chunk(self, low, high, options):
+        Through = Order.products.through
+        totals = dict(
+            Through.objects.filter(order_id__gte=low, order_id__lt=high)
+            .values('order_id')
+            .annotate(total=Sum('product__price'))
+            .values_list('order_id', 'total')
+        )
+        orders = list(
+            Order.objects.filter(pk__gte=low, pk__lt=high).only('id', 'total_amount', 'customer_id', 'order_date')
+        )
+        changed, delta = [], Decimal('0.00')
+        for order in orders:
+            total = totals.get(order.pk) or Decimal('0.00')
+            if order.total_amount != total:
+                delta += total - order.total_amount
+                order.total_amount = total
+                changed.append(order)
+        if changed:
+            with transaction.atomic():
+                Order.objects.bulk_update(changed, ['total_amount'], batch_size=500)
+                CRMReport.increment(revenue=delta)
+                customer_stats.refresh({order.customer_id for order in changed})
+                sales_rollups.mark_stale(order.order_date for order in changed)
+            # bulk_update() sends no post_save signals
+            invalidate_models(Order)
+        return {'scanned': len(orders), 'updated': len(changed)}
+
+
+class ReconcileCustomerStatsJob(MaintenanceJob):
+    """Repairs customers' stored lifetime totals that drifted from their orders."""
+    model = Customer
+
+    def run_chunk(self, low, high, options):
+        checked, repaired = customer_stats.reconcile_range(low, high)
+        return {'checked': checked, 'repaired': repaired}
+
+
+JOBS = {
+    'restock': RestockJob,
+    'recompute_order_totals': RecomputeOrderTotalsJob,
+    'reconcile_customer_stats': ReconcileCustomerStatsJob,
+}
+
+
+def get_job(name):
+    try:
+        return JOBS[name]()
+    except KeyError:
+        raise MaintenanceError(f"Unknown maintenance job '{name}', expected one of: {', '.join(JOBS)}.")
+
+
+def plan(name, chunk_size=None, concurrency=None, options=None):
+    """
+    Splits the job's id range into chunks of `chunk_size` ids and deals
+    them out to at most `concurrency` lanes. Each lane is one task that
+    runs its chunks in turn, which is what bounds the load a job puts on
+    the database. Returns a list of lanes, each a list of [low, high).
+    """
+    config = get_config()
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    concurrency = concurrency or config['CONCURRENCY']
+    if chunk_size < 1 or concurrency < 1:
+        raise MaintenanceError("chunk_size and concurrency must be positive.")
+
+    bounds = get_job(name).queryset(options or {}).aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    chunks = [[start, start + chunk_size] for start in range(bounds['low'], bounds['high'] + 1, chunk_size)]
+    # Dealt round-robin so every lane covers the whole id range evenly
+    return [chunks[lane::concurrency] for lane in range(min(concurrency, len(chunks)))]
+
+
+def run_lane(name, ranges, options=None):
+    job = get_job(name)
+    totals = Counter()
+    for low, high in ranges:
+        totals.update(job.run_chunk(low, high, options or {}))
+        totals['chunks'] += 1
+    return dict(totals)
+
+
+def combine(results):
+    totals = Counter()
+    for result in results:
+        totals.update(result)
+    return dict(totals)
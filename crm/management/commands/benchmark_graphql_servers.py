@@ -0,0 +1,94 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+DEFAULT_QUERY = """
+{
+  allOrdersKeyset(first: 20) {
+    edges { node { totalAmount customer { name email } products(first: 5) { edges { node { name price } } } } }
+  }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares requests per second and latency of /graphql under WSGI "
+        "(a fixed number of worker threads) with /graphql/async under ASGI "
+        "(one event loop), for the same query and number of concurrent clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per server.")
+        parser.add_argument('--concurrency', type=int, default=20, help="Clients sending requests at once.")
+        parser.add_argument('--workers', type=int, default=4, help="WSGI worker threads.")
+        parser.add_argument('--query', default=DEFAULT_QUERY, help="GraphQL document to send.")
+
+    def handle(self, *args, **options):
+        body = json.dumps({'query': options['query']})
+        # The test clients send requests for the 'testserver' host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = [
+                ('WSGI /graphql', self.run_wsgi(body, options)),
+                ('ASGI /graphql/async', asyncio.run(self.run_asgi(body, options))),
+            ]
+
+        self.stdout.write(f"{'server':<22}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, (elapsed, latencies, errors) in results:
+            self.stdout.write(
+                f"{name:<22}{len(latencies) / elapsed:>10.1f}"
+                f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}{errors:>8}"
+            )
+
+    def run_wsgi(self, body, options):
+        # Clients queue for one of `workers` threads, like a WSGI server's pool
+        workers = threading.Semaphore(options['workers'])
+        local = threading.local()
+
+        def send():
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            started = time.perf_counter()
+            with workers:
+                response = client.post('/graphql', body, content_type='application/json')
+            return time.perf_counter() - started, response.status_code != 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as clients:
+            outcomes = list(clients.map(lambda _: send(), range(options['requests'])))
+        return summarize(time.perf_counter() - started, outcomes)
+
+    async def run_asgi(self, body, options):
+        client = AsyncClient()
+        pending = iter(range(options['requests']))
+        outcomes = []
+
+        async def send_all():
+            for _ in pending:
+                started = time.perf_counter()
+                response = await client.post('/graphql/async', body, content_type='application/json')
+                outcomes.append((time.perf_counter() - started, response.status_code != 200))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send_all() for _ in range(options['concurrency'])))
+        return summarize(time.perf_counter() - started, outcomes)
+
+
+def summarize(elapsed, outcomes):
+    latencies = [latency * 1000 for latency, _ in outcomes]
+    errors = sum(failed for _, failed in outcomes)
+    return elapsed, latencies, errors
+
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
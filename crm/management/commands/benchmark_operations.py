@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crm.benchmarks import BASELINE_PATH, SIZES, compare, load_baseline, run_suite, update_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the canonical GraphQL operations against seeded SQLite databases "
+        "of several sizes and fails when one exceeds its SQL query budget or "
+        "is slower than the committed baseline by more than --tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per operation; the median is reported.")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed slowdown against the baseline, as a fraction.")
+        parser.add_argument('--no-timing', action='store_true', help="Check query budgets only.")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help=f"Record these timings in {BASELINE_PATH.name} instead of comparing.")
+
+    def handle(self, *args, **options):
+        def progress(size, name, ms, queries):
+            self.stdout.write(f"{size:<8}{name:<26}{ms:>10.1f}{queries:>9}")
+
+        # A throwaway test database, so the seeding never touches real data
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"{'size':<8}{'operation':<26}{'ms':>10}{'queries':>9}")
+            results = run_suite(options['sizes'], options['repeat'], progress)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['update_baseline']:
+            update_baseline(results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {BASELINE_PATH}."))
+            return
+
+        failures = compare(results, load_baseline(), options['tolerance'], check_time=not options['no_timing'])
+        if failures:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All operations within their budgets."))
@@ -0,0 +1,79 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+FIRST_NAMES = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi', 'ivan', 'judy', 'mallory', 'oscar']
+LAST_NAMES = ['smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis', 'martinez', 'lopez']
+DOMAINS = ['example.com', 'mail.org', 'corp.net', 'shop.io']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares LIKE '%term%' scans with the FTS5 trigram index used by "
+        "crm.search, on a scratch SQLite database of synthetic customers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query; the mean is reported.")
+        parser.add_argument('--terms', nargs='+', default=['smith', 'grace mar', 'lopez4242', 'corp.n'])
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'search.sqlite3'))
+            try:
+                self.populate(db, options['rows'])
+                started = time.perf_counter()
+                db.execute(
+                    "CREATE VIRTUAL TABLE customer_fts USING fts5("
+                    "name, email, content='customer', content_rowid='id', tokenize='trigram')"
+                )
+                db.execute("INSERT INTO customer_fts(customer_fts) VALUES ('rebuild')")
+                db.commit()
+                self.stdout.write(f"Indexed {options['rows']} rows in {time.perf_counter() - started:.1f}s\n")
+
+                # A filtered connection runs both: its first page and its totalCount
+                self.stdout.write(f"{'term':<14}{'query':<7}{'matches':>9}{'LIKE ms':>10}{'FTS5 ms':>10}{'speedup':>9}")
+                for term in options['terms']:
+                    for name, select, suffix in (('page', 'id', ' ORDER BY id LIMIT 20'), ('count', 'COUNT(*)', '')):
+                        like_ms, like_rows = self.time(
+                            db, f"SELECT {select} FROM customer WHERE name LIKE ?{suffix}",
+                            [f'%{term}%'], options['repeat'],
+                        )
+                        fts_ms, fts_rows = self.time(
+                            db, f"SELECT {select} FROM customer WHERE id IN ("
+                                f"SELECT rowid FROM customer_fts WHERE customer_fts MATCH ?){suffix}",
+                            ['name : "{}"'.format(term.replace('"', '""'))], options['repeat'],
+                        )
+                        if like_rows != fts_rows:
+                            raise CommandError(f"LIKE and FTS5 results differ for {term!r}")
+                        matches = len(like_rows) if name == 'page' else like_rows[0][0]
+                        self.stdout.write(
+                            f"{term:<14}{name:<7}{matches:>9}{like_ms:>10.2f}{fts_ms:>10.2f}"
+                            f"{like_ms / max(fts_ms, 1e-6):>8.1f}x"
+                        )
+            finally:
+                db.close()
+
+    def populate(self, db, rows):
+        db.execute("CREATE TABLE customer (id INTEGER PRIMARY KEY, name TEXT, email TEXT)")
+        rng = random.Random(0)
+
+        def generate():
+            for i in range(rows):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                yield f'{first.title()} {last.title()}{i}', f'{first}.{last}{i}@{rng.choice(DOMAINS)}'
+
+        db.executemany("INSERT INTO customer (name, email) VALUES (?, ?)", generate())
+        db.commit()
+
+    @staticmethod
+    def time(db, sql, params, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            ids = db.execute(sql, params).fetchall()
+        return (time.perf_counter() - started) * 1000 / repeat, ids
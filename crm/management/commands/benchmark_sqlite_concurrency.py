@@ -0,0 +1,145 @@
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.test import Client, override_settings
+
+from crm.models import Customer, Product
+from crm.seeding import SeedOptions, seed
+from crm.sqlite_tuning import SQLITE_DEFAULT_PRAGMAS, current_pragmas, get_config
+
+from .benchmark_graphql_servers import percentile
+
+READ_QUERY = """
+{
+  allProducts(first: 20, orderBy: "-price") {
+    edges { node { id name price stock } }
+  }
+}
+"""
+
+WRITE_QUERY = """
+mutation ($input: OrderInput!) {
+  createOrder(input: $input) { order { id totalAmount } }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent allProducts readers and createOrder writers against "
+        "a seeded SQLite file, first with the SQLite defaults (rollback "
+        "journal, deferred transactions, a connection per request) and then "
+        "with the tuned profile of SQLITE_TUNING and DATABASES, and compares "
+        "their throughput, latency and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration of each run.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark is for SQLite databases.")
+        profiles = [
+            ('default', SQLITE_DEFAULT_PRAGMAS, {'CONN_MAX_AGE': 0, 'OPTIONS': {}}),
+            ('tuned', get_config()['PRAGMAS'], {
+                'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+            }),
+        ]
+
+        # A throwaway database file: WAL only exists for databases on disk
+        directory = tempfile.TemporaryDirectory()
+        connection.settings_dict['TEST']['NAME'] = str(Path(directory.name) / 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed(SeedOptions(customers=1_000, products=200, orders=5_000, clear=True))
+            context = {
+                'customer_ids': list(Customer.objects.values_list('pk', flat=True)),
+                'product_ids': list(Product.objects.filter(stock__gte=100).values_list('pk', flat=True)),
+            }
+            results = [(name, self.run_profile(pragmas, database, context, options)) for name, pragmas, database in profiles]
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            directory.cleanup()
+
+        self.stdout.write(
+            f"{'profile':<10}{'reads/s':>10}{'read p50':>10}{'read p99':>10}"
+            f"{'writes/s':>10}{'write p50':>10}{'write p99':>10}{'errors':>8}"
+        )
+        for name, result in results:
+            self.stdout.write(
+                f"{name:<10}{result['reads'] / options['seconds']:>10.1f}"
+                f"{percentile(result['read_ms'], 50):>10.1f}{percentile(result['read_ms'], 99):>10.1f}"
+                f"{result['writes'] / options['seconds']:>10.1f}"
+                f"{percentile(result['write_ms'], 50):>10.1f}{percentile(result['write_ms'], 99):>10.1f}"
+                f"{result['errors']:>8}"
+            )
+            self.stdout.write(f"    {result['pragmas']}")
+
+    def run_profile(self, pragmas, database, context, options):
+        settings_dict = connections.settings[connection.alias]
+        saved = {key: settings_dict.get(key) for key in database}
+        # Connections opened from here on get this profile
+        connections.close_all()
+        settings_dict.update(database)
+        result = {'reads': 0, 'writes': 0, 'errors': 0, 'read_ms': [], 'write_ms': []}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def work(write):
+            client = Client()
+            rng = random.Random()
+            try:
+                while time.perf_counter() < deadline:
+                    if write:
+                        variables = {'input': {
+                            'customerId': rng.choice(context['customer_ids']),
+                            'productIds': rng.sample(context['product_ids'], 2),
+                        }}
+                        body = json.dumps({'query': WRITE_QUERY, 'variables': variables})
+                    else:
+                        body = json.dumps({'query': READ_QUERY})
+                    started = time.perf_counter()
+                    response = client.post('/graphql', body, content_type='application/json')
+                    elapsed = (time.perf_counter() - started) * 1000
+                    failed = response.status_code != 200 or bool(response.json().get('errors'))
+                    # The end of a request, which closes the connection
+                    # unless CONN_MAX_AGE keeps it
+                    close_old_connections()
+                    with lock:
+                        if failed:
+                            result['errors'] += 1
+                        else:
+                            result['writes' if write else 'reads'] += 1
+                            result['write_ms' if write else 'read_ms'].append(elapsed)
+            finally:
+                connection.close()
+
+        # Measure the database, not the result cache or the slow log
+        with override_settings(
+            SQLITE_TUNING={'ENABLED': True, 'PRAGMAS': pragmas},
+            GRAPHQL_RESULT_CACHE={'ENABLED': False},
+            GRAPHQL_SLOW_LOG={'ENABLED': False},
+            ALLOWED_HOSTS=['testserver'],
+        ):
+            try:
+                result['pragmas'] = current_pragmas(connection, ['journal_mode', 'synchronous', 'mmap_size'])
+                connection.close()
+                threads = [threading.Thread(target=work, args=(False,)) for _ in range(options['readers'])]
+                threads += [threading.Thread(target=work, args=(True,)) for _ in range(options['writers'])]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                settings_dict.update(saved)
+        return result
+
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.export import DEFAULT_CHUNK_SIZE, EXPORTS, ENCODERS, ExportError, stream_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams customers, products or orders to a file (or stdout) as CSV or "
+        "NDJSON, e.g. export_data orders --filter customer_name=smith --gzip -o orders.csv.gz"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=list(ENCODERS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help="A FilterSet argument, e.g. order_date_gte=2025-01-01. Repeatable.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('-o', '--output', help="File to write; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options['filter']:
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"--filter expects NAME=VALUE, got '{item}'.")
+            params[key] = value
+        try:
+            content = stream_export(options['name'], params, options['format'], options['gzip'], options['chunk_size'])
+        except ExportError as e:
+            raise CommandError(e)
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for piece in content:
+                output.write(piece)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
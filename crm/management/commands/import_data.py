@@ -0,0 +1,74 @@
+import codecs
+import csv
+import gzip
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.imports import DEFAULT_BATCH_SIZE, FORMATS, IMPORTERS, ImportDataError, import_records, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams customers, products or orders from a CSV or NDJSON file (optionally "
+        "gzipped) into the database in validated, upserted batches. Committed "
+        "progress is checkpointed so an interrupted import can be --resume'd; "
+        "rejected rows are written to an error report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--checkpoint', help="Defaults to <path>.checkpoint.json.")
+        parser.add_argument('--errors', help="Error report; defaults to <path>.errors.csv.")
+        parser.add_argument('--resume', action='store_true', help="Skip the rows the checkpoint says are done.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        stem = path[:-3] if path.endswith('.gz') else path
+        format = options['format'] or os.path.splitext(stem)[1].lstrip('.')
+        if format not in FORMATS:
+            raise CommandError(f"Cannot tell the format of '{path}'; pass --format.")
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint.json'
+        errors_path = options['errors'] or f'{path}.errors.csv'
+
+        start = 0
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                start = json.load(f)['row']
+
+        def save_checkpoint(row):
+            # Written after the batch commits; replaced atomically
+            with open(f'{checkpoint_path}.tmp', 'w') as f:
+                json.dump({'name': options['name'], 'path': path, 'row': row}, f)
+            os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
+
+        raw = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+        # Resumed runs add to the report of the run they continue
+        with raw, open(errors_path, 'a' if start else 'w', newline='') as report:
+            writer = csv.writer(report)
+            if not start:
+                writer.writerow(['row', 'error', 'record'])
+
+            def report_error(row, record, message):
+                writer.writerow([row, message, json.dumps(record, default=str)])
+
+            lines = codecs.iterdecode(raw, 'utf-8-sig')
+            try:
+                result = import_records(
+                    options['name'], read_records(lines, format), options['batch_size'],
+                    start=start, on_batch=save_checkpoint, on_error=report_error,
+                )
+            except (ImportDataError, ValueError) as e:
+                raise CommandError(e)
+
+        if start:
+            self.stdout.write(f"Resumed after row {start}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.written} of {result.rows} rows in {result.seconds:.1f}s "
+            f"({result.rate:.0f} rows/s); {result.errors} rejected"
+            + (f", see {errors_path}." if result.errors else ".")
+        ))
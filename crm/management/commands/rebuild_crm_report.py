@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.models import CRMReport
+
+
+class Command(BaseCommand):
+    help = "Recomputes the CRMReport totals from the Customer and Order tables."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            report = CRMReport.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"CRM report rebuilt: {report.total_customers} customers, "
+            f"{report.total_orders} orders, {report.total_revenue} revenue."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from crm.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index from the Customer and Product tables."
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.customer_stats import DEFAULT_CHUNK_SIZE, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares each customer's stored order_count, lifetime_value and "
+        "last_order_at with its orders and repairs the ones that drifted. "
+        "For the whole table on Celery workers, use run_maintenance "
+        "reconcile_customer_stats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Customer ids per transaction.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        self.verbosity = options['verbosity']
+        checked, repaired = reconcile(options['chunk_size'], progress=self.progress)
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} customers, repaired {repaired}."))
+
+    def progress(self, checked, repaired):
+        if self.verbosity > 1:
+            self.stdout.write(f"  {checked} checked, {repaired} repaired")
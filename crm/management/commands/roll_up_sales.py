@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from crm import sales_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds the orders created since the last run to the daily sales "
+        "rollups, as the roll_up_sales Celery task does; with --rebuild, "
+        "recomputes them from every order."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Empty the rollups and roll every order up again.")
+        parser.add_argument('--batch-size', type=int, help="Orders per transaction; defaults to CRM_SALES_ROLLUPS['BATCH_SIZE'].")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            result = sales_rollups.rebuild(options['batch_size'])
+        else:
+            result = sales_rollups.roll_up(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {result.days} stale days. Rolled up {result.orders} orders in {result.batches} batches, "
+            f"through order {result.last_order_id}."
+        ))
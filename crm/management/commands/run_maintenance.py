@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.maintenance import JOBS, MaintenanceError
+from crm.tasks import start_maintenance
+
+
+class Command(BaseCommand):
+    help = (
+        "Fans a maintenance job out to the Celery workers in chunks of ids "
+        "(see crm/maintenance.py) and, with --wait, prints its combined counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('job', choices=sorted(JOBS))
+        parser.add_argument('--chunk-size', type=int, help="Ids per chunk; defaults to CRM_MAINTENANCE['CHUNK_SIZE'].")
+        parser.add_argument('--concurrency', type=int, help="Chunks running at once; defaults to CRM_MAINTENANCE['CONCURRENCY'].")
+        parser.add_argument('--threshold', type=int, default=10, help="restock: products below this stock.")
+        parser.add_argument('--increment', type=int, default=10, help="restock: stock added to each.")
+        parser.add_argument('--wait', action='store_true', help="Wait for the job and print its counts.")
+
+    def handle(self, *args, **options):
+        job_options = {'threshold': options['threshold'], 'increment': options['increment']} if options['job'] == 'restock' else {}
+        try:
+            result = start_maintenance(options['job'], options['chunk_size'], options['concurrency'], job_options)
+        except MaintenanceError as e:
+            raise CommandError(str(e))
+        if result is None:
+            self.stdout.write("Nothing to do.")
+        elif options['wait']:
+            self.stdout.write(self.style.SUCCESS(f"{options['job']}: {result.get()}"))
+        else:
+            self.stdout.write(f"Started {options['job']} as {result.id}.")
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.seeding import SeedOptions, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic customers, products and orders for load and "
+        "scale testing, e.g. --orders 1000000 --workers 4. The same options "
+        "and --seed always produce the same rows."
+    )
+
+    def add_arguments(self, parser):
+        defaults = SeedOptions()
+        parser.add_argument('--customers', type=int, default=defaults.customers)
+        parser.add_argument('--products', type=int, default=defaults.products)
+        parser.add_argument('--orders', type=int, default=defaults.orders)
+        parser.add_argument('--products-per-order', nargs=2, type=int, metavar=('MIN', 'MAX'),
+                            default=[defaults.min_products_per_order, defaults.max_products_per_order])
+        parser.add_argument('--days', type=int, default=defaults.days,
+                            help="Spread order dates over this many days before now.")
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--chunk-size', type=int, default=defaults.chunk_size,
+                            help="Rows per bulk insert and per transaction.")
+        parser.add_argument('--workers', type=int, default=defaults.workers,
+                            help="Processes generating rows; the writes stay in this process.")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete all customers, products and orders first.")
+
+    def handle(self, *args, **options):
+        low, high = options['products_per_order']
+        if not 1 <= low <= high:
+            raise CommandError("--products-per-order needs 1 <= MIN <= MAX.")
+        if options['chunk_size'] < 1 or options['workers'] < 1 or options['days'] < 0:
+            raise CommandError("--chunk-size and --workers must be positive and --days not negative.")
+        seed_options = SeedOptions(
+            customers=options['customers'],
+            products=options['products'],
+            orders=options['orders'],
+            min_products_per_order=low,
+            max_products_per_order=high,
+            days=options['days'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            clear=options['clear'],
+        )
+
+        written = {}
+
+        def progress(table, rows):
+            written[table] = written.get(table, 0) + rows
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {table}: {written[table]} rows")
+
+        started = time.perf_counter()
+        try:
+            stats = seed(seed_options, progress)
+        except ValueError as e:
+            raise CommandError(e)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"{'table':<16}{'rows':>12}{'rows/s':>12}")
+        for table, rows in stats.rows.items():
+            self.stdout.write(f"{table:<16}{rows:>12}{stats.rate(table):>12.0f}")
+        total = sum(stats.rows.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s overall)."
+        ))
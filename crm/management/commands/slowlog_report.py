@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.slowlog import log_path, read_entries, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarizes the GraphQL slow log: the operations that spent the most "
+        "time over the threshold, their latencies, SQL query counts and the "
+        "statement each repeated most within one request (a likely N+1)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Slow log file; defaults to GRAPHQL_SLOW_LOG['PATH'].")
+        parser.add_argument('--top', type=int, default=10)
+
+    def handle(self, *args, **options):
+        path = options['path'] or log_path()
+        try:
+            summaries = summarize(read_entries(path))
+        except ValueError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        if not summaries:
+            self.stdout.write(f"No slow operations in {path}.")
+            return
+
+        self.stdout.write(
+            f"{'operation':<32}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'avg SQL':>9}"
+        )
+        for summary in summaries[:options['top']]:
+            self.stdout.write(
+                f"{summary['operation'][:31]:<32}{summary['count']:>7}{summary['p50_ms']:>10.1f}"
+                f"{summary['p95_ms']:>10.1f}{summary['max_ms']:>10.1f}{summary['avg_sql_queries']:>9.1f}"
+            )
+            if summary['repeats'] > 1:
+                self.stdout.write(f"    repeated {summary['repeats']}x: {summary['repeated_sql'][:200]}")
@@ -0,0 +1,25 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.db_router import copy_to_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the primary SQLite database over the read replicas of "
+        "CRM_DATABASE_ROUTING['REPLICAS'], for trying the read/write router "
+        "locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*', help="Aliases to refresh; all replicas by default.")
+
+    def handle(self, *args, **options):
+        try:
+            copied = copy_to_replicas(options['replicas'] or None)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        if not copied:
+            self.stdout.write("No replicas configured.")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Copied the primary database to: {', '.join(copied)}."))
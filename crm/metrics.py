@@ -0,0 +1,359 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from inspect import isawaitable
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from . import slowlog
+from .async_execution import DEFAULT_RESOLVERS
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Resolvers faster than this are not recorded individually
+    'RESOLVER_THRESHOLD_MS': 1.0,
+    # Add each operation's timings to the response `extensions`
+    'EXTENSIONS': False,
+    # Distinct operation names kept as labels; the rest count as 'other'
+    'MAX_OPERATIONS': 200,
+    # Bearer token that lets scrapers read /metrics without a staff
+    # session; None allows staff only
+    'SCRAPE_TOKEN': None,
+}
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# The metrics of the request being handled, set by GraphQLMetricsMiddleware.
+# Context variables follow the request into sync_to_async threads.
+_current = ContextVar('graphql_request_metrics', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_METRICS', {})}
+
+
+class Histogram:
+    """A Prometheus histogram with a fixed set of label names."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, [list(counts), total, count]) for labels, (counts, total, count) in self.series.items())
+        for label_values, (counts, total, count) in series:
+            labels = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """The histograms of this process, rendered by the /metrics endpoint."""
+
+    def __init__(self):
+        self.phases = Histogram(
+            'graphql_operation_phase_seconds', 'Time spent parsing, validating and executing GraphQL operations.',
+            ('operation', 'phase'), SECONDS_BUCKETS,
+        )
+        self.resolvers = Histogram(
+            'graphql_resolver_seconds', 'Time spent in resolvers slower than the configured threshold.',
+            ('operation', 'field'), SECONDS_BUCKETS,
+        )
+        self.sql_queries = Histogram(
+            'graphql_operation_sql_queries', 'SQL queries issued per GraphQL operation.',
+            ('operation',), QUERY_COUNT_BUCKETS,
+        )
+        self.sql_seconds = Histogram(
+            'graphql_operation_sql_seconds', 'Time spent in SQL per GraphQL operation.',
+            ('operation',), SECONDS_BUCKETS,
+        )
+        self.operations = set()
+        self.lock = threading.Lock()
+
+    def operation_label(self, name):
+        with self.lock:
+            if name in self.operations:
+                return name
+            if len(self.operations) < get_config()['MAX_OPERATIONS']:
+                self.operations.add(name)
+                return name
+        return 'other'
+
+    def record(self, operation):
+        label = self.operation_label(operation.name)
+        for phase, seconds in operation.phases.items():
+            self.phases.observe(seconds, label, phase)
+        for field, seconds in operation.resolvers:
+            self.resolvers.observe(seconds, label, field)
+        self.sql_queries.observe(operation.sql_queries, label)
+        self.sql_seconds.observe(operation.sql_seconds, label)
+
+    def render(self):
+        lines = []
+        for histogram in (self.phases, self.resolvers, self.sql_queries, self.sql_seconds):
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for histogram in (self.phases, self.resolvers, self.sql_queries, self.sql_seconds):
+            histogram.clear()
+        with self.lock:
+            self.operations.clear()
+
+
+registry = Registry()
+
+
+class OperationMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.phases = {}
+        self.resolvers = []
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        # Kept for the slow log (see slowlog.py) when it is enabled
+        self.document = None
+        self.variables = None
+        self.resolver_paths = []
+        self.statements = []
+
+    def as_extension(self):
+        return {
+            'operation': self.name,
+            **{f'{phase}Ms': round(seconds * 1000, 3) for phase, seconds in self.phases.items()},
+            'sqlQueries': self.sql_queries,
+            'sqlMs': round(self.sql_seconds * 1000, 3),
+            'resolvers': [{'field': field, 'ms': round(seconds * 1000, 3)} for field, seconds in self.resolvers],
+        }
+
+
+class RequestMetrics:
+    """
+    What one HTTP request spent, per GraphQL operation (a batch request
+    has several). Work done before the view names the operation (parsing,
+    validation) is held until it does.
+    """
+
+    def __init__(self, capture_statements=0, path_threshold=None):
+        self.operations = []
+        self.pending = OperationMetrics(None)
+        # For the slow log: statements kept per operation (0 keeps none)
+        # and the seconds above which a resolver's path is kept
+        self.capture_statements = capture_statements
+        self.path_threshold = path_threshold
+        # Resolvers may run on several threads under ASGI
+        self.lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self.operations[-1] if self.operations else self.pending
+
+    def begin_operation(self, name, document=None, variables=None):
+        operation = self.pending
+        operation.name = name or 'anonymous'
+        operation.document = document
+        operation.variables = variables
+        self.operations.append(operation)
+        self.pending = OperationMetrics(None)
+        return operation
+
+    def add_phase(self, phase, seconds):
+        with self.lock:
+            target = self.current if phase == 'execute' else self.pending
+            target.phases[phase] = target.phases.get(phase, 0.0) + seconds
+
+    def add_resolver(self, field, seconds):
+        with self.lock:
+            self.current.resolvers.append((field, seconds))
+
+    def add_resolver_path(self, path, seconds):
+        with self.lock:
+            self.current.resolver_paths.append((path, seconds))
+
+    def add_query(self, seconds, sql=None, params=None, alias=None):
+        with self.lock:
+            operation = self.current
+            operation.sql_queries += 1
+            operation.sql_seconds += seconds
+            if len(operation.statements) < self.capture_statements:
+                operation.statements.append((sql, params, alias, seconds))
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """Times the block as a phase of the current request's operation, if any."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_phase(name, time.perf_counter() - started)
+
+
+def time_execution(result, started):
+    """Records the execute phase once `result`, possibly awaitable, is done."""
+    metrics = _current.get()
+    if metrics is None:
+        return result
+    if isawaitable(result):
+        async def await_result():
+            value = await result
+            metrics.add_phase('execute', time.perf_counter() - started)
+            return value
+        return await_result()
+    metrics.add_phase('execute', time.perf_counter() - started)
+    return result
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """
+    A connection.execute_wrapper, installed on every connection by
+    install_sql_wrapper(); counts queries run on behalf of a request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(time.perf_counter() - started, sql, None if many else params, context['connection'].alias)
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    # connection_created fires on every (re)connect of a thread's
+    # connection; its wrappers outlive the database connection
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+class ResolverTimingMiddleware:
+    """
+    Graphene middleware that records resolvers slower than
+    RESOLVER_THRESHOLD_MS. Attribute lookups are not timed at all, which
+    keeps the cost per field to two clock reads for the others.
+    """
+
+    def __init__(self):
+        self.threshold = get_config()['RESOLVER_THRESHOLD_MS'] / 1000
+
+    def resolve(self, next, root, info, **args):
+        metrics = _current.get()
+        if metrics is None or is_default_resolver(next):
+            return next(root, info, **args)
+        started = time.perf_counter()
+        result = next(root, info, **args)
+        if isawaitable(result):
+            return self.await_result(metrics, info, result, started)
+        self.record(metrics, info, time.perf_counter() - started)
+        return result
+
+    async def await_result(self, metrics, info, result, started):
+        value = await result
+        self.record(metrics, info, time.perf_counter() - started)
+        return value
+
+    def record(self, metrics, info, seconds):
+        if seconds >= self.threshold:
+            metrics.add_resolver(f'{info.parent_type.name}.{info.field_name}', seconds)
+        if metrics.path_threshold is not None and seconds >= metrics.path_threshold:
+            metrics.add_resolver_path(info.path.as_list(), seconds)
+
+
+def is_default_resolver(resolver):
+    while isinstance(resolver, partial):
+        resolver = resolver.func
+    return resolver in DEFAULT_RESOLVERS
+
+
+class GraphQLMetricsMiddleware:
+    """
+    Django middleware that collects a request's metrics (see
+    RequestMetrics) and adds those of its GraphQL operations to the
+    process-wide registry once the response is ready.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = get_config()['ENABLED']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        metrics = RequestMetrics(*slowlog.capture_options())
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            self.record(metrics)
+            slowlog.maybe_log(metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        metrics = RequestMetrics(*slowlog.capture_options())
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
+            self.record(metrics)
+            elapsed = time.perf_counter() - started
+            if slowlog.is_slow(metrics, elapsed):
+                # EXPLAIN needs the database
+                await sync_to_async(slowlog.maybe_log)(metrics, elapsed)
+
+    @staticmethod
+    def record(metrics):
+        for operation in metrics.operations:
+            registry.record(operation)
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+def populate_report(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+    CRMReport = apps.get_model('crm', 'CRMReport')
+    totals = Order.objects.aggregate(
+        total_orders=models.Count('id'),
+        total_revenue=models.Sum('total_amount'),
+    )
+    CRMReport.objects.create(
+        pk=1,
+        total_customers=Customer.objects.count(),
+        total_orders=totals['total_orders'],
+        total_revenue=totals['total_revenue'] or 0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CRMReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_customers', models.PositiveIntegerField(default=0)),
+                ('total_orders', models.PositiveIntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_report, migrations.RunPython.noop),
+    ]
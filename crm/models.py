@@ -1,6 +1,11 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 
+from .result_cache import invalidate_models
+
 # Create your models here.
 class Customer(models.Model):
     name = models.CharField(max_length=100)
@@ -8,10 +13,44 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Lifetime totals of the customer's orders, kept up to date by
+    # record_order() so they can be filtered and sorted on without
+    # aggregating orders; `manage.py reconcile_customer_stats` repairs them
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # (sort key, id) indexes backing the keyset paginated connections
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['name', 'id']),
+            models.Index(fields=['order_count', 'id']),
+            models.Index(fields=['lifetime_value', 'id']),
+            models.Index(fields=['last_order_at', 'id']),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def record_order(cls, pk, amount, order_date):
+        """
+        Adds an order to the customer's lifetime totals in one UPDATE, in
+        the caller's transaction. Returns False when there is no such
+        customer.
+        """
+        order_date = models.Value(order_date, output_field=models.DateTimeField())
+        updated = cls.objects.filter(pk=pk).update(
+            order_count=models.F('order_count') + 1,
+            lifetime_value=models.F('lifetime_value') + amount,
+            last_order_at=Greatest(Coalesce('last_order_at', order_date), order_date),
+        )
+        if updated:
+            # update() sends no post_save signal
+            invalidate_models(cls)
+        return bool(updated)
+
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
@@ -20,6 +59,13 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['stock', 'id']),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -31,5 +77,159 @@ class Order(models.Model):
     order_date = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date', 'id']),
+            models.Index(fields=['total_amount', 'id']),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.customer.name}"
+
+
+class OrderReminder(models.Model):
+    """
+    An order the reminder job has handled. Its presence keeps reruns of
+    the job (and the pendingOrders query) from picking the order up again.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='reminder')
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Reminder for order {self.order_id}"
+
+
+class DailySales(models.Model):
+    """
+    Order totals per day of order_date, rolled up incrementally by
+    crm/sales_rollups.py so analytics queries read one row per day
+    instead of every order.
+    """
+    day = models.DateField(primary_key=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Sales on {self.day}"
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue per (day, product), rolled up with DailySales."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        # Also the index for date range scans
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='crm_dailyproductsales_day_product'),
+        ]
+
+    def __str__(self):
+        return f"Sales of product {self.product_id} on {self.day}"
+
+
+class StaleSalesDay(models.Model):
+    """
+    A day whose already rolled up orders were changed or deleted; the
+    next rollup run recomputes its rows from the orders.
+    """
+    day = models.DateField(primary_key=True)
+
+    def __str__(self):
+        return f"Stale sales of {self.day}"
+
+
+class SalesRollupWatermark(models.Model):
+    """The id of the last order the sales rollups include, in a single row."""
+    last_order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    SINGLETON_ID = 1
+
+
+class CRMReport(models.Model):
+    """
+    Running CRM totals kept in a single row, so the crmReport query reads
+    one row instead of scanning customers and orders. The mutations that
+    create customers and orders bump it inside their own transactions,
+    deletes take their rows back off through delete signals (see
+    connect_report_signals). Migration 0004 creates the row;
+    `manage.py rebuild_crm_report` recomputes it from scratch.
+    """
+    total_customers = models.PositiveIntegerField(default=0)
+    total_orders = models.PositiveIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    SINGLETON_ID = 1
+
+    @classmethod
+    def get(cls):
+        """The report row, or an unsaved report computed now if it is missing."""
+        report = cls.objects.filter(pk=cls.SINGLETON_ID).first()
+        return report or cls(pk=cls.SINGLETON_ID, **cls.compute())
+
+    @classmethod
+    def increment(cls, customers=0, orders=0, revenue=0):
+        # Floored at 0: a report that drifted low must not make deletes fail
+        # the counters' CHECK constraints; rebuild() repairs the drift
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            total_customers=Greatest(models.F('total_customers') + customers, 0),
+            total_orders=Greatest(models.F('total_orders') + orders, 0),
+            total_revenue=models.F('total_revenue') + revenue,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            # First write: the rebuild already counts this transaction's rows
+            cls.rebuild()
+        else:
+            invalidate_models(cls)
+
+    @classmethod
+    def compute(cls):
+        totals = Order.objects.aggregate(
+            total_orders=models.Count('id'),
+            total_revenue=models.Sum('total_amount'),
+        )
+        return {
+            'total_customers': Customer.objects.count(),
+            'total_orders': totals['total_orders'],
+            # SQLite sums decimals as floats
+            'total_revenue': (totals['total_revenue'] or Decimal('0')).quantize(Decimal('0.01')),
+        }
+
+    @classmethod
+    def rebuild(cls):
+        report, _ = cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults=cls.compute())
+        return report
+
+
+def deleted_with_customer(origin):
+    """Whether a delete signal's `origin` is a delete of customers, which cascades to their orders."""
+    return isinstance(origin, Customer) or (isinstance(origin, models.QuerySet) and origin.model is Customer)
+
+
+def report_customer_deleting(sender, instance, **kwargs):
+    # Takes the customer's orders off in the same UPDATE; their own
+    # post_delete skips them. Runs inside the delete's transaction.
+    totals = instance.orders.aggregate(orders=models.Count('id'), revenue=models.Sum('total_amount'))
+    CRMReport.increment(customers=-1, orders=-totals['orders'], revenue=-(totals['revenue'] or 0))
+
+
+def report_order_deleted(sender, instance, origin=None, **kwargs):
+    if deleted_with_customer(origin):
+        return
+    CRMReport.increment(orders=-1, revenue=-instance.total_amount)
+
+
+def connect_report_signals():
+    """
+    Keeps CRMReport current through deletes, with one UPDATE per customer
+    however many orders its delete cascades to. QuerySet.update() and raw
+    deletes (see seeding.clear) bypass them and rebuild the report instead.
+    """
+    models.signals.pre_delete.connect(report_customer_deleting, sender=Customer, dispatch_uid='crm_report_customer_deleting')
+    models.signals.post_delete.connect(report_order_deleted, sender=Order, dispatch_uid='crm_report_order_deleted')
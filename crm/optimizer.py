@@ -0,0 +1,131 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode, get_named_type
+
+# Connection arguments that only paginate; anything else is a filter that
+# the relationship's own resolver has to apply per parent.
+PAGINATION_ARGS = {'first', 'last', 'before', 'after', 'offset'}
+
+
+def optimize(queryset, info):
+    """
+    Shapes `queryset` after the selection set of the field being resolved:
+    forward relations are joined with select_related, to-many relations are
+    prefetched with nested Prefetch querysets and every model is narrowed
+    to the selected columns with only().
+    """
+    fields, node_type = node_selections(info.field_nodes, get_named_type(info.return_type), info)
+    return _optimize(queryset, fields, node_type, info)
+
+
+def node_selections(field_nodes, graphql_type, info):
+    """
+    Returns the selected sub-fields of `field_nodes` keyed by field name,
+    stepping through `edges { node }` when the field is a connection.
+    """
+    fields = collect_fields(field_nodes, info)
+    if is_connection(graphql_type):
+        node_type = get_named_type(get_named_type(graphql_type.fields['edges'].type).fields['node'].type)
+        fields = collect_fields(fields.get('edges', []), info)
+        return collect_fields(fields.get('node', []), info), node_type
+    return fields, graphql_type
+
+
+def collect_fields(field_nodes, info):
+    fields = {}
+    for field_node in field_nodes:
+        if field_node.selection_set:
+            _collect(field_node.selection_set, info, fields)
+    return fields
+
+
+def _collect(selection_set, info, fields):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            _collect(selection.selection_set, info, fields)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment:
+                _collect(fragment.selection_set, info, fields)
+
+
+def is_connection(graphql_type):
+    type_fields = getattr(graphql_type, 'fields', None) or {}
+    return 'edges' in type_fields and 'pageInfo' in type_fields
+
+
+def has_filter_arguments(field_nodes):
+    return any(
+        argument.name.value not in PAGINATION_ARGS
+        for field_node in field_nodes
+        for argument in field_node.arguments
+    )
+
+
+def _optimize(queryset, fields, node_type, info, required=()):
+    only, select, prefetch = _plan(queryset.model, fields, node_type, info)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*(
+            Prefetch(lookup, queryset=related_queryset)
+            for lookup, related_queryset in prefetch
+        ))
+    return queryset.only(*only, *required)
+
+
+def _plan(model, fields, node_type, info):
+    """
+    Works out the (only, select_related, prefetch) lookups for one model.
+    A selected field that is not a model field is served by a custom
+    resolver which may read any column, so that model is left unprojected.
+    """
+    opts = model._meta
+    only = [opts.pk.name]
+    related_only = []
+    select = []
+    prefetch = []
+    projectable = True
+
+    for name, field_nodes in fields.items():
+        if name == '__typename':
+            continue
+        try:
+            field = opts.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            projectable = False
+            continue
+
+        if not field.is_relation:
+            only.append(field.name)
+            continue
+
+        graphql_field = node_type.fields[name]
+        sub_fields, sub_node_type = node_selections(field_nodes, get_named_type(graphql_field.type), info)
+
+        if field.concrete and (field.many_to_one or field.one_to_one):
+            only.append(field.name)
+            sub_only, sub_select, sub_prefetch = _plan(field.related_model, sub_fields, sub_node_type, info)
+            select.append(field.name)
+            select.extend(f'{field.name}__{lookup}' for lookup in sub_select)
+            related_only.extend(f'{field.name}__{lookup}' for lookup in sub_only)
+            prefetch.extend((f'{field.name}__{lookup}', qs) for lookup, qs in sub_prefetch)
+        elif not has_filter_arguments(field_nodes):
+            # Reverse foreign keys need the remote column to match rows back up.
+            required = () if field.concrete or field.many_to_many else (field.field.name,)
+            related_queryset = _optimize(
+                field.related_model._default_manager.order_by('pk'),
+                sub_fields,
+                sub_node_type,
+                info,
+                required=required,
+            )
+            accessor = field.name if field.concrete else field.get_accessor_name()
+            prefetch.append((accessor, related_queryset))
+
+    if not projectable:
+        only = [f.name for f in opts.concrete_fields]
+    return only + related_only, select, prefetch
@@ -0,0 +1,144 @@
+import base64
+import json
+from functools import partial
+
+import graphene
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django.settings import graphene_settings
+
+from .async_execution import blocking
+
+
+class KeysetConnection(graphene.relay.Connection):
+    """
+    A connection paginated by keyset (seek) cursors instead of offsets.
+    Each cursor encodes the sort key and the primary key of its row, so
+    any page is a range seek on the (key, id) index, however deep it is.
+    """
+    total_count = graphene.Int()
+
+    class Meta:
+        abstract = True
+
+    @blocking
+    def resolve_total_count(self, info):
+        # Only runs the COUNT(*) when the client selects totalCount
+        return self.iterable.count()
+
+
+def encode_cursor(values):
+    # str() keeps full microsecond precision for datetimes and exact decimals
+    return base64.b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.b64decode(cursor))
+    except ValueError:
+        raise ValidationError(f"Invalid cursor: {cursor}")
+
+
+class KeysetConnectionField(graphene.relay.ConnectionField):
+    """
+    Paginates the queryset returned by its resolver with keyset cursors.
+    `sort_keys` lists the columns clients may pass as `orderBy` (optionally
+    prefixed with '-'); each should be backed by a (column, id) index.
+    """
+
+    def __init__(self, type_, *args, sort_keys=(), default_order_by='pk', **kwargs):
+        self.sort_keys = set(sort_keys)
+        self.default_order_by = default_order_by
+        kwargs.setdefault('order_by', graphene.String())
+        super().__init__(type_, *args, **kwargs)
+
+    def get_sort_key(self, order_by):
+        order_by = order_by or self.default_order_by
+        descending = order_by.startswith('-')
+        key = order_by.lstrip('-')
+        if key in ('id', 'pk'):
+            key = 'pk'
+        elif key not in self.sort_keys:
+            raise ValidationError(
+                f"Cannot order by '{key}'. Choose one of: {', '.join(sorted(self.sort_keys | {'id'}))}."
+            )
+        return key, descending
+
+    def keyset_resolver(self, resolver, connection_type, root, info, **args):
+        queryset = resolver(root, info, **args)
+        key, descending = self.get_sort_key(args.get('order_by'))
+        return self.resolve_page(connection_type, queryset, key, descending, args)
+
+    def resolve_page(self, connection_type, queryset, key, descending, args):
+        first = args.get('first')
+        last = args.get('last')
+        after = args.get('after')
+        before = args.get('before')
+        max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        # Worded as graphql-relay's connection_from_array_slice
+        for name, value in (('first', first), ('last', last)):
+            if value is not None and value < 0:
+                raise ValidationError(f"Argument '{name}' must be a non-negative integer.")
+
+        # Walk backwards from `before` when only `last` is given
+        backwards = last is not None and first is None
+        limit = last if backwards else first
+        # 0 asks for an empty page, only None for the default one
+        limit = max_limit if limit is None else min(limit, max_limit)
+        field = queryset.model._meta.pk if key == 'pk' else queryset.model._meta.get_field(key)
+
+        # Keep the sort key loaded when the optimizer narrowed the columns
+        loaded, deferred = queryset.query.deferred_loading
+        if loaded and not deferred:
+            queryset = queryset.only(*loaded, field.name)
+
+        page = queryset
+        if after:
+            page = page.filter(self.seek(field, key, decode_cursor(after), not descending))
+        if before:
+            page = page.filter(self.seek(field, key, decode_cursor(before), descending))
+
+        ascending = descending == backwards
+        ordering = [key, 'pk'] if ascending else [f'-{key}', '-pk']
+        rows = list(page.order_by(*ordering)[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+
+        edges = [
+            connection_type.Edge(node=row, cursor=encode_cursor([field.value_from_object(row), row.pk]))
+            for row in rows
+        ]
+        connection = connection_type(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_more if backwards else bool(after),
+                has_next_page=bool(before) if backwards else has_more,
+            ),
+        )
+        connection.iterable = queryset
+        return connection
+
+    @staticmethod
+    def seek(field, key, cursor, forwards):
+        """The rows strictly after (or before) `cursor` in (key, id) order."""
+        try:
+            value, pk = cursor
+            value = field.to_python(value)
+        except (TypeError, ValueError, ValidationError):
+            raise ValidationError(f"Invalid cursor value: {cursor}")
+        op = 'gt' if forwards else 'lt'
+        if key == 'pk':
+            return Q(**{f'pk__{op}': pk})
+        # The redundant inclusive bound lets the planner seek on the index
+        return Q(**{f'{key}__{op}e': value}) & (
+            Q(**{f'{key}__{op}': value}) | Q(**{key: value, f'pk__{op}': pk})
+        )
+
+    def wrap_resolve(self, parent_resolver):
+        resolver = super(graphene.relay.ConnectionField, self).wrap_resolve(parent_resolver)
+        return partial(self.keyset_resolver, resolver, self.type)
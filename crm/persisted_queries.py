@@ -0,0 +1,143 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from graphql import GraphQLError, parse, validate
+
+DEFAULTS = {
+    # JSON file of pre-approved operations loaded at startup
+    'REGISTRY': None,
+    # Whether clients may register new query hashes at runtime
+    'ALLOW_REGISTRATION': True,
+    # Cache holding client-registered query text. The default cache is a
+    # LocMemCache, private to each process, so a query registered with one
+    # worker is unknown to the others; use a shared backend (e.g. Redis)
+    # when serving with several
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60 * 60 * 24,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_PERSISTED_QUERIES', {})}
+
+
+def sha256(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+# Errors follow the Apollo automatic persisted queries protocol, which
+# clients recognise by message and `extensions.code`.
+class PersistedQueryNotFound(GraphQLError):
+    def __init__(self):
+        super().__init__('PersistedQueryNotFound', extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'})
+
+
+class PersistedQueryNotSupported(GraphQLError):
+    def __init__(self):
+        super().__init__('PersistedQueryNotSupported', extensions={'code': 'PERSISTED_QUERY_NOT_SUPPORTED'})
+
+
+class PersistedQueryHashMismatch(GraphQLError):
+    def __init__(self):
+        super().__init__('provided sha does not match query', extensions={'code': 'BAD_USER_INPUT'})
+
+
+class PersistedQueryStore:
+    """
+    Maps sha256 hashes to query documents.
+    Operations from the registry file are parsed and validated once when
+    the app starts; client-registered queries are kept as text in the
+    Django cache so every worker can serve them.
+    """
+
+    def __init__(self):
+        self.registry = {}
+
+    def load_registry(self, path, schema):
+        """
+        Loads a registry file: either a plain {"<sha256>": "<query>"} object
+        or an Apollo persisted query manifest with an "operations" list.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if 'operations' in data:
+            data = {operation['id']: operation['body'] for operation in data['operations']}
+
+        registry = {}
+        for query_hash, query in data.items():
+            if sha256(query) != query_hash:
+                raise ImproperlyConfigured(f"Persisted query {query_hash} does not match its sha256 hash.")
+            document = parse(query)
+            errors = validate(schema, document)
+            if errors:
+                raise ImproperlyConfigured(f"Persisted query {query_hash} is invalid: {errors[0].message}")
+            registry[query_hash] = (query, document)
+        self.registry = registry
+
+    def cache_key(self, query_hash):
+        return f'apq:{query_hash}'
+
+    def lookup(self, query_hash):
+        """
+        Returns (query, document) for a known hash. The document is None
+        unless the query came from the pre-validated registry.
+        """
+        if query_hash in self.registry:
+            return self.registry[query_hash]
+        config = get_config()
+        query = caches[config['CACHE_ALIAS']].get(self.cache_key(query_hash))
+        if query is None:
+            raise PersistedQueryNotFound()
+        return query, None
+
+    def register(self, query_hash, query):
+        if query_hash in self.registry:
+            return self.registry[query_hash]
+        config = get_config()
+        if config['ALLOW_REGISTRATION']:
+            caches[config['CACHE_ALIAS']].set(self.cache_key(query_hash), query, config['TIMEOUT'])
+        return query, None
+
+
+store = PersistedQueryStore()
+
+
+def get_persisted_query_extension(request, data):
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise GraphQLError('Extensions are invalid JSON.')
+    if extensions is None:
+        return None
+    if not isinstance(extensions, dict):
+        raise GraphQLError('Extensions must be an object.')
+    persisted_query = extensions.get('persistedQuery')
+    if persisted_query is not None and not isinstance(persisted_query, dict):
+        raise GraphQLError('Extensions are invalid: persistedQuery must be an object.')
+    return persisted_query
+
+
+def resolve_persisted_query(request, data, query):
+    """
+    Applies the APQ protocol to one request and returns (query, document).
+    Requests without the persistedQuery extension pass through unchanged.
+    """
+    persisted_query = get_persisted_query_extension(request, data)
+    if not persisted_query:
+        return query, None
+    if persisted_query.get('version') != 1:
+        raise PersistedQueryNotSupported()
+
+    query_hash = persisted_query.get('sha256Hash')
+    if not isinstance(query_hash, str):
+        raise GraphQLError('Extensions are invalid: persistedQuery.sha256Hash must be a string.')
+    if not query:
+        return store.lookup(query_hash)
+    if sha256(query) != query_hash:
+        raise PersistedQueryHashMismatch()
+    return store.register(query_hash, query)
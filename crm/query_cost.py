@@ -0,0 +1,196 @@
+from django.conf import settings
+from django.core.cache import cache
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLInt,
+    InlineFragmentNode,
+    OperationType,
+    get_named_type,
+    get_nullable_type,
+    is_leaf_type,
+    is_list_type,
+    value_from_ast,
+    value_from_ast_untyped,
+)
+from graphql.pyutils import Undefined
+
+DEFAULTS = {
+    # Deepest nesting of object fields a document may request
+    'MAX_DEPTH': 10,
+    # Most expensive document that may run, in cost units
+    'MAX_COST': 50000,
+    # Assumed size of connections without first/last and of plain lists
+    'DEFAULT_LIST_SIZE': 100,
+    # Weights keyed by 'Type.field' or 'Type'; object fields default to 1,
+    # scalars to 0 and root mutation fields to MUTATION_WEIGHT
+    'FIELD_WEIGHTS': {},
+    'MUTATION_WEIGHT': 10,
+    # Cost units one client (by IP) may spend per minute, or None
+    'CLIENT_BUDGET_PER_MINUTE': None,
+    # Report the computed cost in the response `extensions`
+    'REPORT': True,
+}
+
+# Connection plumbing that does not count as a level of nesting
+CONNECTION_FIELDS = {'edges', 'node', 'pageInfo'}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_QUERY_COST', {})}
+
+
+class QueryCostError(GraphQLError):
+    def __init__(self, message, code, cost):
+        super().__init__(message, extensions={'code': code, 'cost': cost})
+
+
+class QueryCostAnalyzer:
+    """
+    Estimates how expensive an operation is before it executes.
+    Every selected object field costs its weight plus the cost of its
+    selections; connections multiply their selections by `first`/`last`
+    (or DEFAULT_LIST_SIZE) and plain lists multiply by DEFAULT_LIST_SIZE.
+    Derived from the schema, so no field needs annotating by hand.
+    """
+
+    def __init__(self, schema, document, operation, variables, config):
+        self.schema = schema
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if definition.kind == 'fragment_definition'
+        }
+        self.variables = self.variable_values(operation, variables or {})
+        self.config = config
+
+    @staticmethod
+    def variable_values(operation, variables):
+        values = {}
+        for definition in operation.variable_definitions or ():
+            name = definition.variable.name.value
+            if name in variables:
+                values[name] = variables[name]
+            elif definition.default_value is not None:
+                values[name] = value_from_ast_untyped(definition.default_value)
+        return values
+
+    def analyze(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        mutation = operation.operation == OperationType.MUTATION
+        cost, depth = self.selection_cost(operation.selection_set, root_type, root_mutation=mutation)
+        return {'cost': cost, 'depth': depth}
+
+    def selection_cost(self, selection_set, parent_type, root_mutation=False):
+        cost = 0
+        depth = 0
+        for field_node, field_parent_type in self.collect_fields(selection_set, parent_type):
+            name = field_node.name.value
+            if name.startswith('__'):
+                continue
+            field = getattr(field_parent_type, 'fields', {}).get(name)
+            if field is None:
+                continue
+            field_cost, field_depth = self.field_cost(field_node, field, field_parent_type, root_mutation)
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+    def field_cost(self, field_node, field, parent_type, root_mutation):
+        field_type = get_nullable_type(field.type)
+        named_type = get_named_type(field_type)
+        name = field_node.name.value
+        weights = self.config['FIELD_WEIGHTS']
+        weight = weights.get(f'{parent_type.name}.{name}', weights.get(named_type.name))
+
+        if is_leaf_type(named_type):
+            return weight or 0, 0
+        if weight is None:
+            weight = self.config['MUTATION_WEIGHT'] if root_mutation else 1
+
+        children_cost, children_depth = self.selection_cost(field_node.selection_set, named_type)
+        if name in CONNECTION_FIELDS:
+            # `edges` is a list, but the connection already counted its size
+            return weight + children_cost, children_depth
+        if is_list_type(field_type):
+            return self.page_size(field_node) * (weight + children_cost), children_depth + 1
+        if self.is_connection(named_type):
+            return weight + self.page_size(field_node) * children_cost, children_depth + 1
+        return weight + children_cost, children_depth + 1
+
+    @staticmethod
+    def is_connection(graphql_type):
+        type_fields = getattr(graphql_type, 'fields', None) or {}
+        return 'edges' in type_fields and 'pageInfo' in type_fields
+
+    def page_size(self, field_node):
+        for argument in field_node.arguments:
+            if argument.name.value in ('first', 'last'):
+                value = value_from_ast(argument.value, GraphQLInt, self.variables)
+                # Variables are not coerced yet, so a client can send any
+                # JSON here; coercion reports the bad ones after this check
+                if isinstance(value, int) and not isinstance(value, bool):
+                    return max(value, 0)
+        return self.config['DEFAULT_LIST_SIZE']
+
+    def collect_fields(self, selection_set, parent_type, visited=None):
+        """Yields (field node, type it is selected on), expanding fragments."""
+        visited = set() if visited is None else visited
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection, parent_type
+            elif isinstance(selection, InlineFragmentNode):
+                yield from self.collect_fields(
+                    selection.selection_set, self.condition_type(selection, parent_type), visited
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name not in visited and name in self.fragments:
+                    visited.add(name)
+                    fragment = self.fragments[name]
+                    yield from self.collect_fields(
+                        fragment.selection_set, self.condition_type(fragment, parent_type), visited
+                    )
+
+    def condition_type(self, fragment, parent_type):
+        # Fragments on a union or interface select fields of a member type
+        if fragment.type_condition is None:
+            return parent_type
+        return self.schema.get_type(fragment.type_condition.name.value) or parent_type
+
+
+def check_query_cost(schema, document, operation, variables, client=None):
+    """
+    Analyzes `operation` and raises QueryCostError when it is deeper or
+    more expensive than allowed, or when `client` has spent its budget
+    for the current minute. Returns the computed {'cost', 'depth'}.
+    """
+    config = get_config()
+    result = QueryCostAnalyzer(schema, document, operation, variables, config).analyze(operation)
+
+    if result['depth'] > config['MAX_DEPTH']:
+        raise QueryCostError(
+            f"Query depth {result['depth']} exceeds the maximum of {config['MAX_DEPTH']}.",
+            'QUERY_TOO_DEEP',
+            result,
+        )
+    if result['cost'] > config['MAX_COST']:
+        raise QueryCostError(
+            f"Query cost {result['cost']} exceeds the maximum of {config['MAX_COST']}.",
+            'QUERY_TOO_EXPENSIVE',
+            result,
+        )
+
+    budget = config['CLIENT_BUDGET_PER_MINUTE']
+    if budget and client:
+        key = f'qcost:{client}'
+        cache.add(key, 0, timeout=60)
+        spent = cache.incr(key, result['cost'])
+        if spent > budget:
+            raise QueryCostError(
+                "Query cost budget exhausted, retry in a minute.",
+                'QUERY_THROTTLED',
+                result,
+            )
+    return result
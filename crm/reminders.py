@@ -0,0 +1,115 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from graphene_django.settings import graphene_settings
+
+from .graphql_client import execute_graphql
+from .models import OrderReminder
+from .result_cache import invalidate_models
+
+DEFAULTS = {
+    # Orders placed this many days back are reminded
+    'SINCE_DAYS': 7,
+    # Orders fetched, sent and recorded at a time; capped by
+    # RELAY_CONNECTION_MAX_LIMIT
+    'PAGE_SIZE': 100,
+    # Reminders of a page sent concurrently
+    'WORKERS': 4,
+    # Dotted path of a callable taking an order dict (id, orderDate,
+    # customerEmail); None only logs the reminder
+    'SENDER': None,
+    'LOG_PATH': '/tmp/order_reminders_log.txt',
+}
+
+PENDING_ORDERS_QUERY = """
+    query PendingOrders($since: DateTime!, $first: Int!, $after: String) {
+        pendingOrders(since: $since, first: $first, after: $after) {
+            pageInfo { hasNextPage endCursor }
+            edges { node { id orderDate customerEmail } }
+        }
+    }
+"""
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CRM_ORDER_REMINDERS', {})}
+
+
+@dataclass
+class ReminderResult:
+    sent: int = 0
+    failed: int = 0
+    pages: int = 0
+    seconds: float = 0.0
+
+
+def pending_orders(since, page_size):
+    """Yields pages of orders without a reminder, following the keyset cursors."""
+    after = None
+    while True:
+        data = execute_graphql(PENDING_ORDERS_QUERY, {'since': since.isoformat(), 'first': page_size, 'after': after})
+        connection = data['pendingOrders']
+        page = [edge['node'] for edge in connection['edges']]
+        if page:
+            yield page
+        if not connection['pageInfo']['hasNextPage']:
+            return
+        after = connection['pageInfo']['endCursor']
+
+
+def attempt(send, order):
+    try:
+        if send is not None:
+            send(order)
+    except Exception as e:
+        return order, e
+    return order, None
+
+
+def send_reminders(since=None, page_size=None, workers=None, send=None, log_path=None):
+    """
+    Sends a reminder for every pending order placed since `since`. Each
+    page is sent on a pool of `workers` threads and its successes are
+    recorded in OrderReminder in one query, so a rerun (or a run after a
+    crash) only picks up the orders still pending. Failed sends stay
+    pending and are retried by the next run.
+    """
+    config = get_config()
+    since = since or timezone.now() - timedelta(days=config['SINCE_DAYS'])
+    page_size = min(page_size or config['PAGE_SIZE'], graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+    if send is None and config['SENDER']:
+        send = import_string(config['SENDER'])
+
+    result = ReminderResult()
+    started = time.perf_counter()
+    timestamp = timezone.localtime().strftime("%Y-%m-%d %H:%M:%S")
+    # The log is opened once and written a page at a time
+    with open(log_path or config['LOG_PATH'], 'a') as log, \
+            ThreadPoolExecutor(max_workers=workers or config['WORKERS']) as pool:
+        for page in pending_orders(since, page_size):
+            lines, sent = [], []
+            for order, error in pool.map(lambda order: attempt(send, order), page):
+                if error is None:
+                    sent.append(order)
+                    lines.append(f"[{timestamp}] Order ID: {order['id']}, Customer Email: {order['customerEmail']}\n")
+                else:
+                    result.failed += 1
+                    lines.append(f"[{timestamp}] ERROR: Order ID: {order['id']}: {error}\n")
+            # Recorded as soon as the page is done, so a crash loses at most one page
+            OrderReminder.objects.bulk_create(
+                [OrderReminder(order_id=int(order['id'])) for order in sent], ignore_conflicts=True
+            )
+            if sent:
+                invalidate_models(OrderReminder)
+            log.writelines(lines)
+            result.sent += len(sent)
+            result.pages += 1
+        if not result.pages:
+            log.write(f"[{timestamp}] No pending orders found since {since.isoformat()}\n")
+    result.seconds = time.perf_counter() - started
+    return result
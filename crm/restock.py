@@ -0,0 +1,106 @@
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product
+from .result_cache import invalidate_models
+
+
+def supports_update_returning(connection):
+    # MariaDB and MySQL have no UPDATE ... RETURNING; SQLite gained it in
+    # 3.35, the same release as INSERT ... RETURNING
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+    )
+
+
+def restock_low_stock(threshold=10, increment=10, queryset=None, chunk_size=None):
+    """
+    Adds `increment` to the stock of every product in `queryset` (all of
+    them by default) whose stock is below `threshold`, and returns the
+    updated products ordered by id.
+
+    Each chunk is one UPDATE ... RETURNING statement where the database
+    supports it. With `chunk_size`, the products are updated at most
+    `chunk_size` at a time, each chunk in its own transaction, so that no
+    single write holds the database lock for long.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    candidates = queryset.filter(stock__lt=threshold)
+    connection = connections[router.db_for_write(Product)]
+
+    updated = []
+    for chunk in chunks(candidates, chunk_size):
+        if supports_update_returning(connection):
+            # A single statement commits on its own under autocommit
+            updated.extend(update_returning(connection, chunk, increment))
+        else:
+            with transaction.atomic(using=connection.alias):
+                updated.extend(update_then_select(chunk, increment))
+
+    if updated:
+        # Neither path sends post_save signals
+        invalidate_models(Product)
+    return sorted(updated, key=lambda product: product.pk)
+
+
+def chunks(queryset, chunk_size):
+    """
+    Splits `queryset` into querysets of at most `chunk_size` rows by id,
+    seeking to the first id of each next chunk as pagination.py does, so
+    that gaps in the ids cost no empty chunks.
+    """
+    if chunk_size is None:
+        yield queryset
+        return
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    start = ids.first()
+    while start is not None:
+        # Looked up before the chunk is written, which may take its rows
+        # out of `queryset`
+        following = ids.filter(pk__gte=start)[chunk_size:chunk_size + 1]
+        end = following[0] if following else None
+        yield queryset.filter(pk__gte=start) if end is None else queryset.filter(pk__gte=start, pk__lt=end)
+        start = end
+
+
+def update_returning(connection, queryset, increment):
+    quote = connection.ops.quote_name
+    fields = Product._meta.concrete_fields
+    pk_column = quote(Product._meta.pk.column)
+    stock_column = quote(Product._meta.get_field('stock').column)
+    updated_at_column = quote(Product._meta.get_field('updated_at').column)
+    subquery, params = queryset.values('pk').query.sql_with_params()
+    sql = (
+        f"UPDATE {quote(Product._meta.db_table)} "
+        f"SET {stock_column} = {stock_column} + %s, {updated_at_column} = %s "
+        f"WHERE {pk_column} IN ({subquery}) "
+        f"RETURNING {', '.join(quote(field.column) for field in fields)}"
+    )
+    # Adapted as the ORM does, so these rows store updated_at in the same
+    # format as rows it writes (naive UTC on SQLite)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [increment, now, *params])
+        rows = cursor.fetchall()
+
+    converters = connection.ops.get_db_converters
+    products = []
+    for row in rows:
+        values = []
+        for field, value in zip(fields, row):
+            expression = field.get_col(Product._meta.db_table)
+            for converter in [*converters(expression), *field.get_db_converters(connection)]:
+                value = converter(value, expression, connection)
+            values.append(value)
+        products.append(Product.from_db(connection.alias, [field.attname for field in fields], values))
+    return products
+
+
+def update_then_select(queryset, increment):
+    ids = list(queryset.values_list('pk', flat=True))
+    if not ids:
+        return []
+    Product.objects.filter(pk__in=ids).update(stock=F('stock') + increment, updated_at=timezone.now())
+    return list(Product.objects.filter(pk__in=ids))
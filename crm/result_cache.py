@@ -0,0 +1,283 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from inspect import isawaitable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+from graphene_django import DjangoObjectType
+
+DEFAULTS = {
+    'ENABLED': True,
+    # 'locmem' keeps results in this process; 'django' uses CACHE_ALIAS
+    # so that every worker shares results and invalidations
+    'BACKEND': 'locmem',
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60,
+    # Entries kept by the locmem backend
+    'MAX_ENTRIES': 1000,
+}
+
+# Arguments that page through a field rather than filter it
+PAGINATION_ARGS = {'first', 'last', 'before', 'after', 'offset', 'orderBy'}
+
+# Documents whose normalized digest and tags are remembered
+PLAN_CACHE_SIZE = 1000
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_RESULT_CACHE', {})}
+
+
+def model_tag(model):
+    return model._meta.label_lower
+
+
+class LocMemBackend:
+    """A bounded LRU of results with per-entry expiry, local to this process."""
+
+    def __init__(self, max_entries, **kwargs):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def tag_versions(self, tags):
+        return [self.versions.get(tag, 0) for tag in tags]
+
+    def invalidate(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+
+
+class DjangoCacheBackend:
+    """Results and tag versions kept in a Django cache shared by all workers."""
+
+    def __init__(self, cache_alias, **kwargs):
+        self.cache = caches[cache_alias]
+
+    def get(self, key):
+        return self.cache.get(f'gqlresult:{key}')
+
+    def set(self, key, value, timeout):
+        self.cache.set(f'gqlresult:{key}', value, timeout)
+
+    def tag_versions(self, tags):
+        versions = self.cache.get_many([f'gqltag:{tag}' for tag in tags])
+        return [versions.get(f'gqltag:{tag}', 0) for tag in tags]
+
+    def invalidate(self, tags):
+        for tag in tags:
+            key = f'gqltag:{tag}'
+            # Tag versions must outlive the results keyed by them
+            self.cache.add(key, 0, timeout=None)
+            self.cache.incr(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+BACKENDS = {
+    'locmem': LocMemBackend,
+    'django': DjangoCacheBackend,
+}
+
+
+class ResultCache:
+    """
+    Caches the data of query operations, keyed by the normalized document,
+    operation name and variables. Each entry is tagged with the models the
+    document reads; a write to one of them bumps its tag version, so the
+    entries keyed by the old version are never served again.
+    """
+
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+        self.plans = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key(self, schema, document, variables, operation_name, database=None):
+        """
+        Returns the cache key for an operation under the current tag
+        versions, read from `database`. Normalizing and tagging a document
+        is done once.
+        """
+        digest, tags = self.plan(schema, document)
+        versions = self.backend.tag_versions(tags)
+        payload = json.dumps([digest, operation_name, variables, versions, database], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest(), tags
+
+    def plan(self, schema, document):
+        # Keyed by identity, holding the document so its id is not reused
+        with self.lock:
+            plan = self.plans.get(id(document))
+            if plan is not None and plan[0] is document:
+                self.plans.move_to_end(id(document))
+                return plan[1:]
+
+        digest = hashlib.sha256(print_ast(document).encode()).hexdigest()
+        tags = sorted(document_tags(schema, document))
+        with self.lock:
+            self.plans[id(document)] = (document, digest, tags)
+            while len(self.plans) > PLAN_CACHE_SIZE:
+                self.plans.popitem(last=False)
+        return digest, tags
+
+    def get(self, key):
+        data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def store(self, key, result):
+        """Caches an ExecutionResult (or an awaitable one) without errors."""
+        if isawaitable(result):
+            async def await_result():
+                return self.store(key, await result)
+            return await_result()
+        if not result.errors and result.data is not None:
+            self.backend.set(key, result.data, self.timeout)
+        return result
+
+    def invalidate(self, *tags):
+        self.invalidations += 1
+        self.backend.invalidate(tags)
+
+    def info(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+    def clear(self):
+        self.backend.clear()
+        with self.lock:
+            self.plans.clear()
+        self.hits = self.misses = self.invalidations = 0
+
+
+def type_models(graphene_type):
+    """The models behind a graphene type, a connection of one or a union of them."""
+    meta = getattr(graphene_type, '_meta', None)
+    if isinstance(graphene_type, type) and issubclass(graphene_type, DjangoObjectType):
+        return [meta.model]
+    if getattr(meta, 'node', None) is not None:
+        return type_models(meta.node)
+    return [model for member in getattr(meta, 'types', None) or () for model in type_models(member)]
+
+
+def document_tags(schema, document):
+    """
+    The models a document reads: those behind every selected type, plus
+    the models related to a filtered field's type, since its filters may
+    join them.
+    """
+    type_info = TypeInfo(schema)
+    tags = set()
+
+    class TagCollector(Visitor):
+        def enter_field(self, node, *args):
+            field_type = type_info.get_type()
+            if field_type is None:
+                return
+            filtered = any(argument.name.value not in PAGINATION_ARGS for argument in node.arguments)
+            for model in type_models(getattr(get_named_type(field_type), 'graphene_type', None)):
+                tags.add(model_tag(model))
+                if filtered:
+                    for field in model._meta.get_fields():
+                        if field.is_relation and field.related_model is not None:
+                            tags.add(model_tag(field.related_model))
+
+    visit(document, TypeInfoVisitor(type_info, TagCollector()))
+    return tags
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """The process-wide ResultCache, or None when it is disabled."""
+    global _result_cache
+    config = get_config()
+    if not config['ENABLED']:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            backend = BACKENDS[config['BACKEND']](
+                max_entries=config['MAX_ENTRIES'], cache_alias=config['CACHE_ALIAS']
+            )
+            _result_cache = ResultCache(backend, config['TIMEOUT'])
+    return _result_cache
+
+
+def invalidate_models(*models):
+    """
+    Expires cached results that read any of `models`. Call it after writes
+    that bypass model signals, such as QuerySet.update() or bulk_create().
+    """
+    result_cache = get_result_cache()
+    if result_cache is None:
+        return
+    tags = [model_tag(model) for model in models]
+    result_cache.invalidate(*tags)
+    # Once more after commit, in case a concurrent read cached the rows
+    # as they were before this transaction
+    transaction.on_commit(lambda: result_cache.invalidate(*tags))
+
+
+def on_model_change(sender, **kwargs):
+    invalidate_models(sender)
+
+
+def on_m2m_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_models(*{field.related_model for field in sender._meta.get_fields() if field.is_relation})
+
+
+def connect_signals(models):
+    for model in models:
+        post_save.connect(on_model_change, sender=model, dispatch_uid=f'result_cache_save_{model_tag(model)}')
+        post_delete.connect(on_model_change, sender=model, dispatch_uid=f'result_cache_delete_{model_tag(model)}')
+        for field in model._meta.many_to_many:
+            m2m_changed.connect(on_m2m_change, sender=field.remote_field.through,
+                                dispatch_uid=f'result_cache_m2m_{model_tag(field.remote_field.through)}')
@@ -0,0 +1,227 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Order, Product, SalesRollupWatermark, StaleSalesDay
+from .result_cache import invalidate_models
+
+DEFAULTS = {
+    # Orders rolled up per transaction
+    'BATCH_SIZE': 5000,
+    # Orders younger than this wait for the next run, so that a
+    # transaction that took a lower id but commits later is not skipped
+    'SETTLE_SECONDS': 60,
+    # Widest from..to range the analytics queries accept
+    'MAX_DAYS': 366,
+}
+
+# SQLite sums decimals as floats, so sums are rounded back to cents
+CENT = Decimal('0.01')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CRM_SALES_ROLLUPS', {})}
+
+
+@dataclass
+class RollupResult:
+    orders: int = 0
+    batches: int = 0
+    last_order_id: int = 0
+    # Stale days recomputed before the new orders were added
+    days: int = 0
+
+
+def mark_stale(order_dates):
+    """
+    Flags the days of `order_dates` for recomputing by the next roll_up().
+    Call it when orders that may already be rolled up are edited, moved
+    to another day or deleted, with their old and new order_dates.
+    """
+    days = {timezone.localdate(order_date) for order_date in order_dates if order_date is not None}
+    StaleSalesDay.objects.bulk_create([StaleSalesDay(day=day) for day in days], ignore_conflicts=True)
+
+
+def order_deleted(sender, instance, **kwargs):
+    """post_delete receiver for Order, connected in CrmConfig.ready()."""
+    mark_stale([instance.order_date])
+
+
+def roll_up(batch_size=None, settle_seconds=None):
+    """
+    Adds the orders created since the watermark to DailySales and
+    DailyProductSales, `batch_size` orders per transaction, and moves the
+    watermark past them. Runs of it take the watermark row's lock, so they
+    never count an order twice.
+
+    Days marked stale by mark_stale() are recomputed first, from the
+    orders up to the watermark.
+
+    Days are the order_date's in the current time zone. Orders carry no
+    line prices, so a product's revenue is its price when it is rolled up;
+    a day's revenue is the sum of its orders' total_amount.
+    """
+    config = get_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+    if settle_seconds is None:
+        settle_seconds = config['SETTLE_SECONDS']
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    result = RollupResult()
+    with transaction.atomic():
+        watermark, _ = SalesRollupWatermark.objects.select_for_update().get_or_create(
+            pk=SalesRollupWatermark.SINGLETON_ID
+        )
+        result.days = recompute_stale_days(watermark.last_order_id)
+    while True:
+        with transaction.atomic():
+            watermark, _ = SalesRollupWatermark.objects.select_for_update().get_or_create(
+                pk=SalesRollupWatermark.SINGLETON_ID
+            )
+            ids = list(
+                Order.objects.filter(pk__gt=watermark.last_order_id, created_at__lte=cutoff)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            result.last_order_id = watermark.last_order_id
+            if not ids:
+                break
+            add_orders(Order.objects.filter(pk__gt=watermark.last_order_id, pk__lte=ids[-1]))
+            watermark.last_order_id = result.last_order_id = ids[-1]
+            watermark.save(update_fields=['last_order_id', 'updated_at'])
+        result.orders += len(ids)
+        result.batches += 1
+    if result.orders or result.days:
+        # The rollups are written with bulk_create() and bulk_update()
+        invalidate_models(DailySales, DailyProductSales)
+    return result
+
+
+def recompute_stale_days(last_order_id):
+    """Rebuilds the rows of the stale days from their orders up to `last_order_id`."""
+    days = list(StaleSalesDay.objects.values_list('day', flat=True))
+    if not days:
+        return 0
+    # Unmarked first, so a change made while this runs marks the day again
+    StaleSalesDay.objects.filter(day__in=days).delete()
+    DailyProductSales.objects.filter(day__in=days).delete()
+    DailySales.objects.filter(day__in=days).delete()
+    add_orders(Order.objects.filter(pk__lte=last_order_id, order_date__date__in=days))
+    return len(days)
+
+
+def add_orders(queryset):
+    """Adds the orders of `queryset` to the rollup tables."""
+    orders = (
+        queryset
+        .annotate(day=TruncDate('order_date'))
+        .values('day')
+        .annotate(count=Count('id'), revenue=Sum('total_amount'))
+        .values_list('day', 'count', 'revenue')
+    )
+    lines = (
+        Order.products.through.objects.filter(order__in=queryset.values('pk'))
+        .annotate(day=TruncDate('order__order_date'))
+        .values('day', 'product_id')
+        .annotate(units=Count('id'), revenue=Sum('product__price'))
+        .values_list('day', 'product_id', 'units', 'revenue')
+    )
+
+    days = defaultdict(lambda: [0, 0, Decimal('0.00')])
+    for day, count, revenue in orders:
+        days[day][0] += count
+        days[day][2] += revenue.quantize(CENT)
+    products = {}
+    for day, product_id, units, revenue in lines:
+        days[day][1] += units
+        products[day, product_id] = (units, revenue.quantize(CENT))
+
+    merge(DailySales, ['day'], ['orders', 'units', 'revenue'], {(day,): totals for day, totals in days.items()})
+    merge(DailyProductSales, ['day', 'product_id'], ['units', 'revenue'], products)
+
+
+def merge(model, key_fields, fields, totals):
+    """
+    Adds `totals`, {values of key_fields: values of fields}, onto the rows
+    of `model`, creating the missing ones.
+    """
+    if not totals:
+        return
+    lookups = {f'{field}__in': {key[i] for key in totals} for i, field in enumerate(key_fields)}
+    changed = []
+    for row in model.objects.filter(**lookups):
+        values = totals.pop(tuple(getattr(row, field) for field in key_fields), None)
+        if values is None:
+            continue
+        for field, value in zip(fields, values):
+            setattr(row, field, getattr(row, field) + value)
+        changed.append(row)
+    model.objects.bulk_update(changed, fields, batch_size=500)
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key)), **dict(zip(fields, values))) for key, values in totals.items()],
+        batch_size=500,
+    )
+
+
+def rebuild(batch_size=None):
+    """
+    Empties the rollups and rolls every order up again, e.g. after orders
+    were changed by writes that do not call mark_stale().
+    """
+    with transaction.atomic():
+        # Waits for a running roll_up() to finish its batch
+        watermark, _ = SalesRollupWatermark.objects.select_for_update().get_or_create(
+            pk=SalesRollupWatermark.SINGLETON_ID
+        )
+        DailyProductSales.objects.all().delete()
+        DailySales.objects.all().delete()
+        StaleSalesDay.objects.all().delete()
+        watermark.last_order_id = 0
+        watermark.save(update_fields=['last_order_id', 'updated_at'])
+    invalidate_models(DailySales, DailyProductSales)
+    return roll_up(batch_size)
+
+
+def check_range(start, end):
+    if start > end:
+        raise ValidationError("'from' must not be after 'to'.")
+    max_days = get_config()['MAX_DAYS']
+    if (end - start).days >= max_days:
+        raise ValidationError(f"Date ranges span at most {max_days} days.")
+
+
+def sales_by_day(start, end):
+    """DailySales for every day from `start` to `end`, zeros included."""
+    check_range(start, end)
+    rows = {row.day: row for row in DailySales.objects.filter(day__range=(start, end))}
+    days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+    return [rows.get(day) or DailySales(day=day, revenue=Decimal('0.00')) for day in days]
+
+
+def top_products(start, end, limit=10):
+    """
+    The `limit` products with the most revenue from `start` to `end`, as
+    unsaved DailyProductSales holding the range's totals.
+    """
+    check_range(start, end)
+    if limit < 1:
+        raise ValidationError("'limit' must be positive.")
+    totals = list(
+        DailyProductSales.objects.filter(day__range=(start, end))
+        .values('product_id')
+        .annotate(total_units=Sum('units'), total_revenue=Sum('revenue'))
+        .order_by('-total_revenue', 'product_id')
+        .values_list('product_id', 'total_units', 'total_revenue')[:limit]
+    )
+    products = Product.objects.in_bulk([product_id for product_id, _, _ in totals])
+    return [
+        DailyProductSales(product=products[product_id], units=units, revenue=revenue.quantize(CENT))
+        for product_id, units, revenue in totals
+    ]
@@ -4,36 +4,137 @@ from graphene_django.filter import DjangoFilterConnectionField
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import F
 import re
 from decimal import Decimal
+from graphene_django.settings import graphene_settings
+from graphql_relay import cursor_to_offset
 
-from .models import Customer, Product, Order
+from .models import Customer, Product, Order, CRMReport, DailySales, DailyProductSales
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .async_execution import nonblocking
+from .loaders import BatchedConnectionField, get_loaders
+from .optimizer import optimize
+from .pagination import KeysetConnection, KeysetConnectionField
+from .restock import restock_low_stock
+from . import sales_rollups
+from .result_cache import invalidate_models
+from .search import SEARCH_MODELS, get_search_backend
+
+# Accepted phone formats, e.g. +1234567890, 123-456-7890 or (555) 444-5555
+PHONE_PATTERN = re.compile(r'^(\+?\d{1,3})?[-.\s]?(\(?\d{3}\)?[-.\s]?)?\d{3}[-.\s]?\d{4}$')
+
+# Rows per INSERT when bulk creating customers
+BULK_CREATE_BATCH_SIZE = 500
+
+# Columns allCustomers can be ordered by, each backed by a (column, id) index
+CUSTOMER_ORDER_BY = ('name', 'created_at', 'order_count', 'lifetime_value', 'last_order_at')
 
 # -- GraphQL Types --
 # Maps Django models to GraphQL types
+# Relationships resolve through the request's DataLoaders (see loaders.py),
+# so a page of N nodes costs one query per relationship instead of N.
 class CustomerType(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderType, loader='customer_orders')
+
     class Meta:
         model = Customer
-        fields = ('id', 'name', 'email', 'phone', 'created_at')
+        fields = (
+            'id', 'name', 'email', 'phone', 'created_at', 'orders',
+            'order_count', 'lifetime_value', 'last_order_at',
+        )
         interfaces = (graphene.relay.Node,)
 
 
 class ProductType(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderType, loader='product_orders')
+
     class Meta:
         model = Product
-        fields = ('id', 'name', 'price', 'stock', 'created_at')
+        fields = ('id', 'name', 'price', 'stock', 'created_at', 'orders')
         filter_fields = ['name', 'price', 'stock']
         interfaces = (graphene.relay.Node,)
 
 
 class OrderType(DjangoObjectType):
+    products = BatchedConnectionField(ProductType, loader='order_products')
+
     class Meta:
         model = Order
         fields = ('id', 'customer', 'products', 'total_amount', 'order_date', 'created_at')
         filter_fields = ['customer', 'products', 'total_amount', 'order_date']
         interfaces = (graphene.relay.Node,)
 
+    @nonblocking
+    def resolve_customer(self, info):
+        # Already joined in by the query optimizer
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+
+
+class PendingOrderType(DjangoObjectType):
+    """
+    The columns the order reminder job needs and nothing else: one query
+    per page, without the customer and products of OrderType.
+    """
+    customer_email = graphene.String()
+
+    class Meta:
+        model = Order
+        fields = ('id', 'order_date')
+        # OrderType stays the type graphene-django converts Order fields to
+        skip_registry = True
+
+
+class CRMReportType(DjangoObjectType):
+    class Meta:
+        model = CRMReport
+        fields = ('total_customers', 'total_orders', 'total_revenue', 'updated_at')
+
+
+# -- Analytics --
+# Read from the daily rollup tables of sales_rollups.py, which lag new
+# orders by up to a rollup run
+class DailySalesType(DjangoObjectType):
+    class Meta:
+        model = DailySales
+        fields = ('day', 'orders', 'units', 'revenue')
+
+
+class ProductSalesType(DjangoObjectType):
+    """A product's units and revenue summed over a date range."""
+    class Meta:
+        model = DailyProductSales
+        fields = ('product', 'units', 'revenue')
+
+
+# -- Search --
+class SearchResult(graphene.Union):
+    class Meta:
+        types = (CustomerType, ProductType, OrderType)
+
+    @classmethod
+    def resolve_type(cls, instance, info):
+        return {Customer: CustomerType, Product: ProductType, Order: OrderType}[type(instance)]
+
+
+class SearchType(graphene.Enum):
+    CUSTOMER = 'customer'
+    PRODUCT = 'product'
+    ORDER = 'order'
+
+
+class SearchConnection(graphene.relay.Connection):
+    class Meta:
+        node = SearchResult
+
+    class Edge:
+        # BM25 score from the search index; lower is a better match
+        rank = graphene.Float()
+
+        def resolve_rank(self, info):
+            return self.node.search_rank
 
 # Filter Input Types
 class CustomerFilterInput(graphene.InputObjectType):
@@ -42,12 +143,24 @@ class CustomerFilterInput(graphene.InputObjectType):
     created_at_gte = graphene.DateTime()
     created_at_lte = graphene.DateTime()
     phone_pattern = graphene.String()
+    order_count_gte = graphene.Int()
+    order_count_lte = graphene.Int()
+    lifetime_value_gte = graphene.Float()
+    lifetime_value_lte = graphene.Float()
+    last_order_at_gte = graphene.DateTime()
+    last_order_at_lte = graphene.DateTime()
     # CamelCase aliases for GraphQL queries
     nameIcontains = graphene.String()
     emailIcontains = graphene.String()
     createdAtGte = graphene.DateTime()
     createdAtLte = graphene.DateTime()
     phonePattern = graphene.String()
+    orderCountGte = graphene.Int()
+    orderCountLte = graphene.Int()
+    lifetimeValueGte = graphene.Float()
+    lifetimeValueLte = graphene.Float()
+    lastOrderAtGte = graphene.DateTime()
+    lastOrderAtLte = graphene.DateTime()
 
 
 class ProductFilterInput(graphene.InputObjectType):
@@ -66,6 +179,28 @@ class ProductFilterInput(graphene.InputObjectType):
     lowStock = graphene.Int()
 
 
+def filter_products(queryset, filter):
+    """Applies a ProductFilterInput, in either of its spellings, to `queryset`."""
+    # Convert camelCase to snake_case for filter fields
+    converted_filter = {}
+    for key, value in filter.items():
+        if key == 'priceGte':
+            converted_filter['price_gte'] = value
+        elif key == 'priceLte':
+            converted_filter['price_lte'] = value
+        elif key == 'stockGte':
+            converted_filter['stock_gte'] = value
+        elif key == 'stockLte':
+            converted_filter['stock_lte'] = value
+        elif key == 'nameIcontains':
+            converted_filter['name_icontains'] = value
+        elif key == 'lowStock':
+            converted_filter['low_stock'] = value
+        else:
+            converted_filter[key] = value
+    return ProductFilter(converted_filter, queryset=queryset).qs
+
+
 class OrderFilterInput(graphene.InputObjectType):
     total_amount_gte = graphene.Float()
     total_amount_lte = graphene.Float()
@@ -85,9 +220,27 @@ class ProductConnection(graphene.Connection):
     class Meta:
         node = ProductType
 
+
+# Keyset (seek) paginated connections, see pagination.py
+class CustomerKeysetConnection(KeysetConnection):
+    class Meta:
+        node = CustomerType
+
+class ProductKeysetConnection(KeysetConnection):
+    class Meta:
+        node = ProductType
+
+class OrderKeysetConnection(KeysetConnection):
+    class Meta:
+        node = OrderType
+
+class PendingOrderConnection(KeysetConnection):
+    class Meta:
+        node = PendingOrderType
+
 # -- Query --
 class Query(graphene.ObjectType):
-    all_customers = graphene.ConnectionField(CustomerConnection, filter=CustomerFilterInput())
+    all_customers = graphene.ConnectionField(CustomerConnection, filter=CustomerFilterInput(), order_by=graphene.String())
     all_products = graphene.ConnectionField(ProductConnection, filter=ProductFilterInput(), order_by=graphene.String())
     all_orders = DjangoFilterConnectionField(OrderType, filterset_class=OrderFilter)
     
@@ -96,8 +249,85 @@ class Query(graphene.ObjectType):
     products = graphene.List(ProductType, filter=ProductFilterInput())
     orders = graphene.List(OrderType, filter=OrderFilterInput())
 
-    def resolve_all_customers(self, info, filter=None, **kwargs):
-        queryset = Customer.objects.all()
+    # Totals served from the single-row CRMReport table
+    crm_report = graphene.Field(CRMReportType)
+
+    # Ranked substring search over customers, products and orders, see search.py
+    search = graphene.ConnectionField(
+        SearchConnection,
+        query=graphene.String(required=True),
+        types=graphene.List(graphene.NonNull(SearchType)),
+    )
+
+    # Keyset paginated variants: deep pages cost the same as the first one
+    all_customers_keyset = KeysetConnectionField(
+        CustomerKeysetConnection,
+        filter=CustomerFilterInput(),
+        # Not last_order_at: a keyset cursor cannot seek past its nulls
+        sort_keys=('created_at', 'name', 'email', 'order_count', 'lifetime_value'),
+    )
+    all_products_keyset = KeysetConnectionField(
+        ProductKeysetConnection,
+        filter=ProductFilterInput(),
+        sort_keys=('name', 'price', 'stock'),
+    )
+    all_orders_keyset = KeysetConnectionField(
+        OrderKeysetConnection,
+        filter=OrderFilterInput(),
+        sort_keys=('order_date', 'total_amount'),
+        default_order_by='-order_date',
+    )
+
+    # Orders placed since `since` that have no OrderReminder yet, oldest first
+    pending_orders = KeysetConnectionField(
+        PendingOrderConnection,
+        since=graphene.DateTime(required=True),
+        default_order_by='order_date',
+        sort_keys=('order_date',),
+    )
+
+    # Analytics over the daily sales rollups, both ranges inclusive
+    sales_by_day = graphene.List(
+        graphene.NonNull(DailySalesType),
+        from_=graphene.Date(required=True, name='from'),
+        to=graphene.Date(required=True),
+    )
+    top_products = graphene.List(
+        graphene.NonNull(ProductSalesType),
+        from_=graphene.Date(required=True, name='from'),
+        to=graphene.Date(required=True),
+        limit=graphene.Int(default_value=10),
+    )
+
+    def resolve_crm_report(self, info):
+        return CRMReport.get()
+
+    def resolve_sales_by_day(self, info, from_, to):
+        return sales_rollups.sales_by_day(from_, to)
+
+    def resolve_top_products(self, info, from_, to, limit):
+        return sales_rollups.top_products(from_, to, limit)
+
+    def resolve_search(self, info, query, types=None, first=None, after=None, **kwargs):
+        # Fetch one row past the page so the connection can tell whether
+        # there is a next one
+        offset = cursor_to_offset(after) + 1 if after else 0
+        first = min(first or 20, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+        names = {getattr(search_type, 'value', search_type) for search_type in types or ()}
+        models = [model for model in SEARCH_MODELS if not names or model._meta.model_name in names]
+        return get_search_backend().search(query, models, limit=offset + first + 1)
+
+    def resolve_all_orders(self, info, **kwargs):
+        # The connection field applies OrderFilter and pagination on top
+        return optimize(Order.objects.all(), info)
+
+    def resolve_all_customers(self, info, filter=None, order_by=None, **kwargs):
+        queryset = optimize(Customer.objects.all(), info)
+        if order_by:
+            if order_by.lstrip('-') not in CUSTOMER_ORDER_BY:
+                raise ValidationError(f"Cannot order by '{order_by}'. Choose one of: {', '.join(CUSTOMER_ORDER_BY)}.")
+            # The id breaks ties, so pages do not overlap
+            queryset = queryset.order_by(order_by, '-pk' if order_by.startswith('-') else 'pk')
         if filter:
             # Convert camelCase to snake_case for filter fields
             converted_filter = {}
@@ -112,6 +342,18 @@ class Query(graphene.ObjectType):
                     converted_filter['created_at_lte'] = value
                 elif key == 'phonePattern':
                     converted_filter['phone_pattern'] = value
+                elif key == 'orderCountGte':
+                    converted_filter['order_count_gte'] = value
+                elif key == 'orderCountLte':
+                    converted_filter['order_count_lte'] = value
+                elif key == 'lifetimeValueGte':
+                    converted_filter['lifetime_value_gte'] = value
+                elif key == 'lifetimeValueLte':
+                    converted_filter['lifetime_value_lte'] = value
+                elif key == 'lastOrderAtGte':
+                    converted_filter['last_order_at_gte'] = value
+                elif key == 'lastOrderAtLte':
+                    converted_filter['last_order_at_lte'] = value
                 else:
                     converted_filter[key] = value
             
@@ -120,53 +362,53 @@ class Query(graphene.ObjectType):
         return queryset
     
     def resolve_all_products(self, info, filter=None, order_by=None, **kwargs):
-        queryset = Product.objects.all()
+        queryset = optimize(Product.objects.all(), info)
         if filter:
-            # Convert camelCase to snake_case for filter fields
-            converted_filter = {}
-            for key, value in filter.items():
-                if key == 'priceGte':
-                    converted_filter['price_gte'] = value
-                elif key == 'priceLte':
-                    converted_filter['price_lte'] = value
-                elif key == 'stockGte':
-                    converted_filter['stock_gte'] = value
-                elif key == 'stockLte':
-                    converted_filter['stock_lte'] = value
-                elif key == 'nameIcontains':
-                    converted_filter['name_icontains'] = value
-                elif key == 'lowStock':
-                    converted_filter['low_stock'] = value
-                else:
-                    converted_filter[key] = value
-            
-            product_filter = ProductFilter(converted_filter, queryset=queryset)
-            queryset = product_filter.qs
+            queryset = filter_products(queryset, filter)
         if order_by:
             queryset = queryset.order_by(order_by)
         return queryset
     
     def resolve_customers(self, info, filter=None):
-        queryset = Customer.objects.all()
+        queryset = optimize(Customer.objects.all(), info)
         if filter:
             customer_filter = CustomerFilter(filter, queryset=queryset)
             return customer_filter.qs
         return queryset
     
     def resolve_products(self, info, filter=None):
-        queryset = Product.objects.all()
+        queryset = optimize(Product.objects.all(), info)
         if filter:
             product_filter = ProductFilter(filter, queryset=queryset)
             return product_filter.qs
         return queryset
     
     def resolve_orders(self, info, filter=None):
-        queryset = Order.objects.all()
+        queryset = optimize(Order.objects.all(), info)
         if filter:
             order_filter = OrderFilter(filter, queryset=queryset)
             return order_filter.qs
         return queryset
 
+    # The keyset fields filter like their offset counterparts; the
+    # connection field applies the ordering and the cursor seek.
+    def resolve_all_customers_keyset(self, info, filter=None, **kwargs):
+        return Query.resolve_all_customers(self, info, filter=filter)
+
+    def resolve_all_products_keyset(self, info, filter=None, **kwargs):
+        return Query.resolve_all_products(self, info, filter=filter)
+
+    def resolve_all_orders_keyset(self, info, filter=None, **kwargs):
+        return Query.resolve_orders(self, info, filter=filter)
+
+    def resolve_pending_orders(self, info, since, **kwargs):
+        return (
+            Order.objects
+            .filter(order_date__gte=since, reminder__isnull=True)
+            .only('id', 'order_date')
+            .annotate(customer_email=F('customer__email'))
+        )
+
 # -- Mutations --
 # Customer Mutation
 # class CreateCustomer(graphene.Mutation):
@@ -213,6 +455,7 @@ class CreateCustomer(graphene.Mutation):
     message = graphene.String()
 
     @staticmethod
+    @transaction.atomic
     def mutate(root, info, input):
         name = input.get('name')
         email = input.get('email')
@@ -221,11 +464,12 @@ class CreateCustomer(graphene.Mutation):
         if Customer.objects.filter(email=email).exists():
             raise Exception("Email already exists. Please use a different email.")
 
-        if phone and not re.match(r'^(\+?\d{1,3})?[-.\s]?(\(?\d{3}\)?[-.\s]?)?\d{3}[-.\s]?\d{4}$', phone):
+        if phone and not PHONE_PATTERN.match(phone):
             raise Exception("Invalid phone number format.")
 
         customer_instance = Customer(name=name, email=email, phone=phone)
         customer_instance.save()
+        CRMReport.increment(customers=1)
 
         return CreateCustomer(
             customer=customer_instance,
@@ -243,41 +487,89 @@ class CustomerInput(graphene.InputObjectType):
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(graphene.NonNull(CustomerInput), required=True)
+        # Update name/phone of customers whose email already exists
+        upsert = graphene.Boolean(default_value=False)
 
     customers = graphene.List(CustomerType)
     errors = graphene.List(graphene.String)
 
     @staticmethod
     @transaction.atomic
-    def mutate(root, info, input):
+    def mutate(root, info, input, upsert=False):
+        # (input index, customer) and (input index, message), reported in
+        # input order
         created_customers = []
         error_messages = []
 
-        # Challenge: Partial success. We process each customer individually.
+        # Challenge: Partial success. Records are validated individually but
+        # existing emails are looked up in one query and survivors are inserted
+        # in chunks, so a batch costs a handful of queries instead of 2N.
+        existing = set(
+            Customer.objects
+            .filter(email__in={customer_data.get('email') for customer_data in input})
+            .values_list('email', flat=True)
+        )
+        seen = set()
+        pending = []
         for i, customer_data in enumerate(input):
             email = customer_data.get('email')
             phone = customer_data.get('phone')
 
             # Validation
-            if Customer.objects.filter(email=email).exists():
-                error_messages.append(f"Record {i+1}: Email '{email}' already exists.")
+            if email in seen or (email in existing and not upsert):
+                error_messages.append((i, f"Record {i+1}: Email '{email}' already exists."))
                 continue
-            
-            if phone and not re.match(r'^(\+?\d{1,3})?[-.\s]?(\(?\d{3}\)?[-.\s]?)?\d{3}[-.\s]?\d{4}$', phone):
-                error_messages.append(f"Record {i+1}: Invalid phone number format for '{phone}'.")
+
+            if phone and not PHONE_PATTERN.match(phone):
+                error_messages.append((i, f"Record {i+1}: Invalid phone number format for '{phone}'."))
                 continue
 
+            seen.add(email)
+            pending.append((i, Customer(name=customer_data.get('name'), email=email, phone=phone)))
+
+        for start in range(0, len(pending), BULK_CREATE_BATCH_SIZE):
+            chunk = pending[start:start + BULK_CREATE_BATCH_SIZE]
             try:
-                customer = Customer.objects.create(
-                    name=customer_data.get('name'),
-                    email=email,
-                    phone=phone
-                )
-                created_customers.append(customer)
-            except Exception as e:
-                error_messages.append(f"Record {i+1}: Could not create customer '{customer_data.get('name')}'. Error: {e}")
+                with transaction.atomic():
+                    BulkCreateCustomers.insert([customer for _, customer in chunk], upsert)
+                created_customers.extend(chunk)
+            except Exception:
+                # Retry the chunk row by row so the failing records can be reported
+                for i, customer in chunk:
+                    try:
+                        with transaction.atomic():
+                            BulkCreateCustomers.insert([customer], upsert)
+                        created_customers.append((i, customer))
+                    except Exception as e:
+                        error_messages.append((i, f"Record {i+1}: Could not create customer '{customer.name}'. Error: {e}"))
+
+        # Read back as stored: upserted rows keep their created_at and
+        # lifetime stats, and new rows get their database defaults
+        stored = Customer.objects.in_bulk([customer.email for _, customer in created_customers], field_name='email')
+        created_customers = [(i, stored[customer.email]) for i, customer in created_customers]
+        inserted = sum(1 for _, customer in created_customers if customer.email not in existing)
+        if inserted:
+            CRMReport.increment(customers=inserted)
+        if created_customers:
+            # bulk_create() sends no post_save signals
+            invalidate_models(Customer)
+
+        return BulkCreateCustomers(
+            customers=[customer for _, customer in sorted(created_customers, key=lambda item: item[0])],
+            errors=[message for _, message in sorted(error_messages, key=lambda item: item[0])],
+        )
 
-        return BulkCreateCustomers(customers=created_customers, errors=error_messages)
+    @staticmethod
+    def insert(customers, upsert):
+        if upsert:
+            Customer.objects.bulk_create(
+                customers,
+                update_conflicts=True,
+                unique_fields=['email'],
+                update_fields=['name', 'phone', 'updated_at'],
+            )
+        else:
+            Customer.objects.bulk_create(customers)
 
 
 class ProductInput(graphene.InputObjectType):
@@ -357,37 +649,49 @@ class CreateOrder(graphene.Mutation):
             order_date=order_date
         )
         
-        # Associate products using the ManyToMany relationship
-        order.products.set(products)
+        # Associate products using the ManyToMany relationship. The order
+        # is new, so its lines are inserted without set()'s lookups of
+        # the existing ones
+        Through = Order.products.through
+        Through.objects.bulk_create([Through(order=order, product=product) for product in products])
+        # bulk_create() sends no m2m_changed signal
+        invalidate_models(Order, Product)
+        CRMReport.increment(orders=1, revenue=total_amount)
+        Customer.record_order(customer.pk, total_amount, order_date)
         
         return CreateOrder(order=order)
 
 class UpdateLowStockProducts(graphene.Mutation):
     """
-    Finds products with stock less than 10 and increments their stock by 10.
+    Adds `increment` to the stock of the products (optionally only those
+    matching `filter`) whose stock is below `threshold`. Pass `chunkSize`
+    to restock a large catalog in id ranges of that many products, each
+    committed on its own; see restock.py.
     """
+    class Arguments:
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
+        filter = ProductFilterInput()
+        chunk_size = graphene.Int()
+
     success = graphene.Boolean()
     message = graphene.String()
     updated_products = graphene.List(ProductType)
 
     @classmethod
-    def mutate(cls, root, info):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        product_ids_to_update = list(low_stock_products.values_list('id', flat=True))
-
-        if not product_ids_to_update:
+    def mutate(cls, root, info, threshold, increment, filter=None, chunk_size=None):
+        if increment < 1:
+            return UpdateLowStockProducts(success=False, message="Increment must be a positive integer.", updated_products=[])
+        if chunk_size is not None and chunk_size < 1:
+            return UpdateLowStockProducts(success=False, message="Chunk size must be a positive integer.", updated_products=[])
+
+        queryset = filter_products(Product.objects.all(), filter) if filter else None
+        updated_products = restock_low_stock(threshold, increment, queryset=queryset, chunk_size=chunk_size)
+        if not updated_products:
             message = "No low-stock products found to update."
-            return UpdateLowStockProducts(success=True, message=message, updated_products=[])
-
-        updated_count = low_stock_products.update(stock=F('stock') + 10)
-        updated_products_list = Product.objects.filter(id__in=product_ids_to_update)
-
-        message = f"Successfully restocked {updated_count} products."
-        return UpdateLowStockProducts(
-            success=True,
-            message=message,
-            updated_products=list(updated_products_list)
-        )
+        else:
+            message = f"Successfully restocked {len(updated_products)} products."
+        return UpdateLowStockProducts(success=True, message=message, updated_products=updated_products)
 
 
 # This class groups all the individual mutation classes together.
@@ -0,0 +1,212 @@
+import sqlite3
+from functools import cache
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Customer, Order, Product
+
+# Columns indexed per model. Orders are found through their customer and
+# products rather than indexed themselves.
+SEARCH_FIELDS = {
+    Customer: ('name', 'email'),
+    Product: ('name',),
+}
+SEARCH_MODELS = (Customer, Product, Order)
+
+# The trigram tokenizer cannot match anything shorter
+MIN_TERM_LENGTH = 3
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def fts_phrase(value):
+    return '"{}"'.format(value.replace('"', '""'))
+
+
+def resolve_field_path(model, field_path):
+    """
+    Splits a lookup path such as 'customer__name' into the relation prefix,
+    the model it ends on and the column.
+    """
+    *relations, column = field_path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return '__'.join(relations), model, column
+
+
+@cache
+def sqlite_supports_trigram():
+    """Whether this SQLite library can build the tables migration 0005 creates."""
+    probe = sqlite3.connect(':memory:')
+    try:
+        probe.execute("CREATE VIRTUAL TABLE probe USING fts5(value, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        probe.close()
+
+
+class SearchBackend:
+    """
+    Substring filtering and ranked search over SEARCH_FIELDS with plain
+    LIKE queries. Works on any database; subclasses use a real index.
+    """
+
+    def filter_contains(self, queryset, field_path, value):
+        """The equivalent of queryset.filter(<field_path>__icontains=value)."""
+        return queryset.filter(**{f'{field_path}__icontains': value})
+
+    def search(self, query, models=SEARCH_MODELS, limit=20):
+        """Returns up to `limit` instances matching every term of `query`, best first."""
+        terms = query.split()
+        if not terms:
+            return []
+        results = []
+        for model in models:
+            if len(results) >= limit:
+                break
+            condition = Q()
+            for term in terms:
+                condition &= self.term_condition(model, term)
+            results.extend(model.objects.filter(condition).distinct().order_by('pk')[:limit - len(results)])
+        for instance in results:
+            instance.search_rank = 0.0
+        return results
+
+    @staticmethod
+    def term_condition(model, term, prefix=''):
+        if model is Order:
+            return (
+                SearchBackend.term_condition(Customer, term, 'customer__')
+                | SearchBackend.term_condition(Product, term, 'products__')
+            )
+        condition = Q()
+        for column in SEARCH_FIELDS[model]:
+            condition |= Q(**{f'{prefix}{column}__icontains': term})
+        return condition
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    Uses the FTS5 trigram tables created by migration 0005, which match
+    any substring of three or more characters from the index. Falls back
+    to LIKE on other databases, on SQLite builds without trigram FTS5,
+    on databases where migration 0005 did not create the tables and for
+    terms too short for trigrams. BM25 ranks the search results.
+    """
+
+    def __init__(self):
+        # {database alias: names of the FTS tables it has}
+        self._tables = {}
+
+    def is_available(self, model):
+        connection = connections[router.db_for_read(model)]
+        if connection.vendor != 'sqlite' or not sqlite_supports_trigram():
+            return False
+        if connection.alias not in self._tables:
+            self._tables[connection.alias] = set(connection.introspection.table_names()) & {
+                fts_table(model) for model in SEARCH_FIELDS
+            }
+        # Orders are searched through the customer and product tables
+        models = SEARCH_FIELDS if model is Order else (model,)
+        return all(fts_table(model) in self._tables[connection.alias] for model in models)
+
+    def match_ids(self, model, expression):
+        table = fts_table(model)
+        return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [expression])
+
+    def filter_contains(self, queryset, field_path, value):
+        prefix, model, column = resolve_field_path(queryset.model, field_path)
+        if (
+            len(value) < MIN_TERM_LENGTH
+            or column not in SEARCH_FIELDS.get(model, ())
+            or not self.is_available(model)
+        ):
+            return super().filter_contains(queryset, field_path, value)
+        lookup = f'{prefix}__pk__in' if prefix else 'pk__in'
+        return queryset.filter(**{lookup: self.match_ids(model, f'{column} : {fts_phrase(value)}')})
+
+    def search(self, query, models=SEARCH_MODELS, limit=20):
+        terms = [term for term in query.split() if len(term) >= MIN_TERM_LENGTH]
+        if not terms or len(terms) != len(query.split()) or not all(self.is_available(model) for model in models):
+            return super().search(query, models, limit)
+
+        expression = ' AND '.join(fts_phrase(term) for term in terms)
+        ranked = []
+        for model in models:
+            ranked.extend((rank, model, pk) for pk, rank in self.ranked_ids(model, expression, limit))
+        ranked.sort(key=lambda row: row[0])
+        ranked = ranked[:limit]
+
+        instances = {}
+        for model in models:
+            ids = [pk for _, row_model, pk in ranked if row_model is model]
+            if ids:
+                instances[model] = model.objects.in_bulk(ids)
+        results = []
+        for rank, model, pk in ranked:
+            instance = instances[model].get(pk)
+            if instance is not None:
+                instance.search_rank = rank
+                results.append(instance)
+        return results
+
+    def ranked_ids(self, model, expression, limit):
+        connection = connections[router.db_for_read(model)]
+        if model is Order:
+            customers, products = fts_table(Customer), fts_table(Product)
+            through = Order.products.through._meta.db_table
+            sql = f"""
+                WITH customer_match AS (
+                    SELECT rowid AS id, bm25({customers}) AS rank FROM {customers} WHERE {customers} MATCH %s
+                ), product_match AS (
+                    SELECT rowid AS id, bm25({products}) AS rank FROM {products} WHERE {products} MATCH %s
+                )
+                SELECT order_id, MIN(rank) AS rank FROM (
+                    SELECT o.id AS order_id, m.rank FROM {Order._meta.db_table} o
+                    JOIN customer_match m ON o.customer_id = m.id
+                    UNION ALL
+                    SELECT t.order_id, m.rank FROM {through} t
+                    JOIN product_match m ON t.product_id = m.id
+                ) GROUP BY order_id ORDER BY rank LIMIT %s
+            """
+            params = [expression, expression, limit]
+        else:
+            table = fts_table(model)
+            sql = f'SELECT rowid, bm25({table}) AS rank FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s'
+            params = [expression, limit]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def rebuild(self):
+        # Looks for tables again, e.g. after the migration ran
+        self._tables.clear()
+        for model in SEARCH_FIELDS:
+            if not self.is_available(model):
+                continue
+            table = fts_table(model)
+            with connections[router.db_for_write(model)].cursor() as cursor:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES('rebuild')")
+
+
+_backend = None
+
+
+def get_search_backend():
+    """The backend named by settings.CRM_SEARCH_BACKEND."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'CRM_SEARCH_BACKEND', 'crm.search.SQLiteFTS5Backend')
+        _backend = import_string(path)()
+    return _backend
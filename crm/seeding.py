@@ -0,0 +1,266 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import customer_stats
+from .models import (
+    CRMReport, Customer, DailyProductSales, DailySales, Order, OrderReminder, Product, SalesRollupWatermark,
+    StaleSalesDay,
+)
+from .result_cache import invalidate_models
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Amara', 'Chidi',
+    'Ngozi', 'Kwame', 'Fatima', 'Wei', 'Yuki', 'Sofia', 'Mateo', 'Priya', 'Arjun', 'Olga',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Okafor', 'Mensah', 'Adeyemi', 'Chen', 'Tanaka', 'Rossi', 'Silva', 'Patel', 'Sharma', 'Ivanova',
+]
+DOMAINS = ['example.com', 'mail.example.org', 'corp.example.net', 'shop.example.io']
+PRODUCT_ADJECTIVES = ['Wireless', 'Compact', 'Pro', 'Ultra', 'Gaming', 'Portable', 'Smart', 'Classic', 'Mini', 'Max']
+PRODUCT_NOUNS = [
+    'Laptop', 'Monitor', 'Keyboard', 'Mouse', 'Headphones', 'Tablet', 'Smartphone', 'Webcam', 'Printer',
+    'Router', 'Speaker', 'Charger', 'SSD', 'Graphics Card', 'Desk Lamp',
+]
+
+# Set in each worker by init_worker(), so product prices are sent to a
+# worker once rather than with every chunk
+_product_prices = None
+
+
+@dataclass
+class SeedOptions:
+    """
+    What seed() generates. Each chunk of rows comes from its own seeded
+    generator, so the same options produce the same rows (with dates
+    relative to the run) whatever the number of workers.
+    """
+    customers: int = 10_000
+    products: int = 1_000
+    orders: int = 100_000
+    min_products_per_order: int = 1
+    max_products_per_order: int = 5
+    # Orders are spread uniformly over this many days before the run
+    days: int = 365
+    seed: int = 0
+    chunk_size: int = 5_000
+    # Processes generating chunks; 1 generates them in this process
+    workers: int = 1
+    clear: bool = False
+
+
+@dataclass
+class SeedStats:
+    """Rows written per table and the seconds spent writing them."""
+    rows: dict = field(default_factory=dict)
+    seconds: dict = field(default_factory=dict)
+
+    def add(self, table, rows, seconds):
+        self.rows[table] = self.rows.get(table, 0) + rows
+        self.seconds[table] = self.seconds.get(table, 0.0) + seconds
+
+    def rate(self, table):
+        return self.rows[table] / self.seconds[table] if self.seconds.get(table) else 0.0
+
+
+def chunk_rng(seed, kind, index):
+    # String seeds hash the same in every process
+    return random.Random(f'{seed}:{kind}:{index}')
+
+
+def generate_customers(seed, index, first_id, count):
+    rng = chunk_rng(seed, 'customers', index)
+    rows = []
+    for pk in range(first_id, first_id + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        phone = None if rng.random() < 0.2 else f'+1-555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}'
+        rows.append((pk, f'{first} {last}', f'{first.lower()}.{last.lower()}.{pk}@{rng.choice(DOMAINS)}', phone))
+    return rows
+
+
+def generate_products(seed, index, first_id, count):
+    rng = chunk_rng(seed, 'products', index)
+    return [
+        (
+            pk,
+            f'{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)} {pk}',
+            Decimal(rng.randint(199, 249_999)).scaleb(-2),
+            rng.randint(0, 500),
+        )
+        for pk in range(first_id, first_id + count)
+    ]
+
+
+def init_worker(product_prices):
+    global _product_prices
+    _product_prices = product_prices
+
+
+def generate_orders(seed, index, first_id, count, first_customer_id, customers, first_product_id,
+                    per_order, days, now):
+    """Returns (order rows, (order_id, product_id) rows) for one chunk."""
+    rng = chunk_rng(seed, 'orders', index)
+    low, high = per_order
+    span = days * 86_400
+    orders, lines = [], []
+    for pk in range(first_id, first_id + count):
+        picks = rng.sample(range(len(_product_prices)), min(rng.randint(low, high), len(_product_prices)))
+        total = sum((_product_prices[pick] for pick in picks), Decimal('0.00'))
+        order_date = now - timedelta(seconds=rng.randrange(span)) if span else now
+        orders.append((pk, first_customer_id + rng.randrange(customers), total, order_date))
+        lines.extend((pk, first_product_id + pick) for pick in picks)
+    return orders, lines
+
+
+def chunks(total, chunk_size, first_id):
+    """(index, first id, row count) for each chunk of `total` rows."""
+    for index, offset in enumerate(range(0, total, chunk_size)):
+        yield index, first_id + offset, min(chunk_size, total - offset)
+
+
+def make_pool(workers, prices=None):
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(workers, initializer=init_worker, initargs=(prices,))
+
+
+def generate(function, jobs, pool, lookahead):
+    """
+    Yields function(*job) for each job, in order. With a pool, keeps up to
+    `lookahead` chunks in flight so generation overlaps writing without
+    buffering the whole table.
+    """
+    if pool is None:
+        for job in jobs:
+            yield function(*job)
+        return
+    pending = []
+    for job in jobs:
+        pending.append(pool.submit(function, *job))
+        if len(pending) > lookahead:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def next_id(model, using):
+    return (model.objects.using(using).aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def clear(using):
+    # Raw deletes: the result cache's delete signals would otherwise make
+    # Django fetch every row before deleting it. The sales rollups go too;
+    # without its watermark row, the next rollup run starts from scratch.
+    tables = [
+        DailyProductSales, DailySales, StaleSalesDay, SalesRollupWatermark,
+        OrderReminder, Order.products.through, Order, Product, Customer,
+    ]
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for model in tables:
+            cursor.execute(f'DELETE FROM {connections[using].ops.quote_name(model._meta.db_table)}')
+    invalidate_models(DailySales, DailyProductSales)
+
+
+def seed(options, progress=None):
+    """
+    Adds options.customers, products and orders to the database and
+    returns a SeedStats. New orders reference only the customers and
+    products created by the same run. `progress(table, rows)` is called
+    after each chunk is written.
+    """
+    if options.orders and not (options.customers and options.products):
+        raise ValueError("Orders need at least one new customer and one new product.")
+    using = router.db_for_write(Order)
+    stats = SeedStats()
+    if options.clear:
+        clear(using)
+
+    lookahead = options.workers * 2
+    pool = make_pool(options.workers)
+    try:
+        first_customer_id = next_id(Customer, using)
+        jobs = ((options.seed, *chunk) for chunk in chunks(options.customers, options.chunk_size, first_customer_id))
+        for rows in generate(generate_customers, jobs, pool, lookahead):
+            write(Customer, stats, progress, using, rows)
+
+        first_product_id = next_id(Product, using)
+        prices = []
+        jobs = ((options.seed, *chunk) for chunk in chunks(options.products, options.chunk_size, first_product_id))
+        for rows in generate(generate_products, jobs, pool, lookahead):
+            write(Product, stats, progress, using, rows)
+            prices.extend(price for _, _, price, _ in rows)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Order workers start once every price is known, and receive them once
+    init_worker(prices)
+    pool = make_pool(options.workers, prices)
+    try:
+        per_order = (options.min_products_per_order, options.max_products_per_order)
+        now = timezone.now()
+        jobs = (
+            (options.seed, *chunk, first_customer_id, options.customers, first_product_id,
+             per_order, options.days, now)
+            for chunk in chunks(options.orders, options.chunk_size, next_id(Order, using))
+        )
+        for orders, lines in generate(generate_orders, jobs, pool, lookahead):
+            write_orders(stats, progress, using, orders, lines)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    with connections[using].cursor() as cursor:
+        # Explicit ids leave sequences (e.g. on PostgreSQL) behind
+        for statement in connections[using].ops.sequence_reset_sql(no_style(), [Customer, Product, Order]):
+            cursor.execute(statement)
+    with transaction.atomic(using=using):
+        CRMReport.rebuild()
+    # Orders were written without Customer.record_order(), and only for
+    # this run's customers
+    for low in range(first_customer_id, first_customer_id + options.customers, options.chunk_size):
+        customer_stats.reconcile_range(low, low + options.chunk_size, using)
+    # bulk_create() sends no post_save signals
+    invalidate_models(Customer, Product, Order)
+    return stats
+
+
+def write(model, stats, progress, using, rows):
+    fields = {Customer: ('id', 'name', 'email', 'phone'), Product: ('id', 'name', 'price', 'stock')}[model]
+    started = time.perf_counter()
+    model.objects.using(using).bulk_create([model(**dict(zip(fields, row))) for row in rows], batch_size=len(rows))
+    stats.add(model._meta.model_name, len(rows), time.perf_counter() - started)
+    if progress:
+        progress(model._meta.model_name, len(rows))
+
+
+def write_orders(stats, progress, using, orders, lines):
+    Through = Order.products.through
+    started = time.perf_counter()
+    # An order and its lines are committed together
+    with transaction.atomic(using=using):
+        Order.objects.using(using).bulk_create(
+            [Order(id=pk, customer_id=customer_id, total_amount=total, order_date=order_date)
+             for pk, customer_id, total, order_date in orders],
+            batch_size=len(orders),
+        )
+        Through.objects.using(using).bulk_create(
+            [Through(order_id=order_id, product_id=product_id) for order_id, product_id in lines],
+            batch_size=len(lines) or None,
+        )
+    # Both tables are written in the same time
+    elapsed = time.perf_counter() - started
+    stats.add('order', len(orders), elapsed)
+    stats.add('order_products', len(lines), elapsed)
+    if progress:
+        progress('order', len(orders))
@@ -0,0 +1,235 @@
+import json
+import logging
+import random
+import re
+import threading
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from graphql import print_ast
+
+DEFAULTS = {
+    'ENABLED': True,
+    # /graphql requests slower than this are logged
+    'THRESHOLD_MS': 500,
+    # Fraction of slow requests logged
+    'SAMPLE_RATE': 1.0,
+    # JSON lines file, rotated at MAX_BYTES; defaults to BASE_DIR/graphql_slow.jsonl
+    'PATH': None,
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    # Statements kept per operation, and how many of the slowest SELECTs
+    # are explained
+    'MAX_STATEMENTS': 500,
+    'EXPLAIN_SLOWEST': 3,
+    # Resolvers faster than this are left out of the timing tree
+    'RESOLVER_THRESHOLD_MS': 0.1,
+    # Variables whose name contains one of these are replaced
+    'REDACT_VARIABLES': ('password', 'token', 'secret', 'email', 'phone'),
+    # Log the parameters of SQL statements too
+    'SQL_PARAMS': False,
+}
+
+REDACTED = '[REDACTED]'
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_SLOW_LOG', {})}
+
+
+def log_path(config=None):
+    return Path((config or get_config())['PATH'] or Path(settings.BASE_DIR) / 'graphql_slow.jsonl')
+
+
+def capture_options():
+    """RequestMetrics arguments: what a request must keep in case it turns out slow."""
+    config = get_config()
+    if not config['ENABLED']:
+        return 0, None
+    return config['MAX_STATEMENTS'], config['RESOLVER_THRESHOLD_MS'] / 1000
+
+
+def is_slow(metrics, elapsed):
+    config = get_config()
+    return bool(config['ENABLED'] and metrics.operations and elapsed * 1000 >= config['THRESHOLD_MS'])
+
+
+def maybe_log(metrics, elapsed):
+    """Writes an entry per operation of a slow, sampled request."""
+    if not is_slow(metrics, elapsed):
+        return
+    config = get_config()
+    if random.random() >= config['SAMPLE_RATE']:
+        return
+    handler = get_handler(config)
+    for operation in metrics.operations:
+        entry = build_entry(operation, elapsed, config)
+        handler.handle(logging.makeLogRecord({'msg': json.dumps(entry, default=str)}))
+
+
+def get_handler(config):
+    path = log_path(config)
+    with _handlers_lock:
+        handler = _handlers.get(path)
+        if handler is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = _handlers[path] = RotatingFileHandler(
+                path, maxBytes=config['MAX_BYTES'], backupCount=config['BACKUP_COUNT'], encoding='utf-8'
+            )
+        return handler
+
+
+def build_entry(operation, elapsed, config):
+    document = operation.document
+    if document is None:
+        query = None
+    elif document.loc is not None:
+        query = document.loc.source.body
+    else:
+        query = print_ast(document)
+    statements = [
+        {
+            'sql': sql,
+            'ms': round(seconds * 1000, 3),
+            **({'params': params} if config['SQL_PARAMS'] else {}),
+        }
+        for sql, params, _, seconds in operation.statements
+    ]
+    return {
+        'time': timezone.now().isoformat(),
+        'operation': operation.name,
+        'duration_ms': round(elapsed * 1000, 3),
+        'phases_ms': {phase: round(seconds * 1000, 3) for phase, seconds in operation.phases.items()},
+        'sql_queries': operation.sql_queries,
+        'sql_ms': round(operation.sql_seconds * 1000, 3),
+        'query': query,
+        'variables': redact(operation.variables, config['REDACT_VARIABLES']),
+        'resolvers': resolver_tree(operation.resolver_paths),
+        'statements': statements,
+        'statements_truncated': operation.sql_queries > len(statements),
+        'explain': explain_slowest(operation.statements, config['EXPLAIN_SLOWEST']),
+    }
+
+
+def redact(value, patterns):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if any(pattern in key.lower() for pattern in patterns) else redact(item, patterns)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, patterns) for item in value]
+    return value
+
+
+def resolver_tree(paths):
+    """
+    Nests resolver timings by field path, merging list items: an N+1 shows
+    up as one child with as many calls as there were parents.
+    """
+    root = {}
+    for path, seconds in paths:
+        fields = [key for key in path if isinstance(key, str)]
+        children = root
+        for field in fields[:-1]:
+            children = children.setdefault(field, {'calls': 0, 'ms': 0.0, 'children': {}})['children']
+        node = children.setdefault(fields[-1], {'calls': 0, 'ms': 0.0, 'children': {}})
+        node['calls'] += 1
+        node['ms'] += seconds * 1000
+
+    def as_list(nodes):
+        return [
+            {'field': field, 'calls': node['calls'], 'ms': round(node['ms'], 3), 'children': as_list(node['children'])}
+            for field, node in sorted(nodes.items(), key=lambda item: -item[1]['ms'])
+        ]
+    return as_list(root)
+
+
+def explain_slowest(statements, count):
+    selects = [
+        statement for statement in statements
+        if statement[0] and statement[0].lstrip().upper().startswith(('SELECT', 'WITH'))
+    ]
+    explained = []
+    for sql, params, alias, seconds in sorted(selects, key=lambda statement: -statement[3])[:count]:
+        entry = {'sql': sql, 'ms': round(seconds * 1000, 3)}
+        try:
+            entry['plan'] = explain(connections[alias], sql, params)
+        except DatabaseError as e:
+            entry['error'] = str(e)
+        explained.append(entry)
+    return explained
+
+
+def explain(connection, sql, params):
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def normalize_sql(sql):
+    """Folds IN lists and whitespace so repeats of one statement compare equal."""
+    sql = re.sub(r'\(\s*%s(?:\s*,\s*%s)*\s*\)', '(...)', sql or '')
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def read_entries(path):
+    """Entries of the log and its rotated files, oldest first."""
+    path = Path(path)
+    # RotatingFileHandler keeps the oldest entries in the highest suffix
+    rotated = sorted(
+        (file for file in path.parent.glob(f'{path.name}.*') if file.suffix[1:].isdigit()),
+        key=lambda file: int(file.suffix[1:]),
+        reverse=True,
+    )
+    for file in [*rotated, path]:
+        if not file.exists():
+            continue
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def summarize(entries):
+    """
+    Groups entries by operation: how often each was slow, its latency
+    percentiles, SQL counts and the statement it repeated most in a
+    single request.
+    """
+    operations = {}
+    for entry in entries:
+        summary = operations.setdefault(entry['operation'], {
+            'operation': entry['operation'], 'count': 0, 'durations': [], 'sql_queries': [],
+            'repeated_sql': None, 'repeats': 0,
+        })
+        summary['count'] += 1
+        summary['durations'].append(entry['duration_ms'])
+        summary['sql_queries'].append(entry['sql_queries'])
+        repeats = Counter(normalize_sql(statement['sql']) for statement in entry['statements'])
+        if repeats:
+            sql, times = repeats.most_common(1)[0]
+            if times > summary['repeats']:
+                summary['repeated_sql'], summary['repeats'] = sql, times
+
+    results = []
+    for summary in operations.values():
+        durations = sorted(summary.pop('durations'))
+        queries = summary.pop('sql_queries')
+        summary.update(
+            p50_ms=durations[len(durations) // 2],
+            p95_ms=durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            max_ms=durations[-1],
+            total_ms=sum(durations),
+            avg_sql_queries=sum(queries) / len(queries),
+        )
+        results.append(summary)
+    return sorted(results, key=lambda summary: -summary['total_ms'])
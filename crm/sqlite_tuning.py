@@ -0,0 +1,76 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Applied in this order to every new SQLite connection
+    'PRAGMAS': {
+        # Wait for a lock for up to this many ms instead of failing at once
+        'busy_timeout': 5000,
+        # Readers no longer block on a writer, nor the writer on readers
+        'journal_mode': 'WAL',
+        # In WAL mode, only a power loss can lose the last commits
+        'synchronous': 'NORMAL',
+        # Page cache per connection; negative values are KiB (64 MiB)
+        'cache_size': -64000,
+        # Read the database through a memory map of up to 256 MiB
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+# The SQLite defaults, for comparison (see benchmark_sqlite_concurrency)
+SQLITE_DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'temp_store': 'DEFAULT',
+}
+
+NAME_PATTERN = re.compile(r'^[a-z_]+$')
+VALUE_PATTERN = re.compile(r'^(-?\d+|[A-Za-z]+)$')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SQLITE_TUNING', {})}
+
+
+def pragma_statements(pragmas):
+    # PRAGMA takes no bound parameters, so only plain names and values pass
+    statements = []
+    for name, value in pragmas.items():
+        if not NAME_PATTERN.match(name) or not VALUE_PATTERN.match(str(value)):
+            raise ImproperlyConfigured(f"Invalid SQLite pragma: {name} = {value!r}")
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """
+    A connection_created receiver, connected in CrmConfig.ready(), that
+    runs SQLITE_TUNING['PRAGMAS'] on each new SQLite connection. They last
+    as long as the connection, which CONN_MAX_AGE keeps open across
+    requests.
+    """
+    config = get_config()
+    if connection.vendor != 'sqlite' or not config['ENABLED']:
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(config['PRAGMAS']):
+            cursor.execute(statement)
+
+
+def current_pragmas(connection, names=None):
+    """The values a connection is using, for checks and reports."""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names or DEFAULTS['PRAGMAS']:
+            if not NAME_PATTERN.match(name):
+                raise ValueError(f"Invalid SQLite pragma: {name}")
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
@@ -1,8 +1,9 @@
 import datetime
 import logging
-from celery import shared_task
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from celery import chord, shared_task
+
+from . import maintenance, sales_rollups
+from .graphql_client import execute_graphql
 
 logger = logging.getLogger(__name__)
 
@@ -10,14 +11,13 @@ logger = logging.getLogger(__name__)
 def generatecrmreport():
     """
     A Celery task that generates a weekly CRM report by querying the
-    GraphQL endpoint and logging the results to a file.
+    GraphQL schema and logging the results to a file.
     """
     log_file_path = "/tmp/crmreportlog.txt" # Corrected log file name
-    graphql_url = "http://localhost:8000/graphql"
     logger.info("Starting CRM report generation task...")
 
     # Define the GraphQL query to fetch the report data
-    report_query = gql("""
+    report_query = """
         query CrmReportQuery {
             crmReport {
                 totalCustomers
@@ -25,12 +25,10 @@ def generatecrmreport():
                 totalRevenue
             }
         }
-    """)
+    """
 
     try:
-        transport = RequestsHTTPTransport(url=graphql_url, timeout=30)
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        result = client.execute(report_query)
+        result = execute_graphql(report_query)
 
         report_data = result.get('crmReport', {})
         customers = report_data.get('totalCustomers', 0)
@@ -57,3 +55,52 @@ def generatecrmreport():
         with open(log_file_path, "a") as f:
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             f.write(f"[{timestamp}] ERROR generating report: {e}\n")
+
+
+# -- Maintenance jobs (see maintenance.py) --
+# start_maintenance() plans the chunks and fans the lanes out as a chord
+# whose callback sums their counts.
+
+@shared_task
+def run_maintenance_lane(job, ranges, options=None):
+    """Runs one lane of a maintenance job: its chunks, one after the other."""
+    return maintenance.run_lane(job, ranges, options)
+
+
+@shared_task
+def collect_maintenance_results(results, job):
+    totals = maintenance.combine(results)
+    logger.info(f"Maintenance job {job} finished: {totals}")
+    return totals
+
+
+def start_maintenance(job, chunk_size=None, concurrency=None, options=None):
+    """
+    Starts `job` over its whole table and returns the AsyncResult of its
+    combined counts, or None when there is nothing to do. Under
+    CELERY_TASK_ALWAYS_EAGER the job runs in this process before this
+    returns.
+    """
+    lanes = maintenance.plan(job, chunk_size, concurrency, options)
+    if not lanes:
+        return None
+    return chord(
+        run_maintenance_lane.s(job, lane, options) for lane in lanes
+    )(collect_maintenance_results.s(job))
+
+
+@shared_task
+def run_maintenance(job, chunk_size=None, concurrency=None, options=None):
+    """The coordinator, for Celery Beat: plans the job and returns the id of its chord."""
+    result = start_maintenance(job, chunk_size, concurrency, options)
+    return result.id if result is not None else None
+
+
+@shared_task
+def roll_up_sales():
+    """Adds the orders created since the last run to the daily sales rollups (see sales_rollups.py)."""
+    result = sales_rollups.roll_up()
+    logger.info(
+        f"Recomputed {result.days} stale days, rolled up {result.orders} orders, through order {result.last_order_id}."
+    )
+    return result.orders
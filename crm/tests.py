@@ -1,3 +1,1307 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from asgiref.sync import sync_to_async
+from celery import Celery, current_app
+from django.db import IntegrityError, connection, connections
+from django.db.models import Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphene_django.settings import graphene_settings
+from graphql_relay import to_global_id
+
+from .async_execution import AsyncDataLoader
+from .benchmarks import compare, load_baseline, run_suite
+from .db_router import copy_to_replicas
+from .export import stream_export
+from .imports import import_records
+from .graphql_client import GraphQLClientError, execute_graphql
+from .maintenance import MaintenanceError, get_job, plan
+from .metrics import registry
+from .models import CRMReport, Customer, DailyProductSales, DailySales, OrderReminder, Product, Order
+from .persisted_queries import sha256, store
+from .reminders import send_reminders
+from .restock import restock_low_stock
+from .schema import BulkCreateCustomers
+from .search import SQLiteFTS5Backend, fts_table
+from . import customer_stats, loaders, sales_rollups
+from .seeding import SeedOptions, seed
+from .tasks import start_maintenance
+from .slowlog import read_entries
+from .sqlite_tuning import current_pragmas, pragma_statements
+from .result_cache import get_result_cache
+from .views import CRMGraphQLView
+
+
+class GraphQLTestCase(TestCase):
+    """Posts operations to /graphql the same way a client would."""
+
+    def setUp(self):
+        # Rolling back a test's rows sends no signals, so start each test
+        # with an empty result cache
+        get_result_cache().clear()
+
+    def post(self, body):
+        return self.client.post('/graphql', json.dumps(body), content_type='application/json').json()
+
+    def query(self, query, variables=None):
+        content = self.post({'query': query, 'variables': variables})
+        self.assertNotIn('errors', content)
+        return content['data']
+
+
+class QueryOptimizerTests(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        products = [
+            Product.objects.create(name=f'Product {i}', price=Decimal('10.00'), stock=i)
+            for i in range(5)
+        ]
+        for i in range(10):
+            customer = Customer.objects.create(name=f'Customer {i}', email=f'customer{i}@example.com')
+            order = Order.objects.create(customer=customer, total_amount=Decimal('20.00'))
+            order.products.set(products[:i % 5 + 1])
+
+    def test_all_orders_with_customer_is_one_join(self):
+        # COUNT for the connection, then the page joined with its customers
+        with self.assertNumQueries(2) as ctx:
+            data = self.query('{ allOrders { edges { node { id customer { email } } } } }')
+        self.assertEqual(len(data['allOrders']['edges']), 10)
+        page_sql = ctx.captured_queries[1]['sql']
+        self.assertIn('JOIN "crm_customer"', page_sql)
+        self.assertNotIn('"crm_customer"."phone"', page_sql)
+        self.assertNotIn('"crm_order"."created_at"', page_sql)
+
+    def test_all_orders_with_products_prefetches_once(self):
+        with self.assertNumQueries(3):
+            data = self.query('{ allOrders { edges { node { id products { edges { node { name } } } } } } }')
+        counts = [len(edge['node']['products']['edges']) for edge in data['allOrders']['edges']]
+        self.assertEqual(counts, [i % 5 + 1 for i in range(10)])
+
+    def test_legacy_orders_list_with_nested_relations(self):
+        # orders, customers' orders, products and the products' orders
+        query = '''
+            {
+                orders {
+                    id
+                    customer { name orders(first: 5) { edges { node { id } } } }
+                    products(first: 5) { edges { node { name orders(first: 5) { edges { node { id } } } } } }
+                }
+            }
+        '''
+        with self.assertNumQueries(4):
+            data = self.query(query)
+        self.assertEqual(len(data['orders']), 10)
+
+    def test_filtered_nested_connection_falls_back_to_queryset(self):
+        with self.assertNumQueries(1 + 2 * 10):
+            data = self.query('{ orders { id products(name: "Product 0") { edges { node { name } } } } }')
+        self.assertTrue(all(len(order['products']['edges']) == 1 for order in data['orders']))
+
+    def test_all_customers_only_selects_requested_columns(self):
+        with self.assertNumQueries(1) as ctx:
+            data = self.query('{ allCustomers(filter: { nameIcontains: "Customer 1" }) { edges { node { name } } } }')
+        self.assertEqual(len(data['allCustomers']['edges']), 1)
+        self.assertNotIn('"crm_customer"."email"', ctx.captured_queries[0]['sql'])
+
+    def test_all_products_with_fragment(self):
+        query = '''
+            query { allProducts(orderBy: "-stock") { edges { node { ...ProductFields } } } }
+            fragment ProductFields on ProductType { name stock orders { edges { node { id } } } }
+        '''
+        with self.assertNumQueries(2):
+            data = self.query(query)
+        self.assertEqual(data['allProducts']['edges'][0]['node']['stock'], 4)
+
+
+class DataLoaderTests(GraphQLTestCase):
+    QUERY = '''
+        {
+            allOrders(first: 50) {
+                edges { node {
+                    customer { name orders(first: 5) { edges { node { id } } } }
+                    products(first: 5) { edges { node { name orders(first: 5) { edges { node { id } } } } } }
+                } }
+            }
+        }
+    '''
+
+    def add_orders(self, count):
+        products = [Product.objects.create(name=f'Product {i}', price=Decimal('10.00'), stock=5) for i in range(3)]
+        for i in range(count):
+            customer = Customer.objects.create(name=f'Customer {i}', email=f'customer{i}-{count}@example.com')
+            order = Order.objects.create(customer=customer, total_amount=Decimal('20.00'))
+            order.products.set(products[:i % 3 + 1])
+
+    def test_nested_relations_cost_the_same_for_any_page_size(self):
+        # COUNT, the page joined with its customers, then one batch each
+        # for the customers' orders, the orders' products and their orders
+        self.add_orders(3)
+        with self.assertNumQueries(5):
+            data = self.query(self.QUERY)
+        self.assertEqual(len(data['allOrders']['edges']), 3)
+
+        self.add_orders(20)
+        with self.assertNumQueries(5):
+            data = self.query(self.QUERY)
+        edges = data['allOrders']['edges']
+        self.assertEqual(len(edges), 23)
+        self.assertEqual(len(edges[-1]['node']['customer']['orders']['edges']), 1)
+        self.assertEqual(len(edges[-1]['node']['products']['edges']), 20 % 3 or 3)
+
+    def test_loaders_batch_each_level_without_the_optimizer(self):
+        # The optimizer prefetches everything the query asks for, so with it
+        # disabled each relation is left to its DataLoader
+        self.add_orders(6)
+        batch_functions = ('load_customers', 'load_orders_by_customer', 'load_products_by_order', 'load_orders_by_product')
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(mock.patch('crm.schema.optimize', lambda queryset, info: queryset))
+            loads = {
+                name: stack.enter_context(mock.patch(f'crm.loaders.{name}', wraps=getattr(loaders, name)))
+                for name in batch_functions
+            }
+            # COUNT and the page, then one query per loader
+            with self.assertNumQueries(6):
+                data = self.query(self.QUERY)
+        self.assertEqual(len(data['allOrders']['edges']), 6)
+        for name, load in loads.items():
+            self.assertEqual(load.call_count, 1, name)
+        orders = Order.objects.order_by('pk')
+        self.assertEqual(sorted(loads['load_customers'].call_args.args[0]), [order.customer_id for order in orders])
+        self.assertEqual(sorted(loads['load_products_by_order'].call_args.args[0]), [order.pk for order in orders])
+        self.assertEqual(len(loads['load_orders_by_product'].call_args.args[0]), 3)
+
+
+class KeysetPaginationTests(GraphQLTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Repeated stock values make the id tie-breaker matter
+        for i in range(12):
+            Product.objects.create(name=f'Product {i:02}', price=Decimal('5.00'), stock=i % 4)
+
+    def walk(self, order_by, first=5):
+        query = '''
+            query ($after: String, $orderBy: String, $first: Int) {
+                allProductsKeyset(first: $first, after: $after, orderBy: $orderBy) {
+                    edges { node { name } }
+                    pageInfo { hasNextPage endCursor }
+                }
+            }
+        '''
+        names, after = [], None
+        while True:
+            page = self.query(query, {'after': after, 'orderBy': order_by, 'first': first})['allProductsKeyset']
+            names += [edge['node']['name'] for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                return names
+            after = page['pageInfo']['endCursor']
+
+    def test_pages_follow_the_sort_key_then_id(self):
+        expected = list(Product.objects.order_by('-stock', '-id').values_list('name', flat=True))
+        self.assertEqual(self.walk('-stock'), expected)
+        expected = list(Product.objects.order_by('stock', 'id').values_list('name', flat=True))
+        self.assertEqual(self.walk('stock', first=3), expected)
+
+    def test_last_before_walks_backwards(self):
+        data = self.query('{ allProductsKeyset(first: 6, orderBy: "name") { pageInfo { endCursor } } }')
+        cursor = data['allProductsKeyset']['pageInfo']['endCursor']
+        data = self.query(
+            'query ($before: String) { allProductsKeyset(last: 2, before: $before, orderBy: "name") '
+            '{ edges { node { name } } pageInfo { hasPreviousPage } } }',
+            {'before': cursor},
+        )
+        page = data['allProductsKeyset']
+        self.assertEqual([edge['node']['name'] for edge in page['edges']], ['Product 03', 'Product 04'])
+        self.assertTrue(page['pageInfo']['hasPreviousPage'])
+
+    def test_first_zero_is_an_empty_page(self):
+        data = self.query('{ allProductsKeyset(first: 0) { edges { node { name } } pageInfo { hasNextPage } } }')
+        self.assertEqual(data['allProductsKeyset'], {'edges': [], 'pageInfo': {'hasNextPage': True}})
+        data = self.query('{ allProductsKeyset(last: 0) { edges { node { name } } } }')
+        self.assertEqual(data['allProductsKeyset']['edges'], [])
+        content = self.post({'query': '{ allProductsKeyset(first: -1) { edges { node { name } } } }'})
+        self.assertIn("Argument 'first' must be a non-negative integer.", content['errors'][0]['message'])
+
+    def test_total_count_only_when_selected(self):
+        with self.assertNumQueries(1):
+            self.query('{ allProductsKeyset(first: 2) { edges { node { name } } } }')
+        with self.assertNumQueries(2):
+            data = self.query('{ allProductsKeyset(first: 2, filter: { lowStock: 1 }) { totalCount } }')
+        self.assertEqual(data['allProductsKeyset']['totalCount'], 3)
+
+    def test_orders_default_to_newest_first(self):
+        customer = Customer.objects.create(name='Keyset', email='keyset@example.com')
+        for amount in ('1.00', '2.00', '3.00'):
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        data = self.query('{ allOrdersKeyset(first: 2) { edges { node { totalAmount } } pageInfo { hasNextPage } } }')
+        amounts = [edge['node']['totalAmount'] for edge in data['allOrdersKeyset']['edges']]
+        self.assertEqual(amounts, ['3.00', '2.00'])
+        self.assertTrue(data['allOrdersKeyset']['pageInfo']['hasNextPage'])
+
+
+class BulkCreateCustomersTests(GraphQLTestCase):
+    MUTATION = '''
+        mutation ($input: [CustomerInput!]!, $upsert: Boolean) {
+            bulkCreateCustomers(input: $input, upsert: $upsert) {
+                customers { name email phone }
+                errors
+            }
+        }
+    '''
+
+    def test_errors_match_per_record_validation(self):
+        Customer.objects.create(name='Existing', email='existing@example.com')
+        records = [
+            {'name': 'A', 'email': 'a@example.com', 'phone': '+1234567890'},
+            {'name': 'B', 'email': 'existing@example.com'},
+            {'name': 'C', 'email': 'c@example.com', 'phone': 'not-a-phone'},
+            {'name': 'A again', 'email': 'a@example.com'},
+            {'name': 'D', 'email': 'd@example.com', 'phone': '(555) 444-5555'},
+        ]
+        # SELECT existing emails, INSERT, read back, bump the CRM report,
+        # plus savepoints
+        with self.assertNumQueries(8):
+            data = self.query(self.MUTATION, {'input': records})['bulkCreateCustomers']
+        self.assertEqual([c['email'] for c in data['customers']], ['a@example.com', 'd@example.com'])
+        self.assertEqual(data['errors'], [
+            "Record 2: Email 'existing@example.com' already exists.",
+            "Record 3: Invalid phone number format for 'not-a-phone'.",
+            "Record 4: Email 'a@example.com' already exists.",
+        ])
+
+    def test_upsert_updates_existing_customers(self):
+        Customer.objects.create(name='Old name', email='existing@example.com', phone='555-123-4567')
+        records = [
+            {'name': 'New name', 'email': 'existing@example.com', 'phone': '555-987-6543'},
+            {'name': 'Fresh', 'email': 'fresh@example.com'},
+        ]
+        data = self.query(self.MUTATION, {'input': records, 'upsert': True})['bulkCreateCustomers']
+        self.assertEqual(data['errors'], [])
+        self.assertEqual(Customer.objects.count(), 2)
+        customer = Customer.objects.get(email='existing@example.com')
+        self.assertEqual((customer.name, customer.phone), ('New name', '555-987-6543'))
+
+    def test_upsert_returns_the_stored_customers(self):
+        existing = Customer.objects.create(name='Old name', email='existing@example.com')
+        Order.objects.create(customer=existing, total_amount=Decimal('10.00'))
+        customer_stats.refresh({existing.pk})
+        records = [
+            {'name': 'Fresh', 'email': 'fresh@example.com'},
+            {'name': 'New name', 'email': 'existing@example.com'},
+        ]
+        data = self.query(
+            'mutation ($input: [CustomerInput!]!) { bulkCreateCustomers(input: $input, upsert: true) '
+            '{ customers { id name orderCount lifetimeValue } errors } }',
+            {'input': records},
+        )['bulkCreateCustomers']
+        self.assertEqual([(c['name'], c['orderCount'], c['lifetimeValue']) for c in data['customers']], [
+            ('Fresh', 0, '0.00'),
+            ('New name', 1, '10.00'),
+        ])
+        self.assertEqual(data['customers'][1]['id'], to_global_id('CustomerType', existing.pk))
+
+    def test_errors_follow_input_order(self):
+        insert = BulkCreateCustomers.insert
+
+        def fail_on_first(customers, upsert):
+            if any(customer.email == 'a@example.com' for customer in customers):
+                raise IntegrityError('rejected')
+            insert(customers, upsert)
+
+        records = [
+            {'name': 'A', 'email': 'a@example.com'},
+            {'name': 'B', 'email': 'b@example.com', 'phone': 'not-a-phone'},
+            {'name': 'C', 'email': 'c@example.com'},
+        ]
+        with mock.patch.object(BulkCreateCustomers, 'insert', staticmethod(fail_on_first)):
+            data = self.query(self.MUTATION, {'input': records})['bulkCreateCustomers']
+        self.assertEqual([c['email'] for c in data['customers']], ['c@example.com'])
+        self.assertEqual(data['errors'], [
+            "Record 1: Could not create customer 'A'. Error: rejected",
+            "Record 2: Invalid phone number format for 'not-a-phone'.",
+        ])
+
+
+class PersistedQueryTests(GraphQLTestCase):
+    QUERY = '{ allProducts { edges { node { name } } } }'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+
+    def persisted(self, query_hash, query=None):
+        body = {'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': query_hash}}}
+        if query:
+            body['query'] = query
+        return self.post(body)
+
+    def test_unknown_hash_asks_client_to_register(self):
+        content = self.persisted(sha256(self.QUERY))
+        self.assertEqual(content['errors'][0]['message'], 'PersistedQueryNotFound')
+        self.assertEqual(content['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+    def test_registered_hash_runs_without_query_text(self):
+        query_hash = sha256(self.QUERY)
+        self.assertNotIn('errors', self.persisted(query_hash, self.QUERY))
+        content = self.persisted(query_hash)
+        self.assertEqual(content['data']['allProducts']['edges'][0]['node']['name'], 'Laptop')
+
+    def test_hash_mismatch_is_rejected(self):
+        content = self.persisted(sha256('{ hello }'), self.QUERY)
+        self.assertEqual(content['errors'][0]['message'], 'provided sha does not match query')
+
+    def test_malformed_extension_is_a_graphql_error(self):
+        for extensions in ({'persistedQuery': 'x'}, {'persistedQuery': [1]}, [1],
+                           {'persistedQuery': {'version': 1, 'sha256Hash': ['x']}}):
+            response = self.client.post('/graphql', json.dumps({'extensions': extensions}), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('must be', response.json()['errors'][0]['message'])
+
+    def test_registry_file_is_preloaded(self):
+        query_hash = sha256(self.QUERY)
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as registry:
+            json.dump({query_hash: self.QUERY}, registry)
+            registry.flush()
+            store.load_registry(registry.name, graphene_settings.SCHEMA.graphql_schema)
+        try:
+            content = self.persisted(query_hash)
+        finally:
+            store.registry = {}
+        self.assertEqual(content['data']['allProducts']['edges'][0]['node']['name'], 'Laptop')
+
+
+class DocumentCacheTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = CRMGraphQLView.document_cache
+        self.cache.clear()
+
+    def test_repeated_query_is_parsed_once(self):
+        for _ in range(3):
+            self.query('{ hello }')
+        self.assertEqual(self.cache.info()['hits'], 2)
+        self.assertEqual(self.cache.info()['misses'], 1)
+
+    def test_validation_errors_are_cached(self):
+        for _ in range(2):
+            content = self.post({'query': '{ noSuchField }'})
+            self.assertIn('errors', content)
+        self.assertEqual(self.cache.info()['hits'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with self.settings(GRAPHQL_DOCUMENT_CACHE_SIZE=2):
+            self.query('{ hello }')
+            self.query('{ a: hello }')
+            self.query('{ hello }')
+            self.query('{ b: hello }')
+            self.assertEqual(self.cache.info()['size'], 2)
+            self.query('{ hello }')
+            self.assertEqual(self.cache.info()['hits'], 2)
+
+
+class QueryCostTests(GraphQLTestCase):
+    def test_cost_is_reported_in_extensions(self):
+        content = self.post({'query': '{ allOrders(first: 10) { edges { node { id customer { email } } } } }'})
+        # allOrders + 10 x (edge + node + customer)
+        self.assertEqual(content['extensions']['cost'], {'cost': 31, 'depth': 2})
+
+    def test_first_from_variables_is_used(self):
+        query = 'query ($n: Int = 5) { allProductsKeyset(first: $n) { edges { node { name } } } }'
+        self.assertEqual(self.post({'query': query})['extensions']['cost']['cost'], 11)
+        content = self.post({'query': query, 'variables': {'n': 20}})
+        self.assertEqual(content['extensions']['cost']['cost'], 41)
+
+    def test_badly_typed_page_size_is_a_graphql_error(self):
+        query = 'query ($n: Int) { allProductsKeyset(first: $n) { edges { node { name } } } }'
+        for value in ('abc', [1], {}, True):
+            response = self.client.post(
+                '/graphql', json.dumps({'query': query, 'variables': {'n': value}}), content_type='application/json'
+            )
+            # graphene-django's status for an operation that ran no data,
+            # as for any variable coercion error; not a 500
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Variable '$n' got invalid value", response.json()['errors'][0]['message'])
+
+    def test_expensive_query_is_rejected_before_execution(self):
+        query = '''
+            {
+                allOrders(first: 10000) { edges { node {
+                    customer { orders(first: 100) { edges { node {
+                        products(first: 100) { edges { node { name } } }
+                    } } } }
+                } } }
+            }
+        '''
+        with self.assertNumQueries(0):
+            content = self.post({'query': query})
+        self.assertEqual(content['errors'][0]['extensions']['code'], 'QUERY_TOO_EXPENSIVE')
+        self.assertNotIn('data', content)
+
+    def test_deep_query_is_rejected(self):
+        with self.settings(GRAPHQL_QUERY_COST={'MAX_DEPTH': 3}):
+            content = self.post({'query': '''
+                { orders { customer { orders { edges { node { customer { name } } } } } } }
+            '''})
+        self.assertEqual(content['errors'][0]['extensions']['code'], 'QUERY_TOO_DEEP')
+
+    def test_client_budget_throttles(self):
+        with self.settings(GRAPHQL_QUERY_COST={'CLIENT_BUDGET_PER_MINUTE': 50}):
+            cache.clear()
+            query = '{ allProducts(first: 10) { edges { node { name } } } }'
+            self.assertNotIn('errors', self.post({'query': query}))
+            self.assertNotIn('errors', self.post({'query': query}))
+            content = self.post({'query': query})
+        self.assertEqual(content['errors'][0]['extensions']['code'], 'QUERY_THROTTLED')
+
+
+class CRMReportTests(GraphQLTestCase):
+    REPORT = '{ crmReport { totalCustomers totalOrders totalRevenue } }'
+
+    def test_mutations_keep_the_report_current(self):
+        product = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        data = self.query('mutation { createCustomer(input: { name: "A", email: "a@example.com" }) { customer { id } } }')
+        customer_id = data['createCustomer']['customer']['id']
+        self.query('mutation { bulkCreateCustomers(input: [{ name: "B", email: "b@example.com" }]) { errors } }')
+        self.query(
+            'mutation ($c: ID!, $p: ID!) { createOrder(input: { customerId: $c, productIds: [$p] }) { order { id } } }',
+            {'c': Customer.objects.get(email='a@example.com').pk, 'p': product.pk},
+        )
+        with self.assertNumQueries(1):
+            report = self.query(self.REPORT)['crmReport']
+        self.assertEqual(report, {'totalCustomers': 2, 'totalOrders': 1, 'totalRevenue': '999.99'})
+
+    def test_deletes_keep_the_report_current(self):
+        alice = Customer.objects.create(name='Alice', email='alice@example.com')
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        for customer, amount in ((alice, '10.00'), (alice, '5.00'), (bob, '7.00')):
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        CRMReport.rebuild()
+        # Cascades to Alice's orders
+        alice.delete()
+        Order.objects.filter(customer=bob).delete()
+        report = self.query(self.REPORT)['crmReport']
+        self.assertEqual(report, {'totalCustomers': 1, 'totalOrders': 0, 'totalRevenue': '0.00'})
+
+    def test_customer_cascade_updates_the_report_once(self):
+        alice = Customer.objects.create(name='Alice', email='alice@example.com')
+        for amount in ('10.00', '5.00', '7.00'):
+            Order.objects.create(customer=alice, total_amount=Decimal(amount))
+        CRMReport.rebuild()
+        with CaptureQueriesContext(connection) as ctx:
+            Customer.objects.filter(pk=alice.pk).delete()
+        updates = [query for query in ctx.captured_queries if query['sql'].startswith('UPDATE "crm_crmreport"')]
+        self.assertEqual(len(updates), 1)
+        report = CRMReport.get()
+        self.assertEqual((report.total_customers, report.total_orders, report.total_revenue), (0, 0, Decimal('0.00')))
+
+    def test_missing_row_is_computed_without_writes(self):
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+        CRMReport.objects.all().delete()
+        with CaptureQueriesContext(connection) as ctx:
+            report = self.query(self.REPORT)['crmReport']
+        self.assertEqual(report, {'totalCustomers': 1, 'totalOrders': 1, 'totalRevenue': '10.00'})
+        self.assertFalse(any(query['sql'].startswith(('INSERT', 'UPDATE')) for query in ctx.captured_queries))
+        self.assertFalse(CRMReport.objects.exists())
+
+    def test_deletes_survive_a_drifted_report(self):
+        CRMReport.rebuild()
+        # Not counted: written without the mutations
+        customer = Customer.objects.create(name='Imported', email='imported@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('1.00'))
+        customer.delete()
+        report = CRMReport.get()
+        self.assertEqual((report.total_customers, report.total_orders), (0, 0))
+
+    def test_rebuild_command_repairs_drift(self):
+        Customer.objects.create(name='Imported', email='imported@example.com')
+        self.assertEqual(self.query(self.REPORT)['crmReport']['totalCustomers'], 0)
+        call_command('rebuild_crm_report', stdout=io.StringIO())
+        self.assertEqual(self.query(self.REPORT)['crmReport']['totalCustomers'], 1)
+
+
+class ResultCacheTests(GraphQLTestCase):
+    PRODUCTS = '{ allProducts { edges { node { name stock } } } }'
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+
+    def test_repeated_query_is_served_from_cache(self):
+        expected = self.query(self.PRODUCTS)
+        with self.assertNumQueries(0):
+            # Formatting differences normalize to the same document
+            self.assertEqual(self.query('query {allProducts {edges {node {name, stock}}}}'), expected)
+        self.assertEqual(get_result_cache().info()['hits'], 1)
+
+    def test_writes_invalidate(self):
+        self.query(self.PRODUCTS)
+        self.product.name = 'Desktop'
+        self.product.save()
+        self.assertEqual(self.query(self.PRODUCTS)['allProducts']['edges'][0]['node']['name'], 'Desktop')
+
+        # queryset.update() bypasses post_save
+        self.query('mutation { updateLowStock { success } }')
+        self.assertEqual(self.query(self.PRODUCTS)['allProducts']['edges'][0]['node']['stock'], 15)
+
+    def test_filters_depend_on_related_models(self):
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+        query = '{ orders(filter: { customerName: "Bob" }) { totalAmount } }'
+        self.assertEqual(self.query(query), {'orders': []})
+        customer.name = 'Bob'
+        customer.save()
+        self.assertEqual(len(self.query(query)['orders']), 1)
+
+
+class UpdateLowStockTests(GraphQLTestCase):
+    MUTATION = """mutation ($threshold: Int, $increment: Int, $filter: ProductFilterInput, $chunkSize: Int) {
+        updateLowStock(threshold: $threshold, increment: $increment, filter: $filter, chunkSize: $chunkSize) {
+            success message updatedProducts { name stock price }
+        }
+    }"""
+
+    def setUp(self):
+        super().setUp()
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=Decimal('9.99'), stock=i) for i in range(10)
+        ])
+
+    def test_restocks_in_one_statement(self):
+        with self.assertNumQueries(1):
+            result = restock_low_stock(threshold=3, increment=5)
+        self.assertEqual([product.stock for product in result], [5, 6, 7])
+        self.assertEqual(result[0].price, Decimal('9.99'))
+
+    def test_chunks_skip_gaps_in_ids(self):
+        products = list(Product.objects.order_by('pk'))
+        Product.objects.filter(pk__in=[product.pk for product in products[1:8]]).delete()
+        Product.objects.create(name='Product 1000', price=Decimal('9.99'), stock=0)
+        with CaptureQueriesContext(connection) as ctx:
+            result = restock_low_stock(threshold=20, increment=5, chunk_size=2)
+        self.assertEqual([product.stock for product in result], [5, 13, 14, 5])
+        updates = [query for query in ctx.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+
+    def test_updated_at_is_stored_like_orm_writes(self):
+        result = restock_low_stock(threshold=1, increment=5)
+        product = Product.objects.get(pk=result[0].pk)
+        self.assertEqual(result[0].updated_at, product.updated_at)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT updated_at, created_at FROM crm_product WHERE id = %s', [product.pk])
+            updated_at, created_at = cursor.fetchone()
+        # Same text format, so comparisons and ordering on the column hold
+        self.assertEqual(len(str(updated_at)), len(str(created_at)))
+        self.assertGreater(product.updated_at, product.created_at)
+
+    def test_threshold_increment_and_filter(self):
+        data = self.query(self.MUTATION, {'threshold': 5, 'increment': 100, 'filter': {'nameIcontains': 'Product 3'}})
+        self.assertEqual(data['updateLowStock']['updatedProducts'], [{'name': 'Product 3', 'stock': 103, 'price': '9.99'}])
+        self.assertEqual(Product.objects.filter(stock__gte=100).count(), 1)
+
+    def test_chunks(self):
+        data = self.query(self.MUTATION, {'threshold': 8, 'chunkSize': 3})
+        self.assertEqual([p['stock'] for p in data['updateLowStock']['updatedProducts']], list(range(10, 18)))
+        self.assertEqual(data['updateLowStock']['message'], 'Successfully restocked 8 products.')
+        data = self.query(self.MUTATION, {'chunkSize': 0})
+        self.assertFalse(data['updateLowStock']['success'])
+
+
+class SeedingTests(TestCase):
+    OPTIONS = dict(customers=30, products=10, orders=50, min_products_per_order=2, max_products_per_order=3,
+                   chunk_size=16)
+
+    def test_seeds_deterministically(self):
+        stats = seed(SeedOptions(**self.OPTIONS))
+        self.assertEqual(stats.rows['order'], 50)
+        self.assertEqual(Order.products.through.objects.count(), stats.rows['order_products'])
+        self.assertTrue(all(2 <= order.products.count() <= 3 for order in Order.objects.all()[:10]))
+        first = list(Customer.objects.order_by('pk').values_list('name', 'email'))
+
+        seed(SeedOptions(**self.OPTIONS, clear=True))
+        self.assertEqual(list(Customer.objects.order_by('pk').values_list('name', 'email')), first)
+        order = Order.objects.order_by('pk').first()
+        self.assertEqual(order.total_amount, sum(product.price for product in order.products.all()))
+        self.assertEqual(CRMReport.get().total_orders, 50)
+
+    def test_clear_removes_order_reminders(self):
+        seed(SeedOptions(**self.OPTIONS))
+        OrderReminder.objects.create(order=Order.objects.first())
+        seed(SeedOptions(**self.OPTIONS, clear=True))
+        self.assertFalse(OrderReminder.objects.exists())
+        # What the commit would have failed on
+        connection.check_constraints()
+
+
+class BenchmarkBudgetTests(TestCase):
+    def test_operations_stay_within_query_budgets(self):
+        # Timings depend on the machine; the query counts must not. The
+        # counts are the last run's, after per-process caches are warm.
+        results = run_suite(['small'], repeat=2)
+        self.assertEqual(set(results['small']), set(load_baseline()['budgets']))
+        self.assertEqual(compare(results, load_baseline(), check_time=False), [])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('19.99'), stock=5)
+        for i in range(5):
+            customer = Customer.objects.create(name=f'Customer {i}', email=f'c{i}@example.com')
+            order = Order.objects.create(customer=customer, total_amount=Decimal('1019.98'))
+            order.products.add(self.laptop, self.mouse)
+
+    def test_csv_joins_related_rows_per_chunk(self):
+        # One cursor over the orders and their customers, read a chunk at a
+        # time, plus one query per chunk for its products
+        with self.assertNumQueries(4):
+            content = b''.join(stream_export('orders', chunk_size=2)).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['customer_email'], 'c0@example.com')
+        self.assertEqual(rows[0]['product_names'], 'Laptop|Mouse')
+        self.assertEqual(rows[0]['total_amount'], '1019.98')
+
+    def test_gzipped_ndjson_endpoint_with_filters(self):
+        response = self.client.get('/export/orders', {'format': 'ndjson', 'gzip': '1', 'customer_name': 'customer 3'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.ndjson.gz"')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['product_ids'] for line in lines], [[self.laptop.pk, self.mouse.pk]])
+
+        self.assertEqual(self.client.get('/export/products', {'price_gte': 'cheap'}).status_code, 400)
+        self.assertEqual(self.client.get('/export/invoices').status_code, 400)
+
+    def test_endpoint_requires_staff(self):
+        self.assertEqual(Client().get('/export/customers').status_code, 403)
+        client = Client()
+        client.force_login(User.objects.create(username='user'))
+        self.assertEqual(client.get('/export/customers').status_code, 403)
+
+    def test_command_writes_a_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as output:
+            call_command('export_data', 'products', '--filter', 'name_icontains=lap', '-o', output.name)
+            self.assertEqual(open(output.name).read().splitlines()[1].split(',')[1], 'Laptop')
+
+
+class ImportTests(TestCase):
+    CUSTOMERS = (
+        'name,email,phone\n'
+        'Alice,alice@example.com,+1234567890\n'
+        'Bob,bob@example.com,not-a-phone\n'
+        'Carol,carol@example.com,\n'
+        'Alice Updated,alice@example.com,\n'
+    )
+
+    def test_command_validates_upserts_and_resumes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/customers.csv'
+            with open(path, 'w') as f:
+                f.write(self.CUSTOMERS)
+            call_command('import_data', 'customers', path, '--batch-size', '2', stdout=io.StringIO())
+
+            self.assertEqual(Customer.objects.get(email='alice@example.com').name, 'Alice Updated')
+            self.assertFalse(Customer.objects.filter(email='bob@example.com').exists())
+            self.assertEqual(CRMReport.get().total_customers, 2)
+            with open(f'{path}.errors.csv') as f:
+                report = list(csv.DictReader(f))
+            self.assertEqual([(r['row'], r['error']) for r in report], [('2', "Invalid phone number format for 'not-a-phone'.")])
+            with open(f'{path}.checkpoint.json') as f:
+                self.assertEqual(json.load(f)['row'], 4)
+
+            with open(path, 'a') as f:
+                f.write('Dave,dave@example.com,555-123-4567\n')
+            # Only the new row is read and written
+            with self.assertNumQueries(5):
+                call_command('import_data', 'customers', path, '--resume', stdout=io.StringIO())
+            self.assertEqual(Customer.objects.count(), 3)
+
+    def test_endpoint_resolves_order_lines_in_batches(self):
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        mouse = Product.objects.create(name='Mouse', price=Decimal('19.99'), stock=5)
+        body = '\n'.join(json.dumps(record) for record in [
+            {'customer_email': 'alice@example.com', 'product_names': ['Laptop', 'Mouse']},
+            {'customer_id': customer.pk, 'product_ids': [mouse.pk], 'order_date': '2025-01-01T00:00:00Z'},
+            {'customer_email': 'nobody@example.com', 'product_ids': [laptop.pk]},
+            {'customer_email': 'alice@example.com', 'product_names': ['Tablet']},
+        ])
+        response = self.client.post('/import/orders?format=ndjson', body, content_type='application/x-ndjson')
+        content = response.json()
+        self.assertEqual((content['written'], content['rejected'], content['committedRow']), (2, 2, 4))
+        self.assertEqual([error['row'] for error in content['errors']], [3, 4])
+        self.assertEqual(
+            sorted(Order.objects.values_list('total_amount', flat=True)), [Decimal('19.99'), Decimal('1019.98')]
+        )
+        self.assertEqual(CRMReport.get().total_revenue, Decimal('1039.97'))
+
+        products = 'id,name,price,stock\n,Tablet,299.00,3\n,Free,0,1\n'
+        content = self.client.post('/import/products', products, content_type='text/csv').json()
+        self.assertEqual(content['errors'], [{'row': 2, 'error': 'Price must be a positive value.'}])
+
+    @override_settings(CRM_IMPORT_MAX_BYTES=64)
+    def test_endpoint_requires_staff_csrf_and_a_small_body(self):
+        body = 'id,name,price,stock\n,Tablet,299.00,3\n'
+        self.assertEqual(self.client.post('/import/products', body, content_type='text/csv').status_code, 403)
+
+        staff = User.objects.create(username='staff', is_staff=True)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(staff)
+        self.assertEqual(client.post('/import/products', body, content_type='text/csv').status_code, 403)
+
+        self.client.force_login(staff)
+        response = self.client.post('/import/products', body * 4, content_type='text/csv')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(self.client.post('/import/products', body, content_type='text/csv').json()['written'], 1)
+
+
+class SearchTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = Customer.objects.create(name='Alice Johnson', email='alice@example.com')
+        self.bob = Customer.objects.create(name='Bob Laptopson', email='bob@example.com')
+        self.laptop = Product.objects.create(name='Gaming Laptop', price=Decimal('999.99'), stock=5)
+        order = Order.objects.create(customer=self.alice, total_amount=Decimal('999.99'))
+        order.products.add(self.laptop)
+
+    def test_search_ranks_across_types(self):
+        data = self.query('{ search(query: "laptop") { edges { rank node { __typename ... on CustomerType { name } } } } }')
+        typenames = sorted(edge['node']['__typename'] for edge in data['search']['edges'])
+        self.assertEqual(typenames, ['CustomerType', 'OrderType', 'ProductType'])
+
+        data = self.query('{ search(query: "laptop", types: [CUSTOMER], first: 1) { pageInfo { hasNextPage } edges { node { ... on CustomerType { name } } } } }')
+        self.assertEqual(data['search']['edges'], [{'node': {'name': 'Bob Laptopson'}}])
+        self.assertFalse(data['search']['pageInfo']['hasNextPage'])
+
+    def test_contains_filters_match_substrings_case_insensitively(self):
+        data = self.query('{ allCustomers(filter: { nameIcontains: "JOHNS" }) { edges { node { email } } } }')
+        self.assertEqual(data['allCustomers']['edges'], [{'node': {'email': 'alice@example.com'}}])
+        data = self.query('{ orders(filter: { productName: "aming" }) { customer { name } } }')
+        self.assertEqual(data['orders'], [{'customer': {'name': 'Alice Johnson'}}])
+        # Shorter than a trigram, served by LIKE
+        data = self.query('{ allCustomers(filter: { nameIcontains: "bo" }) { edges { node { email } } } }')
+        self.assertEqual(data['allCustomers']['edges'], [{'node': {'email': 'bob@example.com'}}])
+
+    def test_index_follows_writes(self):
+        self.bob.name = 'Robert Desktop'
+        self.bob.save()
+        Customer.objects.filter(pk=self.alice.pk).update(email='alice@laptops.example')
+        data = self.query('{ search(query: "laptop", types: [CUSTOMER]) { edges { node { ... on CustomerType { name } } } } }')
+        self.assertEqual(data['search']['edges'], [{'node': {'name': 'Alice Johnson'}}])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+
+    def test_missing_index_falls_back_to_like(self):
+        backend = SQLiteFTS5Backend()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {fts_table(Product)}')
+        with CaptureQueriesContext(connection) as ctx:
+            queryset = backend.filter_contains(Product.objects.all(), 'name', 'aming')
+            self.assertEqual(list(queryset), [self.laptop])
+            results = backend.search('laptop')
+            self.assertEqual([type(instance) for instance in results], [Customer, Product, Order])
+            self.assertFalse(any('_fts' in query['sql'] for query in ctx.captured_queries))
+        # Customers still have their table
+        self.assertTrue(backend.is_available(Customer))
+
+
+class MetricsTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+
+    @override_settings(GRAPHQL_METRICS={'EXTENSIONS': True, 'RESOLVER_THRESHOLD_MS': 0, 'SCRAPE_TOKEN': 's3cret'})
+    def test_operation_timings(self):
+        with CaptureQueriesContext(connection) as queries:
+            content = self.post({'query': 'query RecentOrders { orders { totalAmount customer { name } } }'})
+        timing = content['extensions']['timing']
+        self.assertEqual(timing['operation'], 'RecentOrders')
+        self.assertEqual(timing['sqlQueries'], len(queries))
+        self.assertTrue({'parseMs', 'validateMs', 'executeMs'} <= set(timing))
+        self.assertIn('Query.orders', [resolver['field'] for resolver in timing['resolvers']])
+
+        body = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).content.decode()
+        self.assertIn('graphql_operation_phase_seconds_count{operation="RecentOrders",phase="execute"} 1', body)
+        self.assertIn('graphql_operation_sql_queries_bucket{operation="RecentOrders",le="1.0"} 1', body)
+
+    def test_extensions_are_off_by_default(self):
+        content = self.post({'query': '{ orders { totalAmount } }'})
+        self.assertNotIn('timing', content.get('extensions') or {})
+        self.assertIn('operation="anonymous"', registry.render())
+
+    @override_settings(GRAPHQL_METRICS={'SCRAPE_TOKEN': 's3cret'})
+    def test_endpoint_requires_staff_or_the_scrape_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_no_token_allows_staff_only(self):
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer None'})
+        self.assertEqual(response.status_code, 403)
+
+
+class SlowLogTests(GraphQLTestCase):
+    QUERY = """
+        query CustomerOrders($email: String!) {
+          allCustomers(filter: { emailIcontains: $email }) {
+            edges { node { name orders { edges { node { totalAmount } } } } }
+          }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'slow.jsonl'
+        for i in range(3):
+            customer = Customer.objects.create(name=f'Customer {i}', email=f'customer{i}@example.com')
+            Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+
+    def test_logs_slow_operations(self):
+        with override_settings(GRAPHQL_SLOW_LOG={'THRESHOLD_MS': 0, 'PATH': str(self.path), 'RESOLVER_THRESHOLD_MS': 0}):
+            self.post({'query': self.QUERY, 'variables': {'email': 'example.com'}})
+        [entry] = list(read_entries(self.path))
+        self.assertEqual(entry['operation'], 'CustomerOrders')
+        self.assertEqual(entry['variables'], {'email': '[REDACTED]'})
+        self.assertEqual(len(entry['statements']), entry['sql_queries'])
+        self.assertTrue(entry['explain'] and entry['explain'][0]['plan'])
+        self.assertEqual(entry['resolvers'][0]['field'], 'allCustomers')
+
+        out = io.StringIO()
+        call_command('slowlog_report', path=str(self.path), stdout=out)
+        self.assertIn('CustomerOrders', out.getvalue())
+
+    def test_fast_operations_are_not_logged(self):
+        with override_settings(GRAPHQL_SLOW_LOG={'THRESHOLD_MS': 60_000, 'PATH': str(self.path)}):
+            self.post({'query': self.QUERY, 'variables': {'email': 'example.com'}})
+        self.assertFalse(self.path.exists())
+
+
+class OrderReminderTests(GraphQLTestCase):
+    QUERY = """
+        query ($since: DateTime!, $after: String) {
+          pendingOrders(since: $since, first: 2, after: $after) {
+            pageInfo { hasNextPage endCursor }
+            edges { node { id orderDate customerEmail } }
+          }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        now = timezone.now()
+        self.old = Order.objects.create(customer=customer, total_amount=Decimal('1.00'), order_date=now - timedelta(days=30))
+        self.recent = [
+            Order.objects.create(customer=customer, total_amount=Decimal('1.00'), order_date=now - timedelta(hours=i))
+            for i in range(5, 0, -1)
+        ]
+        OrderReminder.objects.create(order=self.recent[0])
+        self.since = (now - timedelta(days=7)).isoformat()
+
+    def test_pending_orders_pages(self):
+        ids, after = [], None
+        while True:
+            with self.assertNumQueries(1):
+                content = self.post({'query': self.QUERY, 'variables': {'since': self.since, 'after': after}})
+            connection = content['data']['pendingOrders']
+            ids += [int(edge['node']['id']) for edge in connection['edges']]
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            after = connection['pageInfo']['endCursor']
+        self.assertEqual(ids, [order.pk for order in self.recent[1:]])
+        self.assertEqual(connection['edges'][0]['node']['customerEmail'], 'alice@example.com')
+
+    def test_send_reminders_is_idempotent(self):
+        sent = []
+        with tempfile.NamedTemporaryFile('r', suffix='.txt') as log:
+            first = send_reminders(page_size=3, workers=2, send=sent.append, log_path=log.name)
+            second = send_reminders(page_size=3, workers=2, send=sent.append, log_path=log.name)
+            lines = log.read().splitlines()
+        self.assertEqual((first.sent, first.pages, second.sent), (4, 2, 0))
+        self.assertEqual(sorted(int(order['id']) for order in sent), [order.pk for order in self.recent[1:]])
+        self.assertEqual(OrderReminder.objects.count(), 5)
+        self.assertEqual(len(lines), 5)
+        self.assertIn('No pending orders', lines[-1])
+
+    def test_failed_sends_stay_pending(self):
+        def send(order):
+            if int(order['id']) == self.recent[1].pk:
+                raise ConnectionError('mail server down')
+
+        with tempfile.NamedTemporaryFile('r', suffix='.txt') as log:
+            result = send_reminders(send=send, log_path=log.name)
+        self.assertEqual((result.sent, result.failed), (3, 1))
+        self.assertFalse(OrderReminder.objects.filter(order=self.recent[1]).exists())
+
+
+class MaintenanceTests(TestCase):
+    def setUp(self):
+        # An app running tasks in this process, without a broker or Redis
+        app = Celery('crm_tests', set_as_current=False)
+        app.conf.update(task_always_eager=True, broker_url='memory://', result_backend='cache+memory://')
+        self.addCleanup(current_app._get_current_object().set_current)
+        app.set_current()
+        get_result_cache().clear()
+
+    def test_lanes_cover_every_chunk(self):
+        products = Product.objects.bulk_create(Product(name=f'P{i}', price=Decimal('1.00'), stock=0) for i in range(10))
+        lanes = plan('restock', chunk_size=3, concurrency=2)
+        self.assertEqual(len(lanes), 2)
+        self.assertEqual(sorted(chunk[0] for lane in lanes for chunk in lane), list(range(products[0].pk, products[-1].pk + 1, 3)))
+
+    def test_restock(self):
+        Product.objects.bulk_create(Product(name=f'P{i}', price=Decimal('1.00'), stock=i) for i in range(10))
+        result = start_maintenance('restock', chunk_size=3, concurrency=2, options={'threshold': 5, 'increment': 100})
+        self.assertEqual(result.get(), {'updated': 5, 'chunks': 2})
+        self.assertFalse(Product.objects.filter(stock__lt=5).exists())
+
+    def test_recompute_order_totals(self):
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'))
+        mouse = Product.objects.create(name='Mouse', price=Decimal('25.00'))
+        right = Order.objects.create(customer=customer, total_amount=Decimal('25.00'))
+        right.products.set([mouse])
+        wrong = Order.objects.create(customer=customer, total_amount=Decimal('1.00'))
+        wrong.products.set([laptop, mouse])
+        CRMReport.rebuild()
+
+        result = start_maintenance('recompute_order_totals', chunk_size=1, concurrency=2)
+        self.assertEqual(result.get(), {'scanned': 2, 'updated': 1, 'chunks': 2})
+        wrong.refresh_from_db()
+        self.assertEqual(wrong.total_amount, Decimal('1024.99'))
+        self.assertEqual(CRMReport.get().total_revenue, Decimal('1049.99'))
+
+    def test_empty_table(self):
+        self.assertIsNone(start_maintenance('restock'))
+        with self.assertRaises(MaintenanceError):
+            plan('vacuum')
+
+
+class SQLiteTuningTests(TestCase):
+    def test_pragmas_are_applied(self):
+        values = current_pragmas(connection, ['busy_timeout', 'synchronous', 'cache_size', 'temp_store'])
+        # synchronous NORMAL is 1, temp_store MEMORY is 2
+        self.assertEqual(values, {'busy_timeout': 5000, 'synchronous': 1, 'cache_size': -64000, 'temp_store': 2})
+
+    def test_rejects_unsafe_pragmas(self):
+        with self.assertRaises(ImproperlyConfigured):
+            pragma_statements({'journal_mode': 'WAL; DROP TABLE crm_order'})
+
+
+class ReadReplicaTests(TransactionTestCase):
+    QUERY = '{ customers { name } }'
+    MUTATION = 'mutation { createCustomer(input: { name: "Carol", email: "carol@example.com" }) { customer { id } } }'
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite file, refreshed by the copy step. It is added
+        # here rather than in settings, so the test runner creates no
+        # test database for it.
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections.settings['default'], 'NAME': str(Path(cls.directory.name) / 'replica.sqlite3'),
+        }
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        get_result_cache().clear()
+        Customer.objects.create(name='Alice', email='alice@example.com')
+        copy_to_replicas(['replica'])
+        Customer.objects.create(name='Bob', email='bob@example.com')
+
+    def names(self, client):
+        response = client.post('/graphql', json.dumps({'query': self.QUERY}), content_type='application/json')
+        return sorted(customer['name'] for customer in response.json()['data']['customers'])
+
+    @override_settings(CRM_DATABASE_ROUTING={'REPLICAS': ['replica']})
+    def test_queries_read_the_replica_until_a_write(self):
+        self.assertEqual(self.names(self.client), ['Alice'])
+
+        response = self.client.post('/graphql', json.dumps({'query': self.MUTATION}), content_type='application/json')
+        self.assertNotIn('errors', response.json())
+        self.assertIn('crm_read_primary', response.cookies)
+        # Read-your-writes for the client that wrote, even once another
+        # client has cached the replica's answer; the others still see the replica
+        self.assertEqual(self.names(Client()), ['Alice'])
+        self.assertEqual(self.names(self.client), ['Alice', 'Bob', 'Carol'])
+        self.assertEqual(self.names(Client()), ['Alice'])
+        self.assertEqual(get_result_cache().info()['hits'], 1)
+
+    def test_without_replicas_everything_reads_the_primary(self):
+        self.assertEqual(self.names(self.client), ['Alice', 'Bob'])
+
+
+class CustomerStatsTests(GraphQLTestCase):
+    ORDER = 'mutation ($c: ID!, $p: [ID!]!) { createOrder(input: { customerId: $c, productIds: $p }) { order { id } } }'
+
+    def setUp(self):
+        super().setUp()
+        self.alice = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('25.00'), stock=5)
+
+    def test_create_order_updates_the_customer(self):
+        self.query(self.ORDER, {'c': self.alice.pk, 'p': [self.laptop.pk, self.mouse.pk]})
+        self.query(self.ORDER, {'c': self.alice.pk, 'p': [self.mouse.pk]})
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.order_count, self.alice.lifetime_value), (2, Decimal('1049.99')))
+        self.assertEqual(self.alice.last_order_at, Order.objects.latest('order_date').order_date)
+        self.assertEqual(Order.objects.get(total_amount=Decimal('1024.99')).products.count(), 2)
+
+    def test_filter_and_order_by_stats(self):
+        self.query(self.ORDER, {'c': self.alice.pk, 'p': [self.laptop.pk]})
+        self.query(self.ORDER, {'c': self.bob.pk, 'p': [self.mouse.pk]})
+        data = self.query('{ allCustomers(filter: { lifetimeValueGte: 100 }) { edges { node { name orderCount } } } }')
+        self.assertEqual(data['allCustomers']['edges'], [{'node': {'name': 'Alice', 'orderCount': 1}}])
+        data = self.query('{ allCustomers(orderBy: "-lifetime_value") { edges { node { name } } } }')
+        self.assertEqual([edge['node']['name'] for edge in data['allCustomers']['edges']], ['Alice', 'Bob'])
+        content = self.post({'query': '{ allCustomers(orderBy: "email") { edges { node { name } } } }'})
+        self.assertIn("Cannot order by 'email'", content['errors'][0]['message'])
+
+    def test_deleting_an_order_updates_the_customer(self):
+        self.query(self.ORDER, {'c': self.alice.pk, 'p': [self.laptop.pk]})
+        self.query(self.ORDER, {'c': self.alice.pk, 'p': [self.mouse.pk]})
+        first, last = Order.objects.order_by('pk')
+        last.delete()
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.order_count, self.alice.lifetime_value), (1, Decimal('999.99')))
+        self.assertEqual(self.alice.last_order_at, first.order_date)
+        Order.objects.filter(customer=self.alice).delete()
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.order_count, self.alice.last_order_at), (0, None))
+
+    def test_customer_cascade_does_not_refresh_its_orders(self):
+        self.query(self.ORDER, {'c': self.alice.pk, 'p': [self.laptop.pk]})
+        with CaptureQueriesContext(connection) as ctx:
+            self.alice.delete()
+        self.assertFalse(any('UPDATE "crm_customer"' in query['sql'] for query in ctx.captured_queries))
+
+    def test_reconcile_repairs_drift(self):
+        self.query(self.ORDER, {'c': self.alice.pk, 'p': [self.laptop.pk]})
+        # Written behind the mutation's back
+        Order.objects.create(customer=self.bob, total_amount=Decimal('5.00'))
+        Customer.objects.filter(pk=self.alice.pk).update(order_count=7)
+        out = io.StringIO()
+        call_command('reconcile_customer_stats', '--chunk-size', '1', stdout=out)
+        self.assertIn('Checked 2 customers, repaired 2.', out.getvalue())
+        stats = dict(Customer.objects.values_list('name', 'order_count'))
+        self.assertEqual(stats, {'Alice': 1, 'Bob': 1})
+        self.assertEqual(Customer.objects.get(pk=self.bob.pk).lifetime_value, Decimal('5.00'))
+
+
+@override_settings(CRM_SALES_ROLLUPS={'SETTLE_SECONDS': 0})
+class SalesRollupTests(GraphQLTestCase):
+    QUERY = """
+        query ($from: Date!, $to: Date!) {
+          salesByDay(from: $from, to: $to) { day orders units revenue }
+          topProducts(from: $from, to: $to, limit: 2) { product { name } units revenue }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('25.00'), stock=5)
+        self.cable = Product.objects.create(name='Cable', price=Decimal('5.00'), stock=5)
+        self.today = timezone.localdate()
+
+    def order(self, days_ago, *products):
+        order = Order.objects.create(
+            customer=self.customer,
+            total_amount=sum(product.price for product in products),
+            order_date=timezone.now() - timedelta(days=days_ago),
+        )
+        order.products.set(products)
+        return order
+
+    def test_rolls_up_only_new_orders(self):
+        self.order(1, self.laptop, self.mouse)
+        self.order(1, self.mouse)
+        first = sales_rollups.roll_up(batch_size=1)
+        self.order(0, self.mouse, self.cable)
+        second = sales_rollups.roll_up()
+        self.assertEqual((first.orders, first.batches, second.orders), (2, 2, 1))
+        self.assertEqual(sales_rollups.roll_up().orders, 0)
+
+        yesterday = DailySales.objects.get(day=self.today - timedelta(days=1))
+        self.assertEqual((yesterday.orders, yesterday.units, yesterday.revenue), (2, 3, Decimal('1049.99')))
+        mouse = dict(DailyProductSales.objects.filter(product=self.mouse).values_list('day', 'units'))
+        self.assertEqual(mouse, {self.today - timedelta(days=1): 2, self.today: 1})
+
+    @override_settings(CRM_SALES_ROLLUPS={'SETTLE_SECONDS': 60})
+    def test_recent_orders_wait_for_the_next_run(self):
+        self.order(0, self.mouse)
+        self.assertEqual(sales_rollups.roll_up().orders, 0)
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_analytics_queries(self):
+        self.order(2, self.laptop)
+        self.order(0, self.mouse, self.cable)
+        self.order(0, self.mouse)
+        call_command('roll_up_sales', stdout=io.StringIO())
+        variables = {'from': str(self.today - timedelta(days=2)), 'to': str(self.today)}
+        with self.assertNumQueries(3):
+            data = self.query(self.QUERY, variables)
+        self.assertEqual([(day['orders'], day['units'], day['revenue']) for day in data['salesByDay']], [
+            (1, 1, '999.99'), (0, 0, '0.00'), (2, 3, '55.00'),
+        ])
+        self.assertEqual(data['topProducts'], [
+            {'product': {'name': 'Laptop'}, 'units': 1, 'revenue': '999.99'},
+            {'product': {'name': 'Mouse'}, 'units': 2, 'revenue': '50.00'},
+        ])
+        content = self.post({'query': self.QUERY, 'variables': {'from': str(self.today), 'to': '2000-01-01'}})
+        self.assertIn("'from' must not be after 'to'", content['errors'][0]['message'])
+
+    def test_rebuild_recomputes_from_orders(self):
+        order = self.order(0, self.laptop)
+        sales_rollups.roll_up()
+        order.products.set([self.cable])
+        Order.objects.filter(pk=order.pk).update(total_amount=Decimal('5.00'))
+        call_command('roll_up_sales', '--rebuild', stdout=io.StringIO())
+        self.assertEqual(DailySales.objects.get().revenue, Decimal('5.00'))
+        self.assertEqual(list(DailyProductSales.objects.values_list('product__name', flat=True)), ['Cable'])
+
+    def sales(self):
+        return dict(DailySales.objects.values_list('day', 'revenue'))
+
+    def test_order_writes_below_the_watermark_mark_days_stale(self):
+        moved = self.order(1, self.laptop)
+        fixed = self.order(0, self.mouse)
+        deleted = self.order(0, self.cable)
+        sales_rollups.roll_up()
+
+        # The importer moves an order to another day
+        records = [{'id': moved.pk, 'customer_id': self.customer.pk, 'product_ids': [self.cable.pk],
+                    'order_date': (timezone.now() - timedelta(days=2)).isoformat()}]
+        import_records('orders', records)
+        # recompute_order_totals repairs a total
+        Order.objects.filter(pk=fixed.pk).update(total_amount=Decimal('1.00'))
+        get_job('recompute_order_totals').run_chunk(fixed.pk, fixed.pk + 1, {})
+        deleted.delete()
+
+        self.assertEqual(sales_rollups.roll_up().days, 3)
+        # Yesterday has no orders left, so no row
+        self.assertEqual(self.sales(), {self.today - timedelta(days=2): Decimal('5.00'), self.today: Decimal('25.00')})
+        self.assertEqual(
+            dict(DailyProductSales.objects.values_list('product__name', 'units')), {'Cable': 1, 'Mouse': 1}
+        )
+
+    def test_seed_clear_resets_the_rollups(self):
+        self.order(0, self.laptop)
+        sales_rollups.roll_up()
+        seed(SeedOptions(customers=2, products=2, orders=3, clear=True, workers=1, days=0))
+        sales_rollups.roll_up()
+        self.assertEqual(sum(self.sales().values()), sum(Order.objects.values_list('total_amount', flat=True)))
+        units = DailyProductSales.objects.aggregate(units=Sum('units'))['units']
+        self.assertEqual(units, Order.products.through.objects.count())
+
+
+class GraphQLClientTests(TestCase):
+    def test_executes_in_process(self):
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+        data = execute_graphql(
+            'query ($since: DateTime!) { orders(filter: { orderDateGte: $since }) { customer { email } } }',
+            {'since': '2000-01-01T00:00:00+00:00'},
+        )
+        self.assertEqual(data, {'orders': [{'customer': {'email': 'alice@example.com'}}]})
+
+    def test_errors_raise(self):
+        with self.assertRaises(GraphQLClientError) as raised:
+            execute_graphql('{ unknownField }')
+        self.assertIn('unknownField', str(raised.exception))
+
+
+class AsyncGraphQLViewTests(TransactionTestCase):
+    # Blocking resolvers run on other threads, which only see committed rows
+    QUERY = """{
+        allOrdersKeyset(first: 5) {
+            totalCount
+            edges { node { totalAmount customer { name } products(name: "Laptop") { edges { node { name } } } } }
+        }
+    }"""
+
+    def setUp(self):
+        get_result_cache().clear()
+
+    async def post(self, path, body):
+        response = await self.async_client.post(path, json.dumps(body), content_type='application/json')
+        return response.json()
+
+    async def test_matches_the_sync_view(self):
+        @sync_to_async
+        def seed():
+            product = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+            for i in range(3):
+                customer = Customer.objects.create(name=f'Customer {i}', email=f'c{i}@example.com')
+                order = Order.objects.create(customer=customer, total_amount=Decimal('999.99'))
+                order.products.add(product)
+        await seed()
+
+        expected = await self.post('/graphql', {'query': self.QUERY})
+        content = await self.post('/graphql/async', {'query': self.QUERY})
+        self.assertNotIn('errors', content)
+        self.assertEqual(content['data'], expected['data'])
+        self.assertEqual(content['data']['allOrdersKeyset']['totalCount'], 3)
+
+    async def test_mutations(self):
+        content = await self.post('/graphql/async', {
+            'query': 'mutation { createCustomer(input: { name: "A", email: "a@example.com" }) { customer { email } } }'
+        })
+        self.assertEqual(content['data']['createCustomer']['customer']['email'], 'a@example.com')
+        self.assertTrue(await Customer.objects.filter(email='a@example.com').aexists())
+
+    async def test_malformed_body_is_a_bad_request(self):
+        for path in ('/graphql', '/graphql/async'):
+            response = await self.async_client.post(path, '{"query": ', content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('errors', response.json())
+
+    def test_data_loader_batches_concurrent_loads(self):
+        batches = []
+
+        def batch_load(keys):
+            batches.append(keys)
+            return [key * 2 for key in keys]
+
+        async def load_all():
+            loader = AsyncDataLoader(batch_load)
+            return await asyncio.gather(*(loader.load(key) for key in (1, 2, 3, 2)))
+
+        self.assertEqual(asyncio.run(load_all()), [2, 4, 6, 4])
+        self.assertEqual(batches, [[1, 2, 3]])
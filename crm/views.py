@@ -1,3 +1,433 @@
-from django.shortcuts import render
+import codecs
+import time
+from functools import wraps
+from inspect import isawaitable
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.crypto import constant_time_compare
+from django.views.generic import View
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.utils.utils import set_rollback
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionContext,
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    validate_schema,
+)
+from graphql_sync_dataloaders import DeferredExecutionContext
+
+from . import db_router
+from .async_execution import ThreadPoolResolverMiddleware, run_sync
+from .document_cache import DocumentCache
+from .export import FORMATS, ExportError, stream_export
+from .imports import ImportDataError, import_records, read_records
+from .loaders import CRMLoaders
+from .metrics import current_metrics, get_config as get_metrics_config, registry, time_execution
+from .persisted_queries import resolve_persisted_query
+from .query_cost import check_query_cost, get_config as get_query_cost_config
+from .result_cache import get_result_cache
+
+# Rejected rows listed in an /import response; the count covers them all
+IMPORT_ERRORS_REPORTED = 1000
+
+# Largest request body /import accepts, unless settings.CRM_IMPORT_MAX_BYTES
+# says otherwise; bigger files go through `manage.py import_data`
+IMPORT_MAX_BYTES = 50 * 1024 * 1024
+
+
+def add_extensions(result, extensions):
+    """
+    Merges `extensions`, or what it returns when it is a callable, into an
+    ExecutionResult or into an awaitable one.
+    """
+    if isawaitable(result):
+        async def await_result():
+            return add_extensions(await result, extensions)
+        return await_result()
+    if callable(extensions):
+        extensions = extensions()
+    result.extensions = {**(result.extensions or {}), **extensions}
+    return result
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    The /graphql endpoint.
+    Runs with the deferred execution context so the DataLoaders in
+    crm.loaders can batch, accepts Apollo automatic persisted queries and
+    reuses parsed and validated documents across requests. Operations over
+    the depth or cost budget in settings.GRAPHQL_QUERY_COST are rejected
+    before they execute.
+    """
+    execution_context_class = DeferredExecutionContext
+    # Shared by every request this view class serves; sized by
+    # settings.GRAPHQL_DOCUMENT_CACHE_SIZE
+    document_cache = DocumentCache()
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        try:
+            query, document = resolve_persisted_query(request, data, query)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        if document is None:
+            if not query:
+                if show_graphiql:
+                    return None
+                raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+            schema = self.schema.graphql_schema
+            schema_validation_errors = validate_schema(schema)
+            if schema_validation_errors:
+                return ExecutionResult(data=None, errors=schema_validation_errors)
+
+            document, errors = self.document_cache.get(
+                schema, query, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS
+            )
+            if errors:
+                return ExecutionResult(data=None, errors=errors)
+
+        return self.execute_document(request, document, variables, operation_name, show_graphiql)
+
+    def execute_document(self, request, document, variables, operation_name, show_graphiql=False):
+        """
+        Executes an already parsed and validated document, mirroring the
+        second half of GraphQLView.execute_graphql_request.
+        """
+        operation_ast = get_operation_ast(document, operation_name)
+        if operation_ast is not None:
+            # Queries may read from a replica, see db_router.py
+            db_router.begin_operation(operation_ast.operation)
+        metrics = current_metrics()
+        operation_metrics = None
+        if metrics is not None:
+            operation_metrics = metrics.begin_operation(
+                operation_name or (operation_ast and operation_ast.name and operation_ast.name.value),
+                document,
+                variables,
+            )
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        schema = self.schema.graphql_schema
+        cost = None
+        if operation_ast is not None:
+            try:
+                cost = check_query_cost(
+                    schema, document, operation_ast, variables, client=request.META.get('REMOTE_ADDR')
+                )
+            except GraphQLError as e:
+                return ExecutionResult(errors=[e])
+
+        result = None
+        result_cache = get_result_cache()
+        cache_key = None
+        if result_cache is not None and operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+            cache_key, _ = result_cache.key(schema, document, variables, operation_name, db_router.read_alias())
+            data = result_cache.get(cache_key)
+            if data is not None:
+                result = ExecutionResult(data=data)
+
+        if result is None:
+            started = time.perf_counter()
+            try:
+                result = self.execute_operation(request, schema, document, operation_ast, variables, operation_name)
+            except Exception as e:
+                return ExecutionResult(errors=[e])
+            result = time_execution(result, started)
+            if cache_key is not None:
+                result = result_cache.store(cache_key, result)
+
+        if cost is not None and get_query_cost_config()['REPORT']:
+            result = add_extensions(result, {'cost': cost})
+        if operation_metrics is not None and get_metrics_config()['EXTENSIONS']:
+            # Built once the result is ready, so the SQL counts are complete
+            result = add_extensions(result, lambda: {'timing': operation_metrics.as_extension()})
+        return result
+
+    def execute_operation(self, request, schema, document, operation_ast, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+            "execution_context_class": self.execution_context_class,
+        }
+
+        if (
+            operation_ast is not None
+            and operation_ast.operation == OperationType.MUTATION
+            and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            )
+        ):
+            with transaction.atomic():
+                result = execute(schema, document, **execute_options)
+                if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                    transaction.set_rollback(True)
+            return result
+        return execute(schema, document, **execute_options)
+
+    def get_response(self, request, data, show_graphiql=False):
+        """
+        GraphQLView.get_response, but also returns the execution result's
+        `extensions` (query cost and the like) to the client.
+        """
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id=None, show_graphiql=False):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    The /graphql endpoint as an async view, for serving under ASGI.
+    Queries execute on the event loop: DataLoaders batch with asyncio and
+    blocking resolvers run on a bounded thread pool (see
+    crm/async_execution.py), so slow requests do not each hold a thread.
+    Mutations run one after another, possibly in a transaction, so they
+    keep the synchronous path on that pool.
+    """
+
+    # GraphQLView.dispatch is synchronous; View.dispatch hands requests to
+    # the async handlers below, which is what makes Django treat this view
+    # as async
+    dispatch = View.dispatch
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            # Inside the try, as in GraphQLView.dispatch: a malformed body
+            # is the client's 400, not a 500
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = [await self.get_response_async(request, entry) for entry in data]
+                result = "[{}]".format(",".join([response[0] for response in responses]))
+                status_code = responses and max(responses, key=lambda response: response[1])[1] or 200
+            else:
+                result, status_code = await self.get_response_async(request, data)
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    post = get
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(request, data, query, variables, operation_name)
+        if isawaitable(execution_result):
+            execution_result = await execution_result
+        return self.format_response(request, execution_result, id)
+
+    def execute_operation(self, request, schema, document, operation_ast, variables, operation_name):
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            request.loaders = CRMLoaders()
+            return run_sync(
+                super().execute_operation, request, schema, document, operation_ast, variables, operation_name
+            )
+
+        request.loaders = CRMLoaders(asynchronous=True)
+        return execute(
+            schema,
+            document,
+            root_value=self.get_root_value(request),
+            context_value=self.get_context(request),
+            variable_values=variables,
+            operation_name=operation_name,
+            # graphql-core wraps resolvers in the first middleware innermost,
+            # so this one sees the schema's own resolvers
+            middleware=[ThreadPoolResolverMiddleware(), *(self.get_middleware(request) or ())],
+            execution_context_class=ExecutionContext,
+        )
+
+
+def staff_required(view):
+    """
+    Refuses requests that are not from an active staff user's session,
+    for the endpoints that read or write whole tables.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user = request.user
+        if not (user.is_authenticated and user.is_active and user.is_staff):
+            return HttpResponseForbidden("Staff login required.")
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@staff_required
+def export_view(request, name):
+    """
+    GET /export/<customers|products|orders>?format=csv|ndjson&gzip=1&<filters>
+    streams the table, filtered by the same arguments as its FilterSet.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    params = request.GET.copy()
+    format = params.pop('format', ['csv'])[0]
+    compress = params.pop('gzip', ['0'])[0].lower() in ('1', 'true', 'yes')
+    try:
+        content = stream_export(name, params, format, compress)
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+
+    filename = f'{name}.{format}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(content, content_type='application/gzip' if compress else FORMATS[format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def limit_size(chunks, max_bytes):
+    """Passes `chunks` through until more than `max_bytes` were read."""
+    read = 0
+    for chunk in chunks:
+        read += len(chunk)
+        if read > max_bytes:
+            raise ImportDataError(f"The upload is larger than {max_bytes} bytes.")
+        yield chunk
+
+
+@staff_required
+def import_view(request, name):
+    """
+    POST /import/<customers|products|orders>?format=csv|ndjson&start=<row>
+    with the file as the request body or as the `file` field of a form.
+    Returns the ImportResult and the rejected rows as JSON. A client
+    resumes an interrupted upload by resending it with `start` set to the
+    last committed row it was told about.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    max_bytes = getattr(settings, 'CRM_IMPORT_MAX_BYTES', IMPORT_MAX_BYTES)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_bytes:
+        return JsonResponse({'error': f"The upload is larger than {max_bytes} bytes."}, status=413)
+    try:
+        start = int(request.GET.get('start', 0))
+    except ValueError:
+        return HttpResponseBadRequest("'start' must be an integer.")
+    format = request.GET.get('format', 'csv')
+    # Uploaded files are read from disk (or memory) a line at a time; a
+    # raw body is read straight from the request stream
+    source = request.FILES['file'] if 'file' in request.FILES else request
+
+    errors = []
+    committed = start
+
+    def on_batch(row):
+        nonlocal committed
+        committed = row
+
+    def on_error(row, record, message):
+        if len(errors) < IMPORT_ERRORS_REPORTED:
+            errors.append({'row': row, 'error': message})
+
+    try:
+        result = import_records(
+            # The header can be missing or wrong, so the bytes read are counted too
+            name, read_records(codecs.iterdecode(limit_size(source, max_bytes), 'utf-8-sig'), format),
+            start=start, on_batch=on_batch, on_error=on_error,
+        )
+    except (ImportDataError, ValueError) as e:
+        return JsonResponse({'error': str(e), 'committedRow': committed}, status=400)
+    return JsonResponse({
+        'rows': result.rows,
+        'written': result.written,
+        'rejected': result.errors,
+        'seconds': round(result.seconds, 3),
+        'rowsPerSecond': round(result.rate, 1),
+        'committedRow': committed,
+        'errors': errors,
+    })
+
+
+def metrics_view(request):
+    """
+    The GraphQL operation histograms of this process, in Prometheus text
+    format, for staff and for scrapers sending GRAPHQL_METRICS['SCRAPE_TOKEN'].
+    """
+    token = get_metrics_config()['SCRAPE_TOKEN']
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return render_metrics(request)
+    return staff_required(render_metrics)(request)
+
+
+def render_metrics(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')